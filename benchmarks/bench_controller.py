@@ -0,0 +1,100 @@
+"""
+AwgCtrl, CaptureCtrl の API のベンチマーク
+"""
+import numpy as np
+from e7awgsw import AwgCtrl, CaptureCtrl, AWG, CaptureUnit, CaptureModule, \
+    DspUnit, DecisionFunc, WaveSequence, CaptureParam
+
+# エミュレータで AWG.U2 の波形をキャプチャするのは CaptureModule.U0 のキャプチャユニット
+AWG_ID = AWG.U2
+CAPTURE_UNITS = [CaptureUnit.U0, CaptureUnit.U1]
+CAPTURE_MODULE = CaptureModule.U0
+NUM_CHUNKS_LIST = [1, 2, 4, 8, 16]
+# 1 チャンクあたりのワード数
+CHUNK_WORDS = 64
+# キャプチャデータの取得で読み出すサンプル数
+NUM_CAPTURE_SAMPLES_LIST = [1024, 16 * 1024]
+
+
+def run(runner, ip_addr):
+    with AwgCtrl(ip_addr) as awg_ctrl, CaptureCtrl(ip_addr) as cap_ctrl:
+        awg_ctrl.initialize(AWG_ID)
+        cap_ctrl.initialize(*CAPTURE_UNITS)
+        bench_set_wave_sequence(runner, awg_ctrl)
+        bench_get_capture_data(runner, awg_ctrl, cap_ctrl)
+
+
+def gen_wave_seq(num_chunks, num_repeats = 1):
+    wave_seq = WaveSequence(num_wait_words = 0, num_repeats = 1)
+    samples = [(i, -i) for i in range(CHUNK_WORDS * WaveSequence.NUM_SAMPLES_IN_AWG_WORD)]
+    for _ in range(num_chunks):
+        wave_seq.add_chunk(samples, num_blank_words = 0, num_repeats = num_repeats)
+    return wave_seq
+
+
+def bench_set_wave_sequence(runner, awg_ctrl):
+    for num_chunks in NUM_CHUNKS_LIST:
+        wave_seq = gen_wave_seq(num_chunks)
+        runner.measure(
+            'controller.set_wave_sequence[{}]'.format(num_chunks),
+            lambda: awg_ctrl.set_wave_sequence(AWG_ID, wave_seq),
+            params = { 'num_chunks' : num_chunks, 'num_samples' : wave_seq.num_all_samples },
+            bytes_per_call = wave_seq.num_all_samples * 4)
+
+
+def capture(awg_ctrl, cap_ctrl, param, num_samples):
+    """num_samples 個以上のサンプルをキャプチャするまで波形の出力とキャプチャを行う"""
+    num_repeats = -(-num_samples // (CHUNK_WORDS * WaveSequence.NUM_SAMPLES_IN_AWG_WORD))
+    wave_seq = gen_wave_seq(1, num_repeats)
+    awg_ctrl.set_wave_sequence(AWG_ID, wave_seq)
+    param.num_integ_sections = 1
+    param.clear_sum_sections()
+    param.add_sum_section(wave_seq.num_all_words, 1)
+    cap_ctrl.construct_capture_module(CAPTURE_MODULE, *CAPTURE_UNITS)
+    cap_ctrl.select_trigger_awg(CAPTURE_MODULE, AWG_ID)
+    cap_ctrl.enable_start_trigger(*CAPTURE_UNITS)
+    for cap_unit_id in CAPTURE_UNITS:
+        cap_ctrl.set_capture_params(cap_unit_id, param)
+    awg_ctrl.clear_awg_stop_flags(AWG_ID)
+    cap_ctrl.clear_capture_stop_flags(*CAPTURE_UNITS)
+    awg_ctrl.start_awgs(AWG_ID)
+    awg_ctrl.wait_for_awgs_to_stop(10, AWG_ID)
+    cap_ctrl.wait_for_capture_units_to_stop(10, *CAPTURE_UNITS)
+    return cap_ctrl.num_captured_samples(CAPTURE_UNITS[0])
+
+
+def bench_get_capture_data(runner, awg_ctrl, cap_ctrl):
+    for num_samples in NUM_CAPTURE_SAMPLES_LIST:
+        names = [
+            'controller.get_capture_data[{}]'.format(num_samples),
+            'controller.get_capture_data_as_ndarray[{}]'.format(num_samples)]
+        if any(map(runner.selected, names)):
+            capture(awg_ctrl, cap_ctrl, CaptureParam(), num_samples)
+            params = { 'num_samples' : num_samples }
+            runner.measure(
+                names[0],
+                lambda: cap_ctrl.get_capture_data(CAPTURE_UNITS[0], num_samples),
+                params = params, bytes_per_call = num_samples * 8, ops_per_call = num_samples)
+            runner.measure(
+                names[1],
+                lambda: cap_ctrl.get_capture_data_as_ndarray(CAPTURE_UNITS[0], num_samples),
+                params = params, bytes_per_call = num_samples * 8, ops_per_call = num_samples)
+
+        names = [
+            'controller.get_classification_results[{}]'.format(num_samples),
+            'controller.get_classification_results_as_ndarray[{}]'.format(num_samples)]
+        if any(map(runner.selected, names)):
+            param = CaptureParam()
+            param.sel_dsp_units_to_enable(DspUnit.CLASSIFICATION)
+            param.set_decision_func_params(DecisionFunc.U0, np.float32(1.0), np.float32(0.0), np.float32(0.0))
+            param.set_decision_func_params(DecisionFunc.U1, np.float32(0.0), np.float32(1.0), np.float32(0.0))
+            capture(awg_ctrl, cap_ctrl, param, num_samples)
+            params = { 'num_results' : num_samples }
+            runner.measure(
+                names[0],
+                lambda: cap_ctrl.get_classification_results(CAPTURE_UNITS[0], num_samples),
+                params = params, bytes_per_call = num_samples // 4, ops_per_call = num_samples)
+            runner.measure(
+                names[1],
+                lambda: cap_ctrl.get_classification_results_as_ndarray(CAPTURE_UNITS[0], num_samples),
+                params = params, bytes_per_call = num_samples // 4, ops_per_call = num_samples)
@@ -0,0 +1,55 @@
+"""
+信号処理のリファレンス実装 (dspmodule.dsp) と波形データのシリアライズのベンチマーク
+"""
+import numpy as np
+from e7awgsw import DspUnit, DecisionFunc, WaveSequence, CaptureParam
+from e7awgsw.dspmodule import dsp
+
+NUM_DSP_WORDS = 1024
+NUM_SERIALIZE_SAMPLES_LIST = [1024, 64 * 1024]
+
+# dsp の計測で有効にする信号処理モジュールの組み合わせ
+DSP_UNIT_SETS = {
+    'none' : [],
+    'fir_decim_window_sum' : [
+        DspUnit.COMPLEX_FIR, DspUnit.DECIMATION, DspUnit.REAL_FIR, DspUnit.COMPLEX_WINDOW, DspUnit.SUM],
+    'all' : [
+        DspUnit.COMPLEX_FIR, DspUnit.DECIMATION, DspUnit.REAL_FIR, DspUnit.COMPLEX_WINDOW,
+        DspUnit.SUM, DspUnit.INTEGRATION, DspUnit.CLASSIFICATION],
+}
+
+
+def run(runner, ip_addr):
+    bench_dsp(runner)
+    bench_wave_data_serialize(runner)
+
+
+def bench_dsp(runner):
+    samples = [(i % 2048, -(i % 2048)) for i in range(NUM_DSP_WORDS * 4)]
+    for set_name, dsp_units in DSP_UNIT_SETS.items():
+        param = CaptureParam()
+        param.num_integ_sections = 1
+        param.add_sum_section(NUM_DSP_WORDS, 1)
+        param.sel_dsp_units_to_enable(*dsp_units)
+        param.set_decision_func_params(DecisionFunc.U0, np.float32(1.0), np.float32(0.0), np.float32(0.0))
+        param.set_decision_func_params(DecisionFunc.U1, np.float32(0.0), np.float32(1.0), np.float32(0.0))
+        runner.measure(
+            'dsp.dsp[{}]'.format(set_name),
+            # dsp は引数のリストを変更することがあるので毎回コピーを渡す
+            lambda: dsp(list(samples), param),
+            params = { 'dsp_units' : [unit.name for unit in dsp_units], 'num_samples' : len(samples) },
+            ops_per_call = len(samples),
+            repeats = 10)
+
+
+def bench_wave_data_serialize(runner):
+    for num_samples in NUM_SERIALIZE_SAMPLES_LIST:
+        wave_seq = WaveSequence(num_wait_words = 0, num_repeats = 1)
+        wave_seq.add_chunk([(i % 2048, -(i % 2048)) for i in range(num_samples)], num_blank_words = 0, num_repeats = 1)
+        wave_data = wave_seq.chunk(0).wave_data
+        runner.measure(
+            'dsp.wave_data.serialize[{}]'.format(num_samples),
+            wave_data.serialize,
+            params = { 'num_samples' : num_samples },
+            bytes_per_call = num_samples * 4,
+            ops_per_call = num_samples)
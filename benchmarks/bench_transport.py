@@ -0,0 +1,62 @@
+"""
+UDP 転送層 (UdpRw, SequencerCmdSender) のベンチマーク
+"""
+from harness import SequencerCmdSink
+from e7awgsw import AWG, AwgStartCmd
+from e7awgsw.uplpacket import UplPacket
+from e7awgsw.udpaccess import UdpRw, SequencerCmdSender
+from e7awgsw.hwparam import WAVE_RAM_PORT
+
+# UdpRw で読み書きするバイト数
+RW_SIZES = [32, 1440, 16 * 1024, 256 * 1024]
+# 読み書きに使う HBM のアドレス
+RW_ADDR = 0x1000_0000
+NUM_SEQUENCER_CMDS_LIST = [1000, 100000]
+
+
+def run(runner, ip_addr):
+    bench_udp_rw(runner, ip_addr)
+    bench_sequencer_cmd_sender(runner, ip_addr)
+
+
+def bench_udp_rw(runner, ip_addr):
+    udp_rw = UdpRw(
+        ip_addr, WAVE_RAM_PORT, 32, UplPacket.MODE_WAVE_RAM_WRITE, UplPacket.MODE_WAVE_RAM_READ)
+    try:
+        for size in RW_SIZES:
+            data = bytes(i & 0xFF for i in range(size))
+            runner.measure(
+                'transport.udp_rw.write[{}]'.format(size),
+                lambda: udp_rw.write(RW_ADDR, data),
+                params = { 'bytes' : size },
+                bytes_per_call = size)
+            runner.measure(
+                'transport.udp_rw.read[{}]'.format(size),
+                lambda: udp_rw.read(RW_ADDR, size),
+                params = { 'bytes' : size },
+                bytes_per_call = size)
+    finally:
+        udp_rw.close()
+
+
+def bench_sequencer_cmd_sender(runner, ip_addr):
+    names = { num_cmds : 'transport.sequencer_cmd_sender.send[{}]'.format(num_cmds)
+              for num_cmds in NUM_SEQUENCER_CMDS_LIST }
+    if not any(runner.selected(name) for name in names.values()):
+        return
+    sink = SequencerCmdSink(ip_addr)
+    sink.start()
+    sender = SequencerCmdSender(*sink.addr)
+    try:
+        for num_cmds, name in names.items():
+            cmds = [AwgStartCmd(i % (AwgStartCmd.MAX_CMD_NO + 1), AWG.U2, i * 16) for i in range(num_cmds)]
+            runner.measure(
+                name,
+                lambda: sender.send(cmds),
+                params = { 'num_cmds' : num_cmds },
+                bytes_per_call = sum(cmd.size() for cmd in cmds),
+                ops_per_call = num_cmds,
+                repeats = 10 if num_cmds > 10000 else None)
+    finally:
+        sender.close()
+        sink.stop()
@@ -0,0 +1,53 @@
+"""
+run_benchmarks.py が出力した 2 つの JSON ファイルの結果を比較します.
+
+| 例 : python benchmarks/compare.py before.json after.json
+| 各ベンチマークの中央値 (p50) の比 (after / before) を表示します.  1 より小さいほど速くなっています.
+"""
+import sys
+import json
+import argparse
+
+
+def load_results(filepath):
+    with open(filepath) as f:
+        report = json.load(f)
+    return { result['name'] : result for result in report['results'] }, report['environment']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--metric', default = 'p50', choices = ['mean', 'min', 'p50', 'p90', 'p99', 'max'])
+    parser.add_argument(
+        '--threshold', type = float, default = None,
+        help = 'exit with 1 if any ratio (after / before) exceeds this value')
+    args = parser.parse_args()
+
+    before, before_env = load_results(args.before)
+    after, after_env = load_results(args.after)
+    print('before : {} ({})'.format(args.before, before_env.get('commit')))
+    print('after  : {} ({})'.format(args.after, after_env.get('commit')))
+    print('{:<48} {:>12} {:>12} {:>8}'.format('name', 'before [us]', 'after [us]', 'ratio'))
+
+    regressions = []
+    for name in sorted(set(before) & set(after)):
+        before_val = before[name]['latency_us'][args.metric]
+        after_val = after[name]['latency_us'][args.metric]
+        ratio = after_val / before_val if before_val > 0 else float('inf')
+        print('{:<48} {:>12.1f} {:>12.1f} {:>8.3f}'.format(name, before_val, after_val, ratio))
+        if (args.threshold is not None) and (ratio > args.threshold):
+            regressions.append(name)
+
+    for name in sorted(set(before) ^ set(after)):
+        print('{:<48} (only in {})'.format(name, 'before' if name in before else 'after'))
+
+    if regressions:
+        print('Regressions : {}'.format(', '.join(regressions)), file = sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+ベンチマークの計測と結果の保存に使う共通の機能
+"""
+import os
+import sys
+import time
+import json
+import socket
+import platform
+import threading
+import subprocess
+import contextlib
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from e7awgsw.uplpacket import UplPacket
+
+
+def percentile(sorted_values, pct):
+    """ソート済みの値のリストから pct パーセンタイルの値を線形補間で求める"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    pos = (len(sorted_values) - 1) * pct / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class BenchRunner(object):
+    """ベンチマークを実行して結果を集めるクラス
+
+    | measure に渡した関数をウォームアップの後 repeats 回実行し, 1 回あたりの所要時間の統計を記録する.
+    """
+
+    def __init__(self, *, warmup = 5, repeats = 50, name_filter = None, quiet = False):
+        """
+        Args:
+            warmup (int): 計測前に関数を実行する回数
+            repeats (int): 計測のために関数を実行する回数
+            name_filter (str): この文字列を名前に含むベンチマークだけを実行する. None の場合は全て実行する.
+            quiet (bool): True の場合, 計測結果を標準出力に表示しない
+        """
+        self.__warmup = warmup
+        self.__repeats = repeats
+        self.__name_filter = name_filter
+        self.__quiet = quiet
+        self.__results = []
+
+
+    def selected(self, name):
+        """name のベンチマークを実行するかどうか"""
+        return (self.__name_filter is None) or (self.__name_filter in name)
+
+
+    def measure(self, name, func, *, params = None, bytes_per_call = None, ops_per_call = 1, repeats = None):
+        """func の実行時間を計測する
+
+        Args:
+            name (str): ベンチマークの名前
+            func (Callable): 計測する関数.  引数を取らない.
+            params (dict): 結果に記録するベンチマークのパラメータ
+            bytes_per_call (int): func 1 回で転送または処理するバイト数.  指定した場合, 帯域を記録する.
+            ops_per_call (int): func 1 回で処理する操作 (コマンドやサンプルなど) の数
+            repeats (int): 計測のために func を実行する回数.  None の場合はコンストラクタで指定した値を使う.
+        """
+        if not self.selected(name):
+            return
+        repeats = self.__repeats if repeats is None else repeats
+        for _ in range(self.__warmup):
+            func()
+
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        total = sum(latencies)
+        result = {
+            'name' : name,
+            'params' : params or {},
+            'repeats' : repeats,
+            'latency_us' : {
+                'mean' : total / repeats * 1e6,
+                'stdev' : (statistics.stdev(latencies) if repeats > 1 else 0.0) * 1e6,
+                'min' : latencies[0] * 1e6,
+                'p50' : percentile(latencies, 50) * 1e6,
+                'p90' : percentile(latencies, 90) * 1e6,
+                'p99' : percentile(latencies, 99) * 1e6,
+                'max' : latencies[-1] * 1e6,
+            },
+            'throughput' : {
+                'calls_per_sec' : repeats / total,
+                'ops_per_sec' : repeats * ops_per_call / total,
+            }
+        }
+        if bytes_per_call is not None:
+            result['throughput']['mbytes_per_sec'] = repeats * bytes_per_call / total / 1e6
+        self.__results.append(result)
+
+        if not self.__quiet:
+            print('{:<48} p50 {:>10.1f} us   p99 {:>10.1f} us   {:>12.1f} ops/s'.format(
+                name, result['latency_us']['p50'], result['latency_us']['p99'],
+                result['throughput']['ops_per_sec']))
+
+
+    @property
+    def results(self):
+        return list(self.__results)
+
+
+    def save(self, filepath):
+        """計測結果を実行環境の情報と共に JSON ファイルに保存する"""
+        report = {
+            'environment' : environment_info(),
+            'config' : { 'warmup' : self.__warmup, 'repeats' : self.__repeats },
+            'results' : self.__results
+        }
+        dirname = os.path.dirname(filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok = True)
+        with open(filepath, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+
+def environment_info():
+    """ベンチマークを実行した環境の情報"""
+    info = {
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'cpu_count' : os.cpu_count(),
+    }
+    try:
+        info['commit'] = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd = REPO_ROOT,
+            stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    return info
+
+
+@contextlib.contextmanager
+def run_emulator(ip_addr):
+    """ip_addr で同梱のエミュレータを起動する"""
+    emulator_dir = os.path.join(REPO_ROOT, 'emulator')
+    if emulator_dir not in sys.path:
+        sys.path.insert(0, emulator_dir)
+    from emulator import Emulator
+    with Emulator(ip_addr) as emulator:
+        yield emulator
+
+
+class SequencerCmdSink(threading.Thread):
+    """シーケンサコマンドの書き込みパケットを受け取って ACK だけを返すスレッド
+
+    | エミュレータはシーケンサを持たないので, SequencerCmdSender の計測ではこのスレッドを送信先にする.
+    """
+
+    def __init__(self, ip_addr):
+        super().__init__(daemon = True)
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.bind((ip_addr, 0))
+        self.__sock.settimeout(0.1)
+        self.__stop_event = threading.Event()
+
+
+    @property
+    def addr(self):
+        return self.__sock.getsockname()
+
+
+    def run(self):
+        while not self.__stop_event.is_set():
+            try:
+                data, addr = self.__sock.recvfrom(16384)
+            except socket.timeout:
+                continue
+            packet = UplPacket.deserialize(data)
+            reply = UplPacket(
+                UplPacket.MODE_SEQUENCER_CMD_WRITE_ACK, packet.addr(), packet.num_bytes())
+            self.__sock.sendto(reply.serialize(), addr)
+
+
+    def stop(self):
+        self.__stop_event.set()
+        self.join()
+        self.__sock.close()
@@ -0,0 +1,70 @@
+"""
+`import e7awgsw` にかかる時間を計測します.
+
+| 計測は毎回新しいインタプリタで行い, 中央値を表示します.
+| import 時に matplotlib が読み込まれた場合や, カレントディレクトリに log ディレクトリが作られた場合,
+| --limit で指定した時間を超えた場合は終了コード 1 で終了します.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# 子プロセスで実行するスクリプト.  import の時間と, import 後に読み込まれているモジュールを出力する.
+MEASURE_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed' : elapsed, 'modules' : sorted(sys.modules)}}))
+"""
+
+# import 時に読み込まれてはならないモジュール
+FORBIDDEN_MODULES = ['matplotlib']
+
+
+def measure_once(module, cwd):
+    env = dict(os.environ)
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [repo_root, env.get('PYTHONPATH')]))
+    result = subprocess.run(
+        [sys.executable, '-c', MEASURE_SCRIPT.format(module = module)],
+        cwd = cwd, env = env, stdout = subprocess.PIPE, check = True, text = True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default = 'e7awgsw')
+    parser.add_argument('--repeats', type = int, default = 10)
+    parser.add_argument('--limit', type = float, default = None, help = 'upper limit of the median (ms)')
+    args = parser.parse_args()
+
+    errors = []
+    elapsed_list = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(args.repeats):
+            result = measure_once(args.module, cwd)
+            elapsed_list.append(result['elapsed'] * 1e3)
+        loaded = [mod for mod in FORBIDDEN_MODULES if mod in result['modules']]
+        if loaded:
+            errors.append('{} imported {} at import time.'.format(args.module, loaded))
+        if os.path.exists(os.path.join(cwd, 'log')):
+            errors.append('{} created a log directory at import time.'.format(args.module))
+
+    median = statistics.median(elapsed_list)
+    print('import {}: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms ({} runs)'.format(
+        args.module, median, min(elapsed_list), max(elapsed_list), len(elapsed_list)))
+    if (args.limit is not None) and (median > args.limit):
+        errors.append('The median import time {:.1f} ms exceeds {:.1f} ms.'.format(median, args.limit))
+
+    for err in errors:
+        print(err, file = sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
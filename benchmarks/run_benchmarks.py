@@ -0,0 +1,51 @@
+"""
+同梱のエミュレータを使って e7awgsw のベンチマークを実行し, 結果を JSON ファイルに保存します.
+
+| 例 : python benchmarks/run_benchmarks.py --output result.json
+"""
+import sys
+import argparse
+from harness import BenchRunner, run_emulator
+import bench_transport
+import bench_controller
+import bench_dsp
+
+# グループ名 -> ベンチマークのモジュール
+BENCH_GROUPS = {
+    'transport' : bench_transport,
+    'controller' : bench_controller,
+    'dsp' : bench_dsp,
+}
+# エミュレータを必要とするグループ
+GROUPS_USING_EMULATOR = ['transport', 'controller']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default = 'benchmark_result.json', help = 'JSON file to write the results')
+    parser.add_argument('--groups', nargs = '+', choices = list(BENCH_GROUPS), default = list(BENCH_GROUPS))
+    parser.add_argument('--filter', default = None, help = 'run only the benchmarks whose names contain this string')
+    parser.add_argument('--warmup', type = int, default = 5)
+    parser.add_argument('--repeats', type = int, default = 50)
+    parser.add_argument('--ipaddr', default = '127.0.0.1', help = 'loopback address for the emulator')
+    parser.add_argument(
+        '--external-emulator', action = 'store_true',
+        help = 'use an emulator already running at --ipaddr instead of starting one')
+    args = parser.parse_args()
+
+    runner = BenchRunner(warmup = args.warmup, repeats = args.repeats, name_filter = args.filter)
+    for group in args.groups:
+        module = BENCH_GROUPS[group]
+        if (group in GROUPS_USING_EMULATOR) and (not args.external_emulator):
+            with run_emulator(args.ipaddr):
+                module.run(runner, args.ipaddr)
+        else:
+            module.run(runner, args.ipaddr)
+
+    runner.save(args.output)
+    print('The results have been written to {}'.format(args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
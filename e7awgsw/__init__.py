@@ -16,6 +16,7 @@ __all__ = [
     'SequencerErr',
     'AwgTimeoutError',
     'CaptureUnitTimeoutError',
+    'CaptureDataOverwrittenError',
     'SinWave',
     'SawtoothWave',
     'SquareWave',
@@ -46,6 +47,13 @@ __all__ = [
     'BranchByFlagCmdErr',
     'AwgStartWithExtTrigAndClsValCmdErr',
     'SequencerCtrl',
+    'SequencerWaitStrategy',
+    'SequencerCmdFeeder',
+    'SequencerCaptureReader',
+    'ShotCapture',
+    'CaptureAddrRing',
+    'SequencerProgram',
+    'InstrumentCollector',
     'plot_graph',
     'plot_samples',
     'dsp']
@@ -57,7 +65,6 @@ from .awgctrl import AwgCtrl
 from .capturectrl import CaptureCtrl
 from .wavesequence import WaveSequence
 from .captureparam import CaptureParam
-from .utiltool import plot_graph, plot_samples
 from .awgwave import SinWave, SawtoothWave, SquareWave, GaussianPulse, IqWave
 from .sequencercmd import \
     SequencerCmd, AwgStartCmd, CaptureEndFenceCmd, WaveSequenceSetCmd, CaptureParamSetCmd, \
@@ -69,6 +76,36 @@ from .sequencercmd import \
     CaptureParamSetCmdErr, CaptureAddrSetCmdErr, FeedbackCalcOnClassificationCmdErr, \
     WaveGenEndFenceCmdErr, ResponsiveFeedbackCmdErr, WaveSequenceSelectionCmdErr, \
     BranchByFlagCmdErr, AwgStartWithExtTrigAndClsValCmdErr
-from .sequencerctrl import SequencerCtrl
-from .exception import AwgTimeoutError, CaptureUnitTimeoutError
-from .dspmodule import dsp
+from .sequencerctrl import SequencerCtrl, SequencerWaitStrategy
+from .sequencercmdfeeder import SequencerCmdFeeder
+from .capturereader import SequencerCaptureReader, ShotCapture
+from .captureaddrring import CaptureAddrRing
+from .sequencerprogram import SequencerProgram
+from .exception import AwgTimeoutError, CaptureUnitTimeoutError, CaptureDataOverwrittenError
+from .instrumentation import InstrumentCollector
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .utiltool import plot_graph, plot_samples
+    from .dspmodule import dsp
+
+# matplotlib を読み込む utiltool と, DSP のリファレンス実装は最初に参照されたときに読み込む
+_LAZY_ATTRS = {
+    'plot_graph' : 'utiltool',
+    'plot_samples' : 'utiltool',
+    'dsp' : 'dspmodule',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+    import importlib
+    attr = getattr(importlib.import_module('.' + module_name, __name__), name)
+    globals()[name] = attr
+    return attr
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -17,6 +17,7 @@ from .udpaccess import AwgRegAccess, WaveRamAccess, ParamRegistryAccess
 from .exception import AwgTimeoutError
 from .logger import get_file_logger, get_null_logger, log_error
 from .lock import ReentrantFileLock
+from .instrumentation import InstrumentCollector
 from .hwdefs import AWG, AwgErr
 
 class AwgCtrlBase(object, metaclass = ABCMeta):
@@ -403,7 +404,8 @@ class AwgCtrl(AwgCtrlBase):
         *,
         validate_args: bool = True,
         enable_lib_log: bool = True,
-        logger: Logger = get_null_logger()
+        logger: Logger = get_null_logger(),
+        instrument: InstrumentCollector | None = None
     ) -> None:
         """
         Args:
@@ -415,16 +417,21 @@ class AwgCtrl(AwgCtrlBase):
                 | True -> ライブラリの標準のログ機能を有効にする.
                 | False -> ライブラリの標準のログ機能を無効にする.
             logger (logging.Logger): ユーザ独自のログ出力に用いる Logger オブジェクト
+            instrument (InstrumentCollector):
+                | UDP アクセスとロックの取得待ちを記録するオブジェクト.
+                | None の場合は記録しない.
         """
         super().__init__(ip_addr, validate_args, enable_lib_log, logger)
-        self.__reg_access = AwgRegAccess(ip_addr, AWG_REG_PORT, *self._loggers)
-        self.__wave_ram_access = WaveRamAccess(ip_addr, WAVE_RAM_PORT, *self._loggers)
-        self.__registry_access = ParamRegistryAccess(ip_addr, WAVE_RAM_PORT, *self._loggers)
+        if instrument is not None:
+            instrument.register_ctrl(self)
+        self.__reg_access = AwgRegAccess(ip_addr, AWG_REG_PORT, *self._loggers, instrument = instrument)
+        self.__wave_ram_access = WaveRamAccess(ip_addr, WAVE_RAM_PORT, *self._loggers, instrument = instrument)
+        self.__registry_access = ParamRegistryAccess(ip_addr, WAVE_RAM_PORT, *self._loggers, instrument = instrument)
         if ip_addr == 'localhost':
             ip_addr = '127.0.0.1'
         filepath = '{}/e7awg_{}.lock'.format(
             self.__get_lock_dir(), socket.inet_ntoa(socket.inet_aton(ip_addr)))
-        self.__flock = ReentrantFileLock(filepath)
+        self.__flock = ReentrantFileLock(filepath, instrument)
 
 
     def __enter__(self) -> Self:
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import threading
+from typing import Final
+from collections.abc import Mapping
+from .hwparam import MAX_CAPTURE_SIZE
+from .hwdefs import CaptureUnit, DspUnit
+from .captureparam import CaptureParam
+from .sequencercmd import CaptureAddrSetCmd
+from .exception import CaptureUnitTimeoutError
+
+
+class CaptureAddrRing(object):
+    """各キャプチャユニットのキャプチャ領域を num_slots 個のスロットに分け, ショットごとに順に使うリングバッファ
+
+    | ショット k のデータは, 各キャプチャユニットのスロット (k % num_slots) に保存する.
+    | スロットの大きさは, キャプチャユニットごとにそのキャプチャパラメータの calc_required_capture_mem_size とする.
+    | ショットごとに addr_set_cmds のコマンドをキャプチャの前に実行させると, 読み出し中のスロットとは別のスロットにキャプチャできる.
+
+    .. code-block:: python
+
+        ring = CaptureAddrRing({ CaptureUnit.U0 : param }, num_slots = 4)
+        cmds = []
+        for shot in range(num_shots):
+            cmds += ring.addr_set_cmds(shot)
+            cmds += [AwgStartCmd(0, AWG.U0, AwgStartCmd.IMMEDIATE, wait = True),
+                     CaptureEndFenceCmd(0, CaptureUnit.U0, 0)]
+        seq_ctrl.push_commands(cmds)
+        reader = seq_ctrl.read_captures_while_running(cap_ctrl, cmds, ring = ring)
+        seq_ctrl.start_sequencer()
+        for result in reader.results(timeout = 5):
+            process(result.data[CaptureUnit.U0])
+
+    | 上の例のように全てのコマンドを先に作る場合, スロットの再利用は読み出しの進み具合と関係なく進む.
+    | 読み出し中のスロットが上書きされた場合は, 読み出し結果を取得するときに CaptureDataOverwrittenError が発生する.
+
+    | 上書きを防ぐには, acquire で次のショットのスロットを確保してからそのショットのコマンドを作るジェネレータを
+    | SequencerCtrl.read_captures_while_running に ring と共に渡し, その戻り値の commands を SequencerCtrl.feed_commands で送る.
+    | 読み出し用のスレッドがショットを読み出し終えるたびに release でスロットを解放し,
+    | 全てのスロットが使用中の場合, acquire はいずれかのスロットが解放されるまで待つので,
+    | 読み出していないデータを後続のショットで上書きすることはない.
+
+    .. code-block:: python
+
+        def gen_cmds():
+            for _ in range(num_shots):
+                shot = ring.acquire()
+                yield from ring.addr_set_cmds(shot)
+                yield AwgStartCmd(0, AWG.U0, AwgStartCmd.IMMEDIATE, wait = True)
+                yield CaptureEndFenceCmd(0, CaptureUnit.U0, 0)
+
+        reader = seq_ctrl.read_captures_while_running(cap_ctrl, gen_cmds(), ring = ring)
+        feeder = seq_ctrl.feed_commands(reader.commands)
+        seq_ctrl.start_sequencer()
+        for result in reader.results(timeout = 5):
+            process(result.data[CaptureUnit.U0])
+    """
+
+    #: スロット数のデフォルト値 (ダブルバッファ)
+    DEFAULT_NUM_SLOTS: Final = 2
+
+    def __init__(
+        self,
+        params: Mapping[CaptureUnit, CaptureParam],
+        *,
+        num_slots: int = DEFAULT_NUM_SLOTS,
+        capacity: int = MAX_CAPTURE_SIZE
+    ) -> None:
+        """
+        Args:
+            params (dict of {CaptureUnit : CaptureParam}): リングバッファを使うキャプチャユニットとそのキャプチャパラメータ
+            num_slots (int): 各キャプチャユニットのキャプチャ領域を分けるスロットの数
+            capacity (int): 各キャプチャユニットのキャプチャ領域のうち, リングバッファに使う大きさ (bytes)
+        """
+        if not params:
+            raise ValueError('No capture units are specified.')
+        for capture_unit_id, param in params.items():
+            if capture_unit_id not in CaptureUnit.all():
+                raise ValueError('Invalid capture unit ID {}'.format(capture_unit_id))
+            if not isinstance(param, CaptureParam):
+                raise ValueError('Invalid capture param {}'.format(param))
+        if not (isinstance(num_slots, int) and num_slots > 0):
+            raise ValueError("'num_slots' must be a positive integer.  '{}' was set.".format(num_slots))
+
+        self.__slot_sizes = {
+            capture_unit_id : param.calc_required_capture_mem_size()
+            for capture_unit_id, param in params.items() }
+        self.__num_samples = {
+            capture_unit_id : param.calc_capture_samples() for capture_unit_id, param in params.items() }
+        self.__classification = {
+            capture_unit_id : DspUnit.CLASSIFICATION in param.dsp_units_enabled
+            for capture_unit_id, param in params.items() }
+        for capture_unit_id, slot_size in self.__slot_sizes.items():
+            if slot_size * num_slots > min(capacity, MAX_CAPTURE_SIZE):
+                raise ValueError(
+                    '{} slots of {} bytes for capture unit {} do not fit in {} bytes.'
+                    .format(num_slots, slot_size, capture_unit_id, min(capacity, MAX_CAPTURE_SIZE)))
+
+        self.__num_slots = num_slots
+        self.__cond = threading.Condition()
+        # 次に acquire で確保するショット
+        self.__next_shot = 0
+        # 解放されていない最も古いショット.  これより前のショットのスロットは全て解放済み.
+        self.__oldest_shot = 0
+        # __oldest_shot より後で解放済みのショット
+        self.__released: set[int] = set()
+
+
+    def acquire(self, timeout: float | None = None) -> int:
+        """次のショットのスロットを確保する
+
+        Args:
+            timeout (int or float):
+                | スロットが空くのを待つ時間 (単位: 秒).  タイムアウトした場合, 例外を発生させる.
+                | None の場合は空くまで待つ.
+
+        Returns:
+            int: 確保したショットの番号 (0 から順に振られる)
+
+        Raises:
+            CaptureUnitTimeoutError: タイムアウトした場合
+        """
+        with self.__cond:
+            if not self.__cond.wait_for(
+                lambda: self.__next_shot - self.__oldest_shot < self.__num_slots, timeout):
+                raise CaptureUnitTimeoutError(
+                    'No capture slot was released within {} seconds.  (shot {})'.format(timeout, self.__next_shot))
+            shot = self.__next_shot
+            self.__next_shot += 1
+            return shot
+
+
+    def release(self, shot: int) -> None:
+        """shot のデータを読み出し終えたので, そのスロットを解放する
+
+        Args:
+            shot (int): acquire で確保したショットの番号
+        """
+        with self.__cond:
+            if not (self.__oldest_shot <= shot < self.__next_shot) or (shot in self.__released):
+                raise ValueError('Shot {} is not in use.'.format(shot))
+            self.__released.add(shot)
+            while self.__oldest_shot in self.__released:
+                self.__released.remove(self.__oldest_shot)
+                self.__oldest_shot += 1
+            self.__cond.notify_all()
+
+
+    def addr_offset(self, capture_unit_id: CaptureUnit, shot: int) -> int:
+        """shot のデータを保存するキャプチャアドレスのオフセットを取得する
+
+        Args:
+            capture_unit_id (CaptureUnit): キャプチャユニット ID
+            shot (int): ショットの番号
+
+        Returns:
+            int: CaptureAddrSetCmd の byte_offset および CaptureCtrl.get_capture_data の addr_offset に指定する値
+        """
+        return (shot % self.__num_slots) * self.__slot_sizes[capture_unit_id]
+
+
+    def region(self, shot: int) -> dict[CaptureUnit, tuple[int, int]]:
+        """shot のデータを読み出す領域を取得する
+
+        Args:
+            shot (int): ショットの番号
+
+        Returns:
+            dict of {CaptureUnit : (int, int)}:
+                | {キャプチャユニット ID : (アドレスオフセット, サンプル数もしくは四値化結果の個数)}.
+                | CaptureCtrl.get_capture_data などの addr_offset と num_samples に渡せる.
+        """
+        return {
+            capture_unit_id : (self.addr_offset(capture_unit_id, shot), self.__num_samples[capture_unit_id])
+            for capture_unit_id in self.__slot_sizes }
+
+
+    def addr_set_cmds(self, shot: int, cmd_no: int = 0) -> list[CaptureAddrSetCmd]:
+        """shot のデータを, そのスロットに保存するための CaptureAddrSetCmd を作る
+
+        | オフセットが同じキャプチャユニットは 1 つのコマンドにまとめる.
+
+        Args:
+            shot (int): ショットの番号
+            cmd_no (int): 作成するコマンドのコマンド番号
+
+        Returns:
+            list of CaptureAddrSetCmd: shot のキャプチャの前にシーケンサに実行させるコマンドのリスト
+        """
+        offset_to_units: dict[int, list[CaptureUnit]] = {}
+        for capture_unit_id in self.__slot_sizes:
+            offset_to_units.setdefault(self.addr_offset(capture_unit_id, shot), []).append(capture_unit_id)
+        return [
+            CaptureAddrSetCmd(cmd_no, capture_unit_id_list, byte_offset)
+            for byte_offset, capture_unit_id_list in offset_to_units.items()]
+
+
+    def is_classification(self, capture_unit_id: CaptureUnit) -> bool:
+        """capture_unit_id のキャプチャパラメータで四値化結果を保存するかどうか"""
+        return self.__classification[capture_unit_id]
+
+
+    @property
+    def capture_unit_id_list(self) -> list[CaptureUnit]:
+        """リングバッファを使うキャプチャユニットのリスト"""
+        return list(self.__slot_sizes)
+
+
+    @property
+    def num_slots(self) -> int:
+        """各キャプチャユニットのスロットの数"""
+        return self.__num_slots
+
+
+    @property
+    def slot_sizes(self) -> dict[CaptureUnit, int]:
+        """{キャプチャユニット ID : スロットの大きさ (bytes)}"""
+        return dict(self.__slot_sizes)
+
+
+    @property
+    def num_samples(self) -> dict[CaptureUnit, int]:
+        """{キャプチャユニット ID : 1 ショットで保存されるサンプル数もしくは四値化結果の個数}"""
+        return dict(self.__num_samples)
+
+
+    @property
+    def num_free_slots(self) -> int:
+        """確保されていないスロットの数"""
+        with self.__cond:
+            return self.__num_slots - (self.__next_shot - self.__oldest_shot)
@@ -3,7 +3,6 @@ from __future__ import annotations
 import numpy as np
 import socket
 import time
-import struct
 import os
 import stat
 from abc import ABCMeta, abstractmethod
@@ -22,6 +21,7 @@ from .captureparam import CaptureParam
 from .exception import CaptureUnitTimeoutError
 from .logger import get_file_logger, get_null_logger, log_error, log_warning
 from .lock import ReentrantFileLock
+from .instrumentation import InstrumentCollector
 from .classification import ClassificationResult
 
 class CaptureCtrlBase(object, metaclass = ABCMeta):
@@ -164,6 +164,64 @@ class CaptureCtrlBase(object, metaclass = ABCMeta):
         return self._get_classification_results(capture_unit_id, num_results, addr_offset)
 
 
+    def get_capture_data_as_ndarray(
+        self,
+        capture_unit_id: CaptureUnit,
+        num_samples: int,
+        addr_offset: int = 0
+    ) -> np.ndarray:
+        """引数で指定したキャプチャユニットが保存したサンプルデータを NumPy 配列として取得する.
+
+        Args:
+            capture_unit_id (CaptureUnit): この ID のキャプチャユニットが保存したサンプルデータを取得する
+            num_samples (int): 取得するサンプル数 (I と Q はまとめて 1 サンプル)
+            addr_offset (int): 取得するサンプルデータのバイトアドレスオフセット
+
+        Returns:
+            numpy.ndarray:
+                | 形状が (num_samples, 2) の float32 の配列.
+                | [:, 0] が I データで [:, 1] が Q データ.
+        """
+        if self._validate_args:
+            try:
+                self._validate_capture_unit_id(capture_unit_id)
+                self._validate_num_capture_samples(num_samples)
+                self._validate_addr_offset(addr_offset)
+            except Exception as e:
+                log_error(e, *self._loggers)
+                raise
+
+        return self._get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+
+
+    def get_classification_results_as_ndarray(
+        self,
+        capture_unit_id: CaptureUnit,
+        num_results: int,
+        addr_offset: int = 0
+    ) -> np.ndarray:
+        """引数で指定したキャプチャユニットが保存した四値化結果を NumPy 配列として取得する.
+
+        Args:
+            capture_unit_id (CaptureUnit): この ID のキャプチャユニットが保存した四値化結果を取得する
+            num_results (int): 取得する四値化結果の個数
+            addr_offset (int): 取得する四値化結果のバイトアドレスオフセット
+
+        Returns:
+            numpy.ndarray: 要素数が num_results の uint8 の配列. 各要素は 0 ～ 3 の整数.
+        """
+        if self._validate_args:
+            try:
+                self._validate_capture_unit_id(capture_unit_id)
+                self._validate_num_classification_results(num_results)
+                self._validate_addr_offset(addr_offset)
+            except Exception as e:
+                log_error(e, *self._loggers)
+                raise
+
+        return self._get_classification_results_as_ndarray(capture_unit_id, num_results, addr_offset)
+
+
     def num_captured_samples(self, capture_unit_id: CaptureUnit) -> int:
         """引数で指定したキャプチャユニットが保存したサンプル数もしくは, 四値化結果の個数を取得する. (I データと Q データはまとめて 1 サンプル)
         
@@ -528,6 +586,18 @@ class CaptureCtrlBase(object, metaclass = ABCMeta):
     ) -> Sequence[int]:
         pass
 
+    @abstractmethod
+    def _get_capture_data_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
+    ) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def _get_classification_results_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
+    ) -> np.ndarray:
+        pass
+
     @abstractmethod
     def _num_captured_samples(self, capture_unit_id: CaptureUnit) -> int:
         pass
@@ -622,7 +692,9 @@ class CaptureCtrl(CaptureCtrlBase):
         *,
         validate_args: bool = True,
         enable_lib_log: bool = True,
-        logger: Logger = get_null_logger()):
+        logger: Logger = get_null_logger(),
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         """
         Args:
             ip_addr (string): キャプチャユニット制御モジュールに割り当てられた IP アドレス (例 '10.0.0.16')
@@ -633,16 +705,21 @@ class CaptureCtrl(CaptureCtrlBase):
                 | True -> ライブラリの標準のログ機能を有効にする.
                 | False -> ライブラリの標準のログ機能を無効にする.
             logger (logging.Logger): ユーザ独自のログ出力に用いる Logger オブジェクト
+            instrument (InstrumentCollector):
+                | UDP アクセスとロックの取得待ちを記録するオブジェクト.
+                | None の場合は記録しない.
         """
         super().__init__(ip_addr, validate_args, enable_lib_log, logger)
-        self.__reg_access = CaptureRegAccess(ip_addr, CAPTURE_REG_PORT, *self._loggers)
-        self.__wave_ram_access = WaveRamAccess(ip_addr, WAVE_RAM_PORT, *self._loggers)
-        self.__registry_access = ParamRegistryAccess(ip_addr, WAVE_RAM_PORT, *self._loggers)
+        if instrument is not None:
+            instrument.register_ctrl(self)
+        self.__reg_access = CaptureRegAccess(ip_addr, CAPTURE_REG_PORT, *self._loggers, instrument = instrument)
+        self.__wave_ram_access = WaveRamAccess(ip_addr, WAVE_RAM_PORT, *self._loggers, instrument = instrument)
+        self.__registry_access = ParamRegistryAccess(ip_addr, WAVE_RAM_PORT, *self._loggers, instrument = instrument)
         if ip_addr == 'localhost':
             ip_addr = '127.0.0.1'
         filepath = '{}/e7capture_{}.lock'.format(
             self.__get_lock_dir(), socket.inet_ntoa(socket.inet_aton(ip_addr)))
-        self.__flock = ReentrantFileLock(filepath)
+        self.__flock = ReentrantFileLock(filepath, instrument)
 
 
     def __enter__(self) -> Self:
@@ -846,27 +923,47 @@ class CaptureCtrl(CaptureCtrlBase):
     def _get_capture_data(
         self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
     ) -> list[tuple[float, float]]:
+        samples = self._get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+        return list(map(tuple, samples.tolist()))
+
+
+    def _get_capture_data_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
+    ) -> np.ndarray:
         num_bytes = num_samples * CAPTURED_SAMPLE_SIZE
         num_bytes = (num_bytes + CAPTURE_RAM_WORD_SIZE - 1) // CAPTURE_RAM_WORD_SIZE
         num_bytes *= CAPTURE_RAM_WORD_SIZE
         rd_addr = self.__CAPTURE_ADDR[capture_unit_id] + addr_offset
         rd_data = self.__wave_ram_access.read(rd_addr, num_bytes)
-        part_size = CAPTURED_SAMPLE_SIZE // 2
-        raw_samples = [rd_data[i : i + part_size] for i in range(0, num_bytes, part_size)]
-        samples: list[float] = [struct.unpack('<f', sample)[0] for sample in raw_samples]
-        samples = samples[0:num_samples * 2]
-        return list(zip(samples[0::2], samples[1::2]))
+        samples = np.frombuffer(rd_data, dtype = '<f4', count = num_samples * 2)
+        return samples.reshape(num_samples, 2)
 
 
     def _get_classification_results(
         self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
     ) -> Sequence[int]:
+        rd_data = self.__read_classification_results(capture_unit_id, num_results, addr_offset)
+        return ClassificationResult(rd_data, num_results)
+
+
+    def _get_classification_results_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
+    ) -> np.ndarray:
+        rd_data = self.__read_classification_results(capture_unit_id, num_results, addr_offset)
+        packed = np.frombuffer(rd_data, dtype = np.uint8)
+        # 1 バイトに 4 つの四値化結果が下位ビットから順に 2 ビットずつ格納されている
+        results = (packed[:, np.newaxis] >> np.array([0, 2, 4, 6], dtype = np.uint8)) & 0x3
+        return results.reshape(-1)[:num_results]
+
+
+    def __read_classification_results(
+        self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
+    ) -> bytes:
         num_bytes = (num_results * CLASSIFICATION_RESULT_SIZE + 7) // 8
         num_bytes = (num_bytes + CAPTURE_RAM_WORD_SIZE - 1) // CAPTURE_RAM_WORD_SIZE
         num_bytes *= CAPTURE_RAM_WORD_SIZE
         rd_addr = self.__CAPTURE_ADDR[capture_unit_id] + addr_offset
-        rd_data = self.__wave_ram_access.read(rd_addr, num_bytes)
-        return ClassificationResult(rd_data, num_results)
+        return self.__wave_ram_access.read(rd_addr, num_bytes)
 
 
     def _num_captured_samples(self, capture_unit_id: CaptureUnit) -> int:
@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+import time
+import queue
+import threading
+import numpy as np
+from typing import Final, NamedTuple, TYPE_CHECKING
+from collections.abc import Sequence, Mapping, Iterable, Iterator
+from logging import Logger
+from .logger import log_error
+from .hwdefs import CaptureUnit
+from .sequencercmd import SequencerCmd, CaptureAddrSetCmd, CaptureEndFenceCmd, BranchByFlagCmd
+from .sequencerprogram import SequencerProgram
+from .exception import SequencerTimeoutError, CaptureDataOverwrittenError
+
+if TYPE_CHECKING:
+    from .sequencerctrl import SequencerCtrlBase
+    from .capturectrl import CaptureCtrlBase
+    from .captureaddrring import CaptureAddrRing
+
+
+class ShotCapture(NamedTuple):
+    """1 つの CaptureEndFenceCmd で完了を確認したキャプチャの読み出し結果"""
+    #: ショット番号 (コマンド列の中の何番目の CaptureEndFenceCmd か.  0 始まり.)
+    shot: int
+    #: このショットの完了を確認した CaptureEndFenceCmd のコマンド番号.  pop_cmd_err_reports の結果と照合するのに使う.
+    fence_cmd_no: int
+    #: {キャプチャユニット ID : 読み出したデータ}.  データは CaptureCtrl.get_capture_data_as_ndarray
+    #: もしくは CaptureCtrl.get_classification_results_as_ndarray の戻り値と同じ形式.
+    data: dict[CaptureUnit, np.ndarray]
+
+
+class _ShotRegion(NamedTuple):
+    # このショットのデータが確定するコマンドカウンタの増分
+    num_cmds: int
+    fence_cmd_no: int
+    # {キャプチャユニット ID : キャプチャアドレスのオフセット}
+    addr_offsets: dict[CaptureUnit, int]
+
+
+class _ShotTracker(object):
+    """コマンド列を先頭から 1 つずつ調べて, 各ショットの読み出し領域と, その領域が上書きされ始める位置を求める
+
+    | ショット k の領域は, CaptureEndFenceCmd より後で, k のいずれかのキャプチャユニットのオフセットが
+    | k と同じ値になっている状態で実行される最初のコマンド (CaptureAddrSetCmd を除く) から上書きされる可能性がある.
+    | コマンドカウンタの増分がその位置以上になった後に読み出したデータは, 上書きされている可能性がある.
+    """
+
+    def __init__(self) -> None:
+        self.shots: list[_ShotRegion] = []
+        # ショット k の領域が上書きされ始めるコマンドの位置.  まだ見つかっていなければ None.
+        self.reuse_points: list[int | None] = []
+        self.__addr_offsets = { capture_unit_id : 0 for capture_unit_id in CaptureUnit.all() }
+        # (キャプチャユニット ID, オフセット) -> その領域が再び使われるのを待っているショット
+        self.__waiting: dict[tuple[CaptureUnit, int], list[int]] = {}
+        # 最後に調べた後で, オフセットが変わったかショットが増えたかどうか
+        self.__dirty = False
+
+
+    def add_addr_set(self, capture_unit_id_list: list[CaptureUnit], byte_offset: int) -> None:
+        """CaptureAddrSetCmd を追加する"""
+        for capture_unit_id in capture_unit_id_list:
+            self.__addr_offsets[capture_unit_id] = byte_offset
+        self.__dirty = True
+
+
+    def add_fence(self, index: int, cmd_no: int, capture_unit_id_list: list[CaptureUnit]) -> None:
+        """コマンド列の index 番目の CaptureEndFenceCmd を追加する"""
+        self.add_other(index)
+        shot = len(self.shots)
+        addr_offsets = {
+            capture_unit_id : self.__addr_offsets[capture_unit_id] for capture_unit_id in capture_unit_id_list }
+        self.shots.append(_ShotRegion(index + 1, cmd_no, addr_offsets))
+        self.reuse_points.append(None)
+        for key in addr_offsets.items():
+            self.__waiting.setdefault(key, []).append(shot)
+        self.__dirty = True
+
+
+    def add_other(self, index: int) -> None:
+        """コマンド列の index 番目の CaptureAddrSetCmd 以外のコマンドを追加する"""
+        if not self.__dirty:
+            return
+        for key in self.__addr_offsets.items():
+            for shot in self.__waiting.pop(key, ()):
+                if self.reuse_points[shot] is None:
+                    self.reuse_points[shot] = index
+        self.__dirty = False
+
+
+class _TrackedCmds(object):
+    """シーケンサに送るコマンドを 1 つずつ _ShotTracker に登録しながら返すイテレータ"""
+
+    def __init__(self, reader: SequencerCaptureReader, cmds: Iterable[SequencerCmd]) -> None:
+        self.__reader = reader
+        self.__cmds = iter(cmds)
+
+
+    def __iter__(self) -> _TrackedCmds:
+        return self
+
+
+    def __next__(self) -> SequencerCmd:
+        return self.__reader._track(self.__cmds)
+
+
+    def may_block(self) -> bool:
+        """次のコマンドを取り出すときに, スロットが解放されるのを待つ可能性があるかどうか
+
+        | SequencerCmdFeeder は, この値が True のとき, 取り出し済みのコマンドを先にコマンドキューに追加する.
+        """
+        return self.__reader._may_block()
+
+
+class SequencerCaptureReader(threading.Thread):
+    """シーケンサの実行中に, 完了したショットのキャプチャデータを順に読み出すスレッド
+
+    | コマンド列の CaptureEndFenceCmd 1 つを 1 ショットとし, シーケンサのコマンドカウンタがその CaptureEndFenceCmd を
+    | 通過したら, 対象のキャプチャユニットのデータを読み出す.
+    | 読み出すアドレスは, その CaptureEndFenceCmd より前に実行される最後の CaptureAddrSetCmd で各キャプチャユニットに設定したオフセットとする.
+    | CaptureAddrSetCmd が無いキャプチャユニットのオフセットは 0 とする.
+    | ショットのデータを読み出し終えたときに, 後続のコマンドがそのデータの領域にキャプチャし始めていた場合は,
+    | CaptureDataOverwrittenError を発生させて読み出しを止める.
+    | コマンドカウンタが実行したコマンドの数と一致しなくなるので, BranchByFlagCmd を含むコマンド列は扱えない.
+    | コマンド列にジェネレータなどのシーケンスでないイテラブルを渡した場合は, commands が返すイテレータを
+    | SequencerCtrl.feed_commands に渡すこと.  そのイテレータから取り出されたコマンドを順にショットとして登録する.
+    | このとき ring を指定すると, 各ショットを読み出し終えるたびに ring.release でそのショットのスロットを解放する.
+    | このオブジェクトは SequencerCtrl.read_captures_while_running で作る.
+    """
+
+    #: コマンドカウンタを確認する間隔の最小値 (sec)
+    MIN_POLL_INTERVAL: Final = 1e-4
+    #: コマンドカウンタを確認する間隔の最大値 (sec)
+    MAX_POLL_INTERVAL: Final = 0.01
+
+    def __init__(
+        self,
+        seq_ctrl: SequencerCtrlBase,
+        cap_ctrl: CaptureCtrlBase,
+        cmds: Iterable[SequencerCmd] | SequencerProgram,
+        num_samples: Mapping[CaptureUnit, int],
+        classification_results: Mapping[CaptureUnit, bool],
+        ring: CaptureAddrRing | None,
+        *loggers: Logger
+    ) -> None:
+        super().__init__(daemon = True)
+        self.__seq_ctrl = seq_ctrl
+        self.__cap_ctrl = cap_ctrl
+        self.__num_samples = dict(num_samples)
+        self.__classification_results = dict(classification_results)
+        self.__ring = ring
+        self.__loggers = loggers
+        # コマンド列をイテレータから取り出しながらショットを登録するかどうか
+        self.__tracked = not isinstance(cmds, (Sequence, SequencerProgram))
+        if self.__tracked:
+            self.__tracker = _ShotTracker()
+            self.__commands: _TrackedCmds | None = _TrackedCmds(self, cmds)
+            self.__num_tracked_cmds = 0
+            self.__last_tracked_cmd: SequencerCmd | None = None
+            self.__cmds_exhausted = False
+        else:
+            self.__tracker = self.__find_shots(cmds)
+            self.__commands = None
+            self.__cmds_exhausted = True
+            for shot in self.__tracker.shots:
+                self.__check_num_samples(shot)
+        self.__shots = self.__tracker.shots
+        self.__reuse_points = self.__tracker.reuse_points
+        # シーケンサをスタートする前にコマンドカウンタの基準値を読んでおく
+        self.__first_cmd_counter = self.__seq_ctrl._cmd_counter()
+        self.__results: queue.Queue[ShotCapture | None] = queue.Queue()
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__exception: BaseException | None = None
+        self.__num_read_shots = 0
+        self.__num_taken_shots = 0
+
+
+    @classmethod
+    def __find_shots(cls, cmds: Sequence[SequencerCmd] | SequencerProgram) -> _ShotTracker:
+        """コマンド列から, 各ショットの CaptureEndFenceCmd の位置と読み出すキャプチャアドレスを求める"""
+        tracker = _ShotTracker()
+        if not isinstance(cmds, SequencerProgram):
+            for i, cmd in enumerate(cmds):
+                if isinstance(cmd, CaptureAddrSetCmd):
+                    tracker.add_addr_set(cmd.capture_unit_id_list, cmd.byte_offset)
+                elif isinstance(cmd, CaptureEndFenceCmd):
+                    tracker.add_fence(i, cmd.cmd_no, cmd.capture_unit_id_list)
+                elif isinstance(cmd, BranchByFlagCmd):
+                    raise ValueError('Command lists containing BranchByFlagCmd are not supported.')
+                else:
+                    tracker.add_other(i)
+            return tracker
+
+        cmd_ids = cmds.cmd_ids
+        if np.any(cmd_ids == BranchByFlagCmd.ID):
+            raise ValueError('Command lists containing BranchByFlagCmd are not supported.')
+        cmd_nos = cmds.records['cmd_no']
+        # CaptureAddrSetCmd の byte_offset は時刻と同じ位置にある
+        unit_bits = cmds.timed_records['unit_bits']
+        byte_offsets = cmds.timed_records['time']
+        # CaptureAddrSetCmd でも CaptureEndFenceCmd でもないコマンドは, 各区間の最初の 1 つだけ調べればよい
+        others = np.flatnonzero((cmd_ids != CaptureAddrSetCmd.ID) & (cmd_ids != CaptureEndFenceCmd.ID))
+        next_pos = 0
+        for i in np.flatnonzero((cmd_ids == CaptureAddrSetCmd.ID) | (cmd_ids == CaptureEndFenceCmd.ID)).tolist():
+            j = int(np.searchsorted(others, next_pos))
+            if (j < len(others)) and (others[j] < i):
+                tracker.add_other(int(others[j]))
+            capture_unit_id_list = cls.__to_unit_list(int(unit_bits[i]))
+            if cmd_ids[i] == CaptureAddrSetCmd.ID:
+                tracker.add_addr_set(capture_unit_id_list, int(byte_offsets[i]))
+            else:
+                tracker.add_fence(i, int(cmd_nos[i]), capture_unit_id_list)
+            next_pos = i + 1
+        j = int(np.searchsorted(others, next_pos))
+        if j < len(others):
+            tracker.add_other(int(others[j]))
+        return tracker
+
+
+    @classmethod
+    def __to_unit_list(cls, bits: int) -> list[CaptureUnit]:
+        return [capture_unit_id for capture_unit_id in CaptureUnit.all() if bits & (1 << capture_unit_id)]
+
+
+    def __check_num_samples(self, shot: _ShotRegion) -> None:
+        for capture_unit_id in shot.addr_offsets:
+            if capture_unit_id not in self.__num_samples:
+                raise ValueError(
+                    'The number of samples to read from capture unit {} is not specified.'.format(capture_unit_id))
+
+
+    def _track(self, cmds: Iterator[SequencerCmd]) -> SequencerCmd:
+        """cmds から次のコマンドを取り出して, ショットの登録に反映する"""
+        try:
+            cmd = next(cmds)
+            with self.__lock:
+                index = self.__num_tracked_cmds
+                if isinstance(cmd, CaptureAddrSetCmd):
+                    self.__tracker.add_addr_set(cmd.capture_unit_id_list, cmd.byte_offset)
+                elif isinstance(cmd, CaptureEndFenceCmd):
+                    self.__tracker.add_fence(index, cmd.cmd_no, cmd.capture_unit_id_list)
+                    self.__check_num_samples(self.__shots[-1])
+                elif isinstance(cmd, BranchByFlagCmd):
+                    raise ValueError('Command lists containing BranchByFlagCmd are not supported.')
+                else:
+                    self.__tracker.add_other(index)
+                self.__num_tracked_cmds += 1
+                self.__last_tracked_cmd = cmd
+            return cmd
+        except BaseException:
+            # コマンドが尽きたか送信できなくなったので, 登録済みのショットを読み出したら終わる
+            with self.__lock:
+                self.__cmds_exhausted = True
+            raise
+
+
+    def _may_block(self) -> bool:
+        # ショットの区切りでスロットが空いていなければ, 次のショットのコマンドを作るときに acquire で待つ
+        return (self.__ring is not None) and \
+               isinstance(self.__last_tracked_cmd, CaptureEndFenceCmd) and \
+               (self.__ring.num_free_slots == 0)
+
+
+    def run(self) -> None:
+        try:
+            self.__read_shots()
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            self.__exception = e
+        finally:
+            # get で待っているスレッドを起こす
+            self.__results.put(None)
+
+
+    def __read_shots(self) -> None:
+        interval = self.MIN_POLL_INTERVAL
+        next_shot = 0
+        while not self.__stop_event.is_set():
+            with self.__lock:
+                num_shots = len(self.__shots)
+                cmds_exhausted = self.__cmds_exhausted
+            if next_shot >= num_shots:
+                if cmds_exhausted:
+                    break
+                # 次のショットのコマンドが送られるのを待つ
+                if self.__stop_event.wait(interval):
+                    break
+                interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+                continue
+
+            num_executed_cmds = self.__seq_ctrl._cmd_counter() - self.__first_cmd_counter
+            if num_executed_cmds < self.__shots[next_shot].num_cmds:
+                # シーケンサが進んでいなければ, 確認する間隔を延ばす
+                if self.__stop_event.wait(interval):
+                    break
+                interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+                continue
+
+            interval = self.MIN_POLL_INTERVAL
+            while (next_shot < num_shots) and \
+                  (num_executed_cmds >= self.__shots[next_shot].num_cmds) and \
+                  (not self.__stop_event.is_set()):
+                result = self.__read_shot(next_shot)
+                with self.__lock:
+                    reuse_point = self.__reuse_points[next_shot]
+                if reuse_point is not None:
+                    num_executed_cmds = self.__seq_ctrl._cmd_counter() - self.__first_cmd_counter
+                    if num_executed_cmds >= reuse_point:
+                        raise CaptureDataOverwrittenError(
+                            'The capture data of shot {} may have been overwritten by the following commands '
+                            'while it was being read.  ({} commands executed, overwritten from command {})'
+                            .format(next_shot, num_executed_cmds, reuse_point))
+                self.__results.put(result)
+                if self.__tracked and (self.__ring is not None):
+                    self.__ring.release(next_shot)
+                next_shot += 1
+                with self.__lock:
+                    self.__num_read_shots = next_shot
+
+
+    def __read_shot(self, shot: int) -> ShotCapture:
+        region = self.__shots[shot]
+        data = {}
+        for capture_unit_id, addr_offset in region.addr_offsets.items():
+            num_samples = self.__num_samples[capture_unit_id]
+            if self.__classification_results.get(capture_unit_id, False):
+                data[capture_unit_id] = self.__cap_ctrl._get_classification_results_as_ndarray(
+                    capture_unit_id, num_samples, addr_offset)
+            else:
+                data[capture_unit_id] = self.__cap_ctrl._get_capture_data_as_ndarray(
+                    capture_unit_id, num_samples, addr_offset)
+        return ShotCapture(shot, region.fence_cmd_no, data)
+
+
+    def get(self, timeout: float) -> ShotCapture | None:
+        """次のショットの読み出し結果を取得する
+
+        Args:
+            timeout (int or float): タイムアウト値 (単位: 秒). タイムアウトした場合, 例外を発生させる.
+
+        Returns:
+            ShotCapture: 次のショットの読み出し結果.  全てのショットを取得し終えた場合や stop で止めた場合は None.
+
+        Raises:
+            SequencerTimeoutError: タイムアウトした場合
+            CaptureDataOverwrittenError: 読み出し中のショットのデータが後続のコマンドで上書きされた可能性がある場合
+            Exception: キャプチャデータの読み出し中に発生した例外
+        """
+        with self.__lock:
+            if self.__cmds_exhausted and (self.__num_taken_shots >= len(self.__shots)):
+                return None
+        try:
+            result = self.__results.get(timeout = timeout)
+        except queue.Empty:
+            msg = 'Capture readout timed out'
+            log_error(msg, *self.__loggers)
+            raise SequencerTimeoutError(msg)
+
+        if result is None:
+            # 後から get を呼んだスレッドも起こせるように戻しておく
+            self.__results.put(None)
+            if self.__exception is not None:
+                raise self.__exception
+            return None
+
+        with self.__lock:
+            self.__num_taken_shots += 1
+        return result
+
+
+    def results(self, timeout: float) -> Iterator[ShotCapture]:
+        """ショットの読み出し結果を順に返すイテレータ
+
+        Args:
+            timeout (int or float): 1 ショット分の結果を待つ時間 (単位: 秒). タイムアウトした場合, 例外を発生させる.
+        """
+        while True:
+            result = self.get(timeout)
+            if result is None:
+                return
+            yield result
+
+
+    def stop(self) -> None:
+        """キャプチャデータの読み出しを止める"""
+        self.__stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+    @property
+    def commands(self) -> Iterator[SequencerCmd] | None:
+        """SequencerCtrl.feed_commands に渡すイテレータ.  コマンド列にシーケンスを渡した場合は None."""
+        return self.__commands
+
+
+    @property
+    def num_shots(self) -> int:
+        """コマンド列に含まれるショット (CaptureEndFenceCmd) の数.  commands を使う場合は, これまでに取り出されたショットの数."""
+        with self.__lock:
+            return len(self.__shots)
+
+
+    @property
+    def num_read_shots(self) -> int:
+        """キャプチャデータを読み出し終えたショットの数"""
+        with self.__lock:
+            return self.__num_read_shots
+
+
+    @property
+    def exception(self) -> BaseException | None:
+        """キャプチャデータの読み出し中に発生した例外.  発生していない場合は None."""
+        return self.__exception
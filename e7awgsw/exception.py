@@ -10,3 +10,6 @@ class TooLittleFreeSpaceInCmdFifoError(Exception):
 
 class SequencerTimeoutError(Exception):
     pass
+
+class CaptureDataOverwrittenError(Exception):
+    pass
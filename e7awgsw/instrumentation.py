@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import sys
+import threading
+import weakref
+from collections import deque
+from typing import NamedTuple, Any, Final
+from .uplpacket import UplPacket
+
+# UPL パケットのモード ID -> モード名
+_MODE_NAMES: Final = {
+    val : name[len('MODE_'):]
+    for name, val in vars(UplPacket).items() if name.startswith('MODE_')
+}
+
+
+class AccessRecord(NamedTuple):
+    """UDP による 1 回の読み書き (要求パケットの送信から応答パケットの受信まで) の記録"""
+    #: 操作を呼び出したコントローラのメソッド名 (例 'AwgCtrl.set_wave_sequence').  不明な場合は None.
+    method: str | None
+    #: 要求パケットのモード ID
+    mode: int
+    #: 要求パケットのアドレス
+    addr: int
+    #: 要求パケットで読み書きしたバイト数
+    num_bytes: int
+    #: 要求パケットの送信から応答パケットの受信までの時間 (単位 : 秒)
+    rtt: float
+    #: 再送回数
+    retries: int
+
+    @property
+    def mode_name(self) -> str:
+        return _MODE_NAMES.get(self.mode, hex(self.mode))
+
+
+class LockWaitRecord(NamedTuple):
+    """ReentrantFileLock の取得待ちの記録"""
+    #: ロックを取得したコントローラのメソッド名.  不明な場合は None.
+    method: str | None
+    #: ロックの取得にかかった時間 (単位 : 秒)
+    wait: float
+
+
+class InstrumentCollector(object):
+    """コントローラが行った UDP アクセスとロックの取得待ちを記録するクラス
+
+    | コントローラのコンストラクタの instrument 引数にこのオブジェクトを渡すと, 計測が有効になる.
+    | 1 つのオブジェクトを複数のコントローラで共有してもよい.
+    | 記録を逐次処理したい場合は, このクラスを継承して record_access, record_lock_wait をオーバーライドする.
+    | UDP アクセスとロックの取得待ちの記録は, それぞれ最大 max_records 個まで保持する.  max_records 個に達した後は,
+    | 古い記録から捨てて, 捨てた数を num_dropped_access_records, num_dropped_lock_wait_records に数える.
+
+    .. code-block:: python
+
+        collector = InstrumentCollector()
+        with AwgCtrl(IP_ADDR, instrument = collector) as awg_ctrl:
+            awg_ctrl.set_wave_sequence(AWG.U15, wave_seq)
+        print(collector.report())
+    """
+
+    #: 保持する記録の最大数のデフォルト値
+    MAX_RECORDS: Final = 1 << 20
+
+    def __init__(self, max_records: int | None = None) -> None:
+        """
+        Args:
+            max_records (int): UDP アクセスとロックの取得待ちの記録を, それぞれ保持する最大数.  None の場合は MAX_RECORDS.
+        """
+        self.__max_records = self.MAX_RECORDS if max_records is None else max_records
+        if (not isinstance(self.__max_records, int)) or (self.__max_records <= 0):
+            raise ValueError(
+                "'max_records' must be a positive integer.  '{}' was set.".format(max_records))
+        self.__access_records: deque[AccessRecord] = deque(maxlen = self.__max_records)
+        self.__lock_wait_records: deque[LockWaitRecord] = deque(maxlen = self.__max_records)
+        self.__num_dropped_access_records = 0
+        self.__num_dropped_lock_wait_records = 0
+        # id(コントローラ) -> コントローラへの弱参照
+        self.__ctrls: dict[int, weakref.ref] = {}
+        self.__lock = threading.Lock()
+
+
+    def register_ctrl(self, ctrl: Any) -> None:
+        """記録を ctrl のメソッドに対応付けられるように ctrl を登録する.  コントローラが呼ぶ."""
+        with self.__lock:
+            self.__ctrls[id(ctrl)] = weakref.ref(ctrl)
+
+
+    def __find_method(self) -> str | None:
+        """呼び出し元をたどって, 登録されたコントローラの最も外側の公開メソッドの名前を探す"""
+        method = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            code = frame.f_code
+            if (code.co_argcount > 0) and (not code.co_name.startswith('_')):
+                obj = frame.f_locals.get(code.co_varnames[0])
+                ref = self.__ctrls.get(id(obj))
+                if (ref is not None) and (ref() is obj):
+                    method = '{}.{}'.format(type(obj).__name__, code.co_name)
+            frame = frame.f_back
+        return method
+
+
+    def record_access(self, mode: int, addr: int, num_bytes: int, rtt: float, retries: int) -> None:
+        """UDP による 1 回の読み書きを記録する.  UdpRw が呼ぶ."""
+        record = AccessRecord(self.__find_method(), mode, addr, num_bytes, rtt, retries)
+        with self.__lock:
+            if len(self.__access_records) == self.__max_records:
+                self.__num_dropped_access_records += 1
+            self.__access_records.append(record)
+
+
+    def record_lock_wait(self, wait: float) -> None:
+        """ReentrantFileLock の取得待ち時間を記録する.  ReentrantFileLock が呼ぶ."""
+        record = LockWaitRecord(self.__find_method(), wait)
+        with self.__lock:
+            if len(self.__lock_wait_records) == self.__max_records:
+                self.__num_dropped_lock_wait_records += 1
+            self.__lock_wait_records.append(record)
+
+
+    @property
+    def access_records(self) -> list[AccessRecord]:
+        """記録した UDP アクセスのリスト"""
+        with self.__lock:
+            return list(self.__access_records)
+
+
+    @property
+    def lock_wait_records(self) -> list[LockWaitRecord]:
+        """記録したロックの取得待ちのリスト"""
+        with self.__lock:
+            return list(self.__lock_wait_records)
+
+
+    @property
+    def num_dropped_access_records(self) -> int:
+        """保持できる数を超えたために捨てた UDP アクセスの記録の数"""
+        with self.__lock:
+            return self.__num_dropped_access_records
+
+
+    @property
+    def num_dropped_lock_wait_records(self) -> int:
+        """保持できる数を超えたために捨てたロックの取得待ちの記録の数"""
+        with self.__lock:
+            return self.__num_dropped_lock_wait_records
+
+
+    def clear(self) -> None:
+        """記録と捨てた記録の数を全て消去する"""
+        with self.__lock:
+            self.__access_records.clear()
+            self.__lock_wait_records.clear()
+            self.__num_dropped_access_records = 0
+            self.__num_dropped_lock_wait_records = 0
+
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """コントローラのメソッドごとの集計結果
+
+        Returns:
+            | {メソッド名 : 集計結果}
+            | 集計結果は次のキーを持つ dict.
+            |   'accesses' : UDP アクセスの回数
+            |   'bytes' : UDP アクセスで読み書きしたバイト数
+            |   'retries' : 再送回数の合計
+            |   'modes' : {モード名 : アクセス回数}
+            |   'rtt' : RTT の統計 (summarize_latencies の戻り値)
+            |   'lock_wait' : ロック取得待ち時間の統計 (summarize_latencies の戻り値)
+        """
+        access_records = self.access_records
+        lock_wait_records = self.lock_wait_records
+        rtts: dict[str, list[float]] = {}
+        waits: dict[str, list[float]] = {}
+        result: dict[str, dict[str, Any]] = {}
+        for record in access_records:
+            method = str(record.method)
+            stats = result.setdefault(method, self.__new_stats())
+            stats['accesses'] += 1
+            stats['bytes'] += record.num_bytes
+            stats['retries'] += record.retries
+            stats['modes'][record.mode_name] = stats['modes'].get(record.mode_name, 0) + 1
+            rtts.setdefault(method, []).append(record.rtt)
+        for lock_record in lock_wait_records:
+            method = str(lock_record.method)
+            result.setdefault(method, self.__new_stats())
+            waits.setdefault(method, []).append(lock_record.wait)
+
+        for method, stats in result.items():
+            stats['rtt'] = summarize_latencies(rtts.get(method, []))
+            stats['lock_wait'] = summarize_latencies(waits.get(method, []))
+        return result
+
+
+    def __new_stats(self) -> dict[str, Any]:
+        return { 'accesses' : 0, 'bytes' : 0, 'retries' : 0, 'modes' : {} }
+
+
+    def report(self) -> str:
+        """summary の結果を表形式の文字列にする"""
+        lines = []
+        num_dropped_access_records = self.num_dropped_access_records
+        num_dropped_lock_wait_records = self.num_dropped_lock_wait_records
+        if (num_dropped_access_records > 0) or (num_dropped_lock_wait_records > 0):
+            lines.append('dropped records : accesses {},  lock waits {}'.format(
+                num_dropped_access_records, num_dropped_lock_wait_records))
+        for method, stats in sorted(self.summary().items()):
+            rtt = stats['rtt']
+            lock_wait = stats['lock_wait']
+            lines.append(method)
+            lines.append('  accesses : {},  bytes : {},  retries : {},  modes : {}'.format(
+                stats['accesses'], stats['bytes'], stats['retries'], stats['modes']))
+            if rtt['count'] > 0:
+                lines.append('  rtt [us] : mean {:.1f},  p50 {:.1f},  p99 {:.1f},  max {:.1f}'.format(
+                    rtt['mean'] * 1e6, rtt['p50'] * 1e6, rtt['p99'] * 1e6, rtt['max'] * 1e6))
+                lines.append('  rtt histogram : ' + format_histogram(rtt['histogram']))
+            if lock_wait['count'] > 0:
+                lines.append('  lock wait [us] : count {},  total {:.1f},  max {:.1f}'.format(
+                    lock_wait['count'], lock_wait['total'] * 1e6, lock_wait['max'] * 1e6))
+                lines.append('  lock wait histogram : ' + format_histogram(lock_wait['histogram']))
+        return '\n'.join(lines)
+
+
+def summarize_latencies(latencies: list[float]) -> dict[str, Any]:
+    """時間のリストの統計を求める
+
+    Args:
+        latencies (list of float): 時間のリスト (単位 : 秒)
+
+    Returns:
+        | 次のキーを持つ dict
+        |   'count', 'total', 'mean', 'p50', 'p99', 'max' : 件数と統計値 (単位 : 秒)
+        |   'histogram' : {ビンの上限 (単位 : マイクロ秒) : 件数}.  ビンの上限は 2 のべき乗.
+    """
+    if not latencies:
+        return { 'count' : 0, 'total' : 0.0, 'mean' : 0.0, 'p50' : 0.0, 'p99' : 0.0, 'max' : 0.0, 'histogram' : {} }
+    values = sorted(latencies)
+    histogram: dict[int, int] = {}
+    for val in values:
+        upper = 1
+        while upper < val * 1e6:
+            upper *= 2
+        histogram[upper] = histogram.get(upper, 0) + 1
+    total = sum(values)
+    return {
+        'count' : len(values),
+        'total' : total,
+        'mean' : total / len(values),
+        'p50' : values[(len(values) - 1) // 2],
+        'p99' : values[(len(values) - 1) * 99 // 100],
+        'max' : values[-1],
+        'histogram' : histogram
+    }
+
+
+def format_histogram(histogram: dict[int, int]) -> str:
+    return ',  '.join('<={}us: {}'.format(upper, count) for upper, count in sorted(histogram.items()))
@@ -2,8 +2,10 @@
 __all__ = [
     'RemoteAwgCtrl',
     'RemoteCaptureCtrl',
-    'RemoteSequencerCtrl']
+    'RemoteSequencerCtrl',
+    'RemoteShot']
 
 from .remoteawgctrl import RemoteAwgCtrl
 from .remotecapturectrl import RemoteCaptureCtrl
-from .remotesequencerctrl import RemoteSequencerCtrl
\ No newline at end of file
+from .remotesequencerctrl import RemoteSequencerCtrl
+from .remoteshot import RemoteShot
\ No newline at end of file
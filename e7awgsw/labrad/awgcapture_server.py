@@ -1,37 +1,109 @@
 import pickle
 import threading
+import numpy as np
 from concurrent import futures
 from labrad.server import ThreadedServer, setting  # type: ignore
 from labrad import util  # type: ignore
 from e7awgsw import AwgCtrl, CaptureCtrl, SequencerCtrl
+from e7awgsw.labrad.binarycodec import encode_ndarray, decode_wave_sequence
+from e7awgsw.labrad.ctrlpool import CtrlPool
+from e7awgsw.labrad.devicescheduler import DeviceScheduler
 
 class AwgCaptureServer(ThreadedServer):
 
     name = 'Awg Capture Server'
 
+    # run_shot で呼び出しを許可するコントローラのメソッド
+    __SHOT_METHODS = {
+        'awg' : frozenset([
+            'set_wave_sequence', 'register_wave_sequences', 'initialize', 'start_awgs',
+            'terminate_awgs', 'reset_awgs', 'clear_awg_stop_flags', 'wait_for_awgs_to_stop',
+            'set_wave_startable_block_timing', 'get_wave_startable_block_timing', 'check_err']),
+        'capture' : frozenset([
+            'set_capture_params', 'register_capture_params', 'initialize', 'get_capture_data',
+            'get_capture_data_as_ndarray', 'get_classification_results',
+            'get_classification_results_as_ndarray', 'num_captured_samples',
+            'start_capture_units', 'reset_capture_units', 'clear_capture_stop_flags',
+            'select_trigger_awg', 'enable_start_trigger', 'disable_start_trigger',
+            'wait_for_capture_units_to_stop', 'wait_for_capture_units_idle', 'check_err',
+            'construct_capture_module']),
+        'sequencer' : frozenset([
+            'initialize', 'push_commands', 'start_sequencer', 'terminate_sequencer',
+            'clear_unprocessed_commands', 'clear_commands', 'clear_unsent_cmd_err_reports',
+            'clear_sequencer_stop_flag', 'enable_cmd_err_report', 'disable_cmd_err_report',
+            'wait_for_sequencer_to_stop', 'num_unprocessed_commands', 'num_successful_commands',
+            'num_err_commands', 'num_unsent_cmd_err_reports', 'cmd_fifo_free_space', 'check_err',
+            'pop_cmd_err_reports', 'get_branch_flag', 'set_branch_flag'])
+    }
+
+    # LabRAD の要求を受け付けるスレッドの数.
+    # デバイスを操作する処理は DeviceScheduler のワーカーで行うので, ここでは要求の完了を待つだけである.
+    __NUM_DISPATCH_THREADS = 64
+
     def __init__(self):
-        pool = futures.ThreadPoolExecutor(max_workers=16)
+        pool = futures.ThreadPoolExecutor(max_workers=self.__NUM_DISPATCH_THREADS)
         super().__init__(pool)
+        self.__scheduler = DeviceScheduler()
         self.__awgctrls = {}
         self.__capturectrls = {}
         self.__sequencerctrls = {}
+        # 同じデバイスに対する AWG とキャプチャのコントローラは, ハンドルが異なっても 1 つを共有する.
+        # SequencerCtrl はコマンドエラーレポートの受信キューなどクライアントごとの状態を持つので, ハンドルごとに作る.
+        self.__awgctrl_pool = CtrlPool(lambda ipaddr: AwgCtrl(ipaddr, validate_args = False))
+        self.__capturectrl_pool = CtrlPool(lambda ipaddr: CaptureCtrl(ipaddr, validate_args = False))
+        self.__handle_to_ipaddr = {}
         self.__handle = 1
         self.__lock = threading.RLock()
 
 
-    def __get_awgctrl(self, handle):
+    def stopServer(self):
+        self.__scheduler.shutdown()
+        self.__awgctrl_pool.close_all()
+        self.__capturectrl_pool.close_all()
+        with self.__lock:
+            for ctrl in self.__sequencerctrls.values():
+                ctrl.close()
+            self.__sequencerctrls.clear()
+        return super().stopServer()
+
+
+    def __get_awgctrl(self, c, handle):
         with self.__lock:
-            return self.__awgctrls[handle]
+            ctrl = self.__awgctrls[handle]
+            ipaddr = self.__handle_to_ipaddr[handle]
+        return self.__scheduler.bind(ctrl, ipaddr, self.__client_of(c), 'awg.')
 
 
-    def __get_capturectrl(self, handle):
+    def __get_capturectrl(self, c, handle):
         with self.__lock:
-            return self.__capturectrls[handle]
+            ctrl = self.__capturectrls[handle]
+            ipaddr = self.__handle_to_ipaddr[handle]
+        return self.__scheduler.bind(ctrl, ipaddr, self.__client_of(c), 'capture.')
 
 
-    def __get_sequencerctrl(self, handle):
+    def __get_sequencerctrl(self, c, handle):
         with self.__lock:
-            return self.__sequencerctrls[handle]
+            ctrl = self.__sequencerctrls[handle]
+            ipaddr = self.__handle_to_ipaddr[handle]
+        return self.__scheduler.bind(ctrl, ipaddr, self.__client_of(c), 'sequencer.')
+
+
+    def __client_of(self, c):
+        """要求を出したクライアントの識別子.  コンテキスト ID の上位はクライアントの接続 ID."""
+        return c.ID[0]
+
+
+    def __get_shot_method(self, c, kind, handle, method):
+        """run_shot の 1 ステップで呼び出すコントローラのメソッドを取得する"""
+        if method not in self.__SHOT_METHODS.get(kind, ()):
+            raise ValueError("'{}' cannot be called in a shot.  ({})".format(method, kind))
+        if kind == 'awg':
+            ctrl = self.__get_awgctrl(c, handle)
+        elif kind == 'capture':
+            ctrl = self.__get_capturectrl(c, handle)
+        else:
+            ctrl = self.__get_sequencerctrl(c, handle)
+        return getattr(ctrl, method)
 
 
     @setting(100, returns='y')
@@ -39,7 +111,8 @@ class AwgCaptureServer(ThreadedServer):
         try:
             with self.__lock:
                 handle = str(self.__handle)
-                self.__awgctrls[handle] = AwgCtrl(ipaddr, validate_args = False)
+                self.__awgctrls[handle] = self.__awgctrl_pool.acquire(ipaddr)
+                self.__handle_to_ipaddr[handle] = ipaddr
                 self.__handle += 1
             return pickle.dumps(str(handle))
         except Exception as e:
@@ -50,8 +123,8 @@ class AwgCaptureServer(ThreadedServer):
     def discard_awgctrl(self, c, handle):
         try:
             with self.__lock:
-                ctrl = self.__awgctrls.pop(handle)
-                ctrl.close()
+                self.__awgctrls.pop(handle)
+                self.__awgctrl_pool.release(self.__handle_to_ipaddr.pop(handle))
             return pickle.dumps(None)
         except Exception as e:
             return pickle.dumps(e)
@@ -61,7 +134,7 @@ class AwgCaptureServer(ThreadedServer):
     def set_wave_sequence(self, c, handle, awg_id, wave_seq):
         try:
             wave_seq = pickle.loads(wave_seq)
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.set_wave_sequence(awg_id, wave_seq)
             return pickle.dumps(None)
         except Exception as e:
@@ -71,7 +144,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(103, handle='s', awg_id_list='*w', returns='y')
     def initialize_awgs(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.initialize(*awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -81,7 +154,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(104, handle='s', awg_id_list='*w', returns='y')
     def start_awgs(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.start_awgs(*awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -91,7 +164,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(105, handle='s', awg_id_list='*w', returns='y')
     def terminate_awgs(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.terminate_awgs(*awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -101,7 +174,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(106, handle='s', awg_id_list='*w', returns='y')
     def reset_awgs(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.reset_awgs(*awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -112,7 +185,7 @@ class AwgCaptureServer(ThreadedServer):
     def wait_for_awgs_to_stop(self, c, handle, timeout, awg_id_list):
         try:
             timeout = pickle.loads(timeout)
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.wait_for_awgs_to_stop(timeout, *awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -123,7 +196,7 @@ class AwgCaptureServer(ThreadedServer):
     def set_wave_startable_block_timing(self, c, handle, interval, awg_id_list):
         try:
             interval = pickle.loads(interval)
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.set_wave_startable_block_timing(interval, *awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -133,7 +206,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(109, handle='s', awg_id_list='*w', returns='y')
     def get_wave_startable_block_timing(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awg_id_to_interval = awgctrl.get_wave_startable_block_timing(*awg_id_list)
             return pickle.dumps(awg_id_to_interval)
         except Exception as e:
@@ -143,7 +216,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(110, handle='s', awg_id_list='*w', returns='y')
     def check_awg_err(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awg_id_to_err_list = awgctrl.check_err(*awg_id_list)
             return pickle.dumps(awg_id_to_err_list)
         except Exception as e:
@@ -153,7 +226,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(111, handle='s', returns='y')
     def awg_version(self, c, handle):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             version = awgctrl.version()
             return pickle.dumps(version)
         except Exception as e:
@@ -163,7 +236,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(112, handle='s', awg_id_list='*w', returns='y')
     def clear_awg_stop_flags(self, c, handle, awg_id_list):
         try:
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.clear_awg_stop_flags(*awg_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -174,19 +247,31 @@ class AwgCaptureServer(ThreadedServer):
     def register_wave_sequences(self, c, handle, awg_id, key_to_wave_seq):
         try:
             key_to_wave_seq = pickle.loads(key_to_wave_seq)
-            awgctrl = self.__get_awgctrl(handle)
+            awgctrl = self.__get_awgctrl(c, handle)
             awgctrl.register_wave_sequences(awg_id, key_to_wave_seq)
             return pickle.dumps(None)
         except Exception as e:
             return pickle.dumps(e)
         
 
+    @setting(114, handle='s', awg_id='w', wave_seq='y', returns='y')
+    def set_wave_sequence_binary(self, c, handle, awg_id, wave_seq):
+        try:
+            wave_seq = decode_wave_sequence(wave_seq)
+            awgctrl = self.__get_awgctrl(c, handle)
+            awgctrl.set_wave_sequence(awg_id, wave_seq)
+            return pickle.dumps(None)
+        except Exception as e:
+            return pickle.dumps(e)
+        
+
     @setting(200, returns='y')
     def create_capturectrl(self, c, ipaddr):
         try:
             with self.__lock:
                 handle = str(self.__handle)
-                self.__capturectrls[handle] = CaptureCtrl(ipaddr, validate_args = False)
+                self.__capturectrls[handle] = self.__capturectrl_pool.acquire(ipaddr)
+                self.__handle_to_ipaddr[handle] = ipaddr
                 self.__handle += 1
             return pickle.dumps(str(handle))
         except Exception as e:
@@ -197,8 +282,8 @@ class AwgCaptureServer(ThreadedServer):
     def discard_capturectrl(self, c, handle):
         try:
             with self.__lock:
-                ctrl = self.__capturectrls.pop(handle)
-                ctrl.close()
+                self.__capturectrls.pop(handle)
+                self.__capturectrl_pool.release(self.__handle_to_ipaddr.pop(handle))
             return pickle.dumps(None)
         except Exception as e:
             return pickle.dumps(e)
@@ -208,7 +293,7 @@ class AwgCaptureServer(ThreadedServer):
     def set_capture_params(self, c, handle, capture_unit_id, param):
         try:
             param = pickle.loads(param)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.set_capture_params(capture_unit_id, param)
             return pickle.dumps(None)
         except Exception as e:
@@ -218,7 +303,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(203, handle='s', capture_unit_id_list='*w', returns='y')
     def initialize_capture_units(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.initialize(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -230,7 +315,7 @@ class AwgCaptureServer(ThreadedServer):
         try:
             num_samples = pickle.loads(num_samples)
             addr_offset = pickle.loads(addr_offset)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             cap_data = capturectrl.get_capture_data(capture_unit_id, num_samples, addr_offset)
             return pickle.dumps(cap_data)
         except Exception as e:
@@ -240,7 +325,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(205, handle='s', capture_unit_id='w', returns='y')
     def num_captured_samples(self, c, handle, capture_unit_id):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             num_samples = capturectrl.num_captured_samples(capture_unit_id)
             return pickle.dumps(num_samples)
         except Exception as e:
@@ -250,7 +335,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(206, handle='s', capture_unit_id_list='*w', returns='y')
     def start_capture_units(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.start_capture_units(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -260,7 +345,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(207, handle='s', capture_unit_id_list='*w', returns='y')
     def reset_capture_units(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.reset_capture_units(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -271,7 +356,7 @@ class AwgCaptureServer(ThreadedServer):
     def select_trigger_awg(self, c, handle, capture_module_id, awg_id):
         try:
             awg_id = pickle.loads(awg_id) # None の可能性があるので bytes で受ける
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.select_trigger_awg(capture_module_id, awg_id)
             return pickle.dumps(None)
         except Exception as e:
@@ -281,7 +366,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(209, handle='s', capture_unit_id_list='*w', returns='y')
     def enable_start_trigger(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.enable_start_trigger(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -291,7 +376,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(210, handle='s', capture_unit_id_list='*w', returns='y')
     def disable_start_trigger(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.disable_start_trigger(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -302,7 +387,7 @@ class AwgCaptureServer(ThreadedServer):
     def wait_for_capture_units_to_stop(self, c, handle, timeout, capture_unit_id_list):
         try:
             timeout = pickle.loads(timeout)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.wait_for_capture_units_to_stop(timeout, *capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -312,7 +397,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(212, handle='s', capture_unit_id_list='*w', returns='y')
     def check_capture_unit_err(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             cap_unit_id_to_err_list = capturectrl.check_err(*capture_unit_id_list)
             return pickle.dumps(cap_unit_id_to_err_list)
         except Exception as e:
@@ -322,7 +407,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(213, handle='s', returns='y')
     def capture_unit_version(self, c, handle):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             version = capturectrl.version()
             return pickle.dumps(version)
         except Exception as e:
@@ -334,7 +419,7 @@ class AwgCaptureServer(ThreadedServer):
         try:
             num_samples = pickle.loads(num_samples)
             addr_offset = pickle.loads(addr_offset)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             cap_data = capturectrl.get_classification_results(capture_unit_id, num_samples, addr_offset)
             return pickle.dumps(cap_data)
         except Exception as e:
@@ -344,7 +429,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(215, handle='s', capture_unit_id_list='*w', returns='y')
     def clear_capture_stop_flags(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.clear_capture_stop_flags(*capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -356,7 +441,7 @@ class AwgCaptureServer(ThreadedServer):
         try:
             key = pickle.loads(key)
             param = pickle.loads(param)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.register_capture_params(key, param)
             return pickle.dumps(None)
         except Exception as e:
@@ -367,7 +452,7 @@ class AwgCaptureServer(ThreadedServer):
     def wait_for_capture_units_idle(self, c, handle, timeout, capture_unit_id_list):
         try:
             timeout = pickle.loads(timeout)
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.wait_for_capture_units_idle(timeout, *capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -377,7 +462,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(218, handle='s', capture_module_id='w', capture_unit_id_list='*w', returns='y')
     def construct_capture_module(self, c, handle, capture_module_id, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             capturectrl.construct_capture_module(capture_module_id, *capture_unit_id_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -387,7 +472,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(219, handle='s', returns='y')
     def get_unit_to_module(self, c, handle):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             unit_to_mod = capturectrl.get_unit_to_module()
             return pickle.dumps(unit_to_mod)
         except Exception as e:
@@ -397,7 +482,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(220, handle='s', returns='y')
     def get_module_to_units(self, c, handle):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             mod_to_units = capturectrl.get_module_to_units()
             return pickle.dumps(mod_to_units)
         except Exception as e:
@@ -407,7 +492,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(221, handle='s', returns='y')
     def get_module_to_trigger(self, c, handle):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             mod_to_trig = capturectrl.get_module_to_trigger()
             return pickle.dumps(mod_to_trig)
         except Exception as e:
@@ -417,7 +502,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(222, handle='s', returns='y')
     def get_trigger_to_modules(self, c, handle):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             trig_to_mods = capturectrl.get_trigger_to_modules()
             return pickle.dumps(trig_to_mods)
         except Exception as e:
@@ -427,13 +512,85 @@ class AwgCaptureServer(ThreadedServer):
     @setting(223, handle='s', capture_unit_id_list='*w', returns='y')
     def get_capture_stop_flags(self, c, handle, capture_unit_id_list):
         try:
-            capturectrl = self.__get_capturectrl(handle)
+            capturectrl = self.__get_capturectrl(c, handle)
             flags = capturectrl._get_capture_stop_flags(*capture_unit_id_list)
             return pickle.dumps(flags)
         except Exception as e:
             return pickle.dumps(e)
 
 
+    @setting(224, handle='s', capture_unit_id='w', num_samples='y', addr_offset='y', returns='y')
+    def get_capture_data_binary(self, c, handle, capture_unit_id, num_samples, addr_offset):
+        try:
+            num_samples = pickle.loads(num_samples)
+            addr_offset = pickle.loads(addr_offset)
+            capturectrl = self.__get_capturectrl(c, handle)
+            cap_data = capturectrl.get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+            return pickle.dumps(encode_ndarray(cap_data))
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(225, handle='s', capture_unit_id='w', num_samples='y', addr_offset='y', returns='y')
+    def get_classification_results_binary(self, c, handle, capture_unit_id, num_samples, addr_offset):
+        try:
+            num_samples = pickle.loads(num_samples)
+            addr_offset = pickle.loads(addr_offset)
+            capturectrl = self.__get_capturectrl(c, handle)
+            results = capturectrl.get_classification_results_as_ndarray(
+                capture_unit_id, num_samples, addr_offset)
+            return pickle.dumps(encode_ndarray(results))
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(226, handle='s', capture_unit_id='w', num_samples='y', addr_offset='y', returns='y')
+    def get_capture_mean(self, c, handle, capture_unit_id, num_samples, addr_offset):
+        try:
+            num_samples = pickle.loads(num_samples)
+            addr_offset = pickle.loads(addr_offset)
+            capturectrl = self.__get_capturectrl(c, handle)
+            cap_data = capturectrl.get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+            mean_i, mean_q = cap_data.mean(axis = 0, dtype = np.float64).tolist()
+            return pickle.dumps((mean_i, mean_q))
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(227, handle='s', capture_unit_id='w', num_samples='y', addr_offset='y',
+             bins='y', value_range='y', returns='y')
+    def get_capture_histogram2d(
+        self, c, handle, capture_unit_id, num_samples, addr_offset, bins, value_range):
+        try:
+            num_samples = pickle.loads(num_samples)
+            addr_offset = pickle.loads(addr_offset)
+            bins = pickle.loads(bins)
+            value_range = pickle.loads(value_range)
+            capturectrl = self.__get_capturectrl(c, handle)
+            cap_data = capturectrl.get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+            hist, i_edges, q_edges = np.histogram2d(
+                cap_data[:, 0], cap_data[:, 1], bins = bins, range = value_range)
+            hist = hist.astype(np.int64)
+            return pickle.dumps(
+                (encode_ndarray(hist), encode_ndarray(i_edges), encode_ndarray(q_edges)))
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(228, handle='s', capture_unit_id='w', num_results='y', addr_offset='y', returns='y')
+    def get_classification_counts(self, c, handle, capture_unit_id, num_results, addr_offset):
+        try:
+            num_results = pickle.loads(num_results)
+            addr_offset = pickle.loads(addr_offset)
+            capturectrl = self.__get_capturectrl(c, handle)
+            results = capturectrl.get_classification_results_as_ndarray(
+                capture_unit_id, num_results, addr_offset)
+            counts = np.bincount(results, minlength = 4).tolist()
+            return pickle.dumps(counts)
+        except Exception as e:
+            return pickle.dumps(e)
+
+
 
     @setting(300, returns='y')
     def create_sequencerctrl(self, c, ipaddr):
@@ -441,6 +598,7 @@ class AwgCaptureServer(ThreadedServer):
             with self.__lock:
                 handle = str(self.__handle)
                 self.__sequencerctrls[handle] = SequencerCtrl(ipaddr, validate_args = False)
+                self.__handle_to_ipaddr[handle] = ipaddr
                 self.__handle += 1
             return pickle.dumps(str(handle))
         except Exception as e:
@@ -452,6 +610,7 @@ class AwgCaptureServer(ThreadedServer):
         try:
             with self.__lock:
                 ctrl = self.__sequencerctrls.pop(handle)
+                del self.__handle_to_ipaddr[handle]
                 ctrl.close()
             return pickle.dumps(None)
         except Exception as e:
@@ -461,7 +620,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(302, handle='s', returns='y')
     def initialize_sequencer(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.initialize()
             return pickle.dumps(None)
         except Exception as e:
@@ -472,7 +631,7 @@ class AwgCaptureServer(ThreadedServer):
     def push_commands(self, c, handle, cmd_list):
         try:
             cmd_list = pickle.loads(cmd_list)
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.push_commands(cmd_list)
             return pickle.dumps(None)
         except Exception as e:
@@ -482,7 +641,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(304, handle='s', returns='y')
     def start_sequencer(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.start_sequencer()
             return pickle.dumps(None)
         except Exception as e:
@@ -492,7 +651,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(305, handle='s', returns='y')
     def terminate_sequencer(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.terminate_sequencer()
             return pickle.dumps(None)
         except Exception as e:
@@ -502,7 +661,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(306, handle='s', returns='y')
     def clear_commands(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.clear_commands()
             return pickle.dumps(None)
         except Exception as e:
@@ -512,7 +671,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(307, handle='s', returns='y')
     def clear_unsent_cmd_err_reports(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.clear_unsent_cmd_err_reports()
             return pickle.dumps(None)
         except Exception as e:
@@ -522,7 +681,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(308, handle='s', returns='y')
     def clear_sequencer_stop_flag(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.clear_sequencer_stop_flag()
             return pickle.dumps(None)
         except Exception as e:
@@ -532,7 +691,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(309, handle='s', returns='y')
     def enable_cmd_err_report(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.enable_cmd_err_report()
             return pickle.dumps(None)
         except Exception as e:
@@ -542,7 +701,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(310, handle='s', returns='y')
     def disable_cmd_err_report(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.disable_cmd_err_report()
             return pickle.dumps(None)
         except Exception as e:
@@ -552,9 +711,12 @@ class AwgCaptureServer(ThreadedServer):
     @setting(311, handle='s', timeout='y', returns='y')
     def wait_for_sequencer_to_stop(self, c, handle, timeout):
         try:
-            timeout = pickle.loads(timeout)
-            seqencerctrl = self.__get_sequencerctrl(handle)
-            seqencerctrl.wait_for_sequencer_to_stop(timeout)
+            # timeout には (タイムアウト値, SequencerWaitStrategy) のタプルも渡せる
+            args = pickle.loads(timeout)
+            if not isinstance(args, tuple):
+                args = (args,)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
+            seqencerctrl.wait_for_sequencer_to_stop(*args)
             return pickle.dumps(None)
         except Exception as e:
             return pickle.dumps(e)
@@ -563,7 +725,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(312, handle='s', returns='y')
     def num_unprocessed_commands(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             num_unprocessed_commands = seqencerctrl.num_unprocessed_commands()
             return pickle.dumps(num_unprocessed_commands)
         except Exception as e:
@@ -573,7 +735,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(313, handle='s', returns='y')
     def num_successful_commands(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             num_successful_commands = seqencerctrl.num_successful_commands()
             return pickle.dumps(num_successful_commands)
         except Exception as e:
@@ -583,7 +745,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(314, handle='s', returns='y')
     def num_err_commands(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             num_err_commands = seqencerctrl.num_err_commands()
             return pickle.dumps(num_err_commands)
         except Exception as e:
@@ -593,7 +755,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(315, handle='s', returns='y')
     def num_unsent_cmd_err_reports(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             num_unsent_cmd_err_reports = seqencerctrl.num_unsent_cmd_err_reports()
             return pickle.dumps(num_unsent_cmd_err_reports)
         except Exception as e:
@@ -603,7 +765,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(316, handle='s', returns='y')
     def cmd_fifo_free_space(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             cmd_fifo_free_space = seqencerctrl.cmd_fifo_free_space()
             return pickle.dumps(cmd_fifo_free_space)
         except Exception as e:
@@ -613,7 +775,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(317, handle='s', returns='y')
     def check_sequencer_err(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             err_list = seqencerctrl.check_err()
             return pickle.dumps(err_list)
         except Exception as e:
@@ -623,7 +785,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(318, handle='s', returns='y')
     def pop_cmd_err_reports(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             cmd_err_reports = seqencerctrl.pop_cmd_err_reports()
             return pickle.dumps(cmd_err_reports)
         except Exception as e:
@@ -633,7 +795,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(319, handle='s', returns='y')
     def sequencer_version(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             version = seqencerctrl.version()
             return pickle.dumps(version)
         except Exception as e:
@@ -643,7 +805,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(320, handle='s', returns='y')
     def num_stored_commands(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             num_stored_commands = seqencerctrl._num_stored_commands()
             return pickle.dumps(num_stored_commands)
         except Exception as e:
@@ -653,7 +815,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(321, handle='s', returns='y')
     def cmd_counter(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             cmd_counter = seqencerctrl._cmd_counter()
             return pickle.dumps(cmd_counter)
         except Exception as e:
@@ -663,7 +825,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(322, handle='s', returns='y')
     def reset_cmd_counter(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl._reset_cmd_counter()
             return pickle.dumps(None)
         except Exception as e:
@@ -673,7 +835,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(323, handle='s', returns='y')
     def get_branch_flag(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             return pickle.dumps(seqencerctrl.get_branch_flag())
         except Exception as e:
             return pickle.dumps(e)
@@ -682,7 +844,7 @@ class AwgCaptureServer(ThreadedServer):
     @setting(324, handle='s', val='b', returns='y')
     def set_branch_flag(self, c, handle, val):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             seqencerctrl.set_branch_flag(val)
             return pickle.dumps(None)
         except Exception as e:
@@ -692,12 +854,45 @@ class AwgCaptureServer(ThreadedServer):
     @setting(325, handle='s', returns='y')
     def get_external_branch_flag(self, c, handle):
         try:
-            seqencerctrl = self.__get_sequencerctrl(handle)
+            seqencerctrl = self.__get_sequencerctrl(c, handle)
             return pickle.dumps(seqencerctrl._get_external_branch_flag())
         except Exception as e:
             return pickle.dumps(e)
 
 
+    @setting(400, steps='y', returns='y')
+    def run_shot(self, c, steps):
+        try:
+            steps = pickle.loads(steps)
+            results = []
+            for kind, handle, method, args in steps:
+                results.append(self.__get_shot_method(c, kind, handle, method)(*args))
+            return pickle.dumps(results)
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(500, returns='y')
+    def get_scheduler_stats(self, c):
+        """デバイスごとのキューの深さと, 要求ごとのレイテンシの統計を返す"""
+        try:
+            return pickle.dumps({
+                'queue_depths' : self.__scheduler.queue_depths(),
+                'latency' : self.__scheduler.latency_stats()
+            })
+        except Exception as e:
+            return pickle.dumps(e)
+
+
+    @setting(501, returns='y')
+    def reset_scheduler_stats(self, c):
+        try:
+            self.__scheduler.reset_stats()
+            return pickle.dumps(None)
+        except Exception as e:
+            return pickle.dumps(e)
+
+
 __server__ = AwgCaptureServer()
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import io
+import struct
+from typing import Final
+import numpy as np
+from e7awgsw import WaveSequence
+
+# 波形シーケンスのヘッダ (待ちワード数, リピート回数, チャンク数)
+_WAVE_SEQ_HEADER: Final = struct.Struct('<III')
+# 波形チャンクのヘッダ (ポストブランク長, リピート回数, サンプル数)
+_WAVE_CHUNK_HEADER: Final = struct.Struct('<III')
+
+
+def encode_ndarray(array: np.ndarray) -> bytes:
+    """NumPy 配列をリトルエンディアンの .npy 形式のバイト列に変換する
+
+    Args:
+        array (numpy.ndarray): 変換する配列
+
+    Returns:
+        bytes: .npy 形式 (ヘッダ + 生データ) のバイト列
+    """
+    array = np.ascontiguousarray(array, dtype = array.dtype.newbyteorder('<'))
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle = False)
+    return buf.getvalue()
+
+
+def decode_ndarray(data: bytes) -> np.ndarray:
+    """encode_ndarray で変換したバイト列を NumPy 配列に戻す
+
+    Args:
+        data (bytes): .npy 形式のバイト列
+
+    Returns:
+        numpy.ndarray: 復元した配列
+    """
+    return np.load(io.BytesIO(data), allow_pickle = False)
+
+
+def encode_wave_sequence(wave_seq: WaveSequence) -> bytes:
+    """波形シーケンスを, ヘッダとリトルエンディアンの int16 のサンプル列からなるバイト列に変換する
+
+    | サンプル値は下位 16 ビットだけを保持するので, 符号なしで指定したサンプル値は符号付きの値として復元される.
+    | AWG に送られるビット列は変わらない.
+
+    Args:
+        wave_seq (WaveSequence): 変換する波形シーケンス
+
+    Returns:
+        bytes: 変換したバイト列
+    """
+    chunks = wave_seq.chunk_list
+    data = bytearray(
+        _WAVE_SEQ_HEADER.pack(wave_seq.num_wait_words, wave_seq.num_repeats, len(chunks)))
+    for chunk in chunks:
+        samples = np.array(chunk.wave_data.samples, dtype = np.int64) & 0xFFFF
+        data += _WAVE_CHUNK_HEADER.pack(chunk.num_blank_words, chunk.num_repeats, len(samples))
+        data += samples.astype('<u2').tobytes()
+    return bytes(data)
+
+
+def decode_wave_sequence(data: bytes) -> WaveSequence:
+    """encode_wave_sequence で変換したバイト列を波形シーケンスに戻す
+
+    Args:
+        data (bytes): encode_wave_sequence で変換したバイト列
+
+    Returns:
+        WaveSequence: 復元した波形シーケンス
+    """
+    num_wait_words, num_repeats, num_chunks = _WAVE_SEQ_HEADER.unpack_from(data, 0)
+    offset = _WAVE_SEQ_HEADER.size
+    wave_seq = WaveSequence(num_wait_words, num_repeats)
+    for _ in range(num_chunks):
+        num_blank_words, num_chunk_repeats, num_samples = _WAVE_CHUNK_HEADER.unpack_from(data, offset)
+        offset += _WAVE_CHUNK_HEADER.size
+        samples = np.frombuffer(data, dtype = '<i2', count = num_samples * 2, offset = offset)
+        offset += samples.nbytes
+        iq_samples = list(map(tuple, samples.reshape(num_samples, 2).tolist()))
+        wave_seq.add_chunk(iq_samples, num_blank_words, num_chunk_repeats)
+    return wave_seq
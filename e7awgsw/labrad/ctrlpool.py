@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import threading
+from typing import Generic, TypeVar, Final
+from collections.abc import Callable
+from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+
+Ctrl = TypeVar('Ctrl')
+
+
+class CtrlPool(Generic[Ctrl]):
+    """デバイスの IP アドレスごとにコントローラを共有するプール
+
+    | 同じ IP アドレスに対する acquire は, 参照カウントを増やして既存のコントローラを返す.
+    | 参照カウントが 0 になったコントローラはすぐには閉じず, idle_timeout 秒間再利用されなかった場合に閉じる.
+    """
+
+    #: 使われなくなったコントローラを閉じるまでの時間のデフォルト値 (単位 : 秒)
+    DEFAULT_IDLE_TIMEOUT: Final = 300.0
+
+    def __init__(
+        self,
+        factory: Callable[[str], Ctrl],
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT
+    ) -> None:
+        """
+        Args:
+            factory (Callable): IP アドレスを受け取ってコントローラを作成する関数
+            idle_timeout (float): 参照されなくなったコントローラを閉じるまでの時間 (単位 : 秒)
+        """
+        self.__factory = factory
+        self.__idle_timeout = idle_timeout
+        # IP アドレス -> [コントローラ, 参照カウント, 閉じるためのタイマー]
+        self.__entries: dict[str, list] = {}
+        self.__lock = threading.Lock()
+        self.__loggers = [get_file_logger(), get_stderr_logger()]
+
+
+    def acquire(self, ip_addr: str) -> Ctrl:
+        """ip_addr のデバイスを制御するコントローラを取得する
+
+        Args:
+            ip_addr (str): デバイスの IP アドレス
+
+        Returns:
+            コントローラ
+        """
+        with self.__lock:
+            entry = self.__entries.get(ip_addr)
+            if entry is None:
+                entry = [self.__factory(ip_addr), 0, None]
+                self.__entries[ip_addr] = entry
+            elif entry[2] is not None:
+                entry[2].cancel()
+                entry[2] = None
+            entry[1] += 1
+            return entry[0]
+
+
+    def release(self, ip_addr: str) -> None:
+        """acquire で取得したコントローラの参照を手放す
+
+        Args:
+            ip_addr (str): acquire に渡した IP アドレス
+        """
+        with self.__lock:
+            entry = self.__entries[ip_addr]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            if self.__idle_timeout <= 0:
+                self.__close(ip_addr, entry[0])
+                return
+            timer = threading.Timer(self.__idle_timeout, self.__close_if_idle, (ip_addr, entry[0]))
+            timer.daemon = True
+            entry[2] = timer
+            timer.start()
+
+
+    def __close_if_idle(self, ip_addr: str, ctrl: Ctrl) -> None:
+        with self.__lock:
+            entry = self.__entries.get(ip_addr)
+            # タイマーの起動後に再取得されていた場合は閉じない
+            if (entry is not None) and (entry[0] is ctrl) and (entry[1] == 0):
+                self.__close(ip_addr, ctrl)
+
+
+    def __close(self, ip_addr: str, ctrl: Ctrl) -> None:
+        del self.__entries[ip_addr]
+        try:
+            ctrl.close() # type: ignore
+        except Exception as e:
+            log_error(e, *self.__loggers)
+
+
+    def num_refs(self, ip_addr: str) -> int:
+        """ip_addr のコントローラの参照カウント.  プールに無い場合は 0."""
+        with self.__lock:
+            entry = self.__entries.get(ip_addr)
+            return 0 if entry is None else entry[1]
+
+
+    def close_all(self) -> None:
+        """プール内の全コントローラを閉じる"""
+        with self.__lock:
+            for ip_addr, entry in list(self.__entries.items()):
+                if entry[2] is not None:
+                    entry[2].cancel()
+                self.__close(ip_addr, entry[0])
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import time
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict, deque
+from typing import Any, Final
+from collections.abc import Callable, Hashable
+from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+
+
+class _Job(object):
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any]
+    ) -> None:
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueue_time = time.perf_counter()
+
+
+class _LatencyStats(object):
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_wait = 0.0
+        self.total_service = 0.0
+        self.max_latency = 0.0
+
+
+    def add(self, wait: float, service: float) -> None:
+        self.count += 1
+        self.total_wait += wait
+        self.total_service += service
+        self.max_latency = max(self.max_latency, wait + service)
+
+
+    def to_dict(self) -> dict[str, float]:
+        count = max(self.count, 1)
+        return {
+            'count' : self.count,
+            'mean_wait' : self.total_wait / count,
+            'mean_service' : self.total_service / count,
+            'mean_latency' : (self.total_wait + self.total_service) / count,
+            'max_latency' : self.max_latency
+        }
+
+
+class _DeviceLane(object):
+    """1 台のデバイスに対する要求を処理するワーカーとキュー
+
+    | クライアントごとにキューを持ち, ラウンドロビンで 1 つずつ取り出して処理する.
+    """
+
+    def __init__(self, name: str, num_workers: int, scheduler: DeviceScheduler) -> None:
+        self.__scheduler = scheduler
+        # クライアント -> 要求のキュー. 先頭のクライアントから順に処理する.
+        self.__queues: OrderedDict[Hashable, deque[_Job]] = OrderedDict()
+        self.__num_queued = 0
+        self.__num_running = 0
+        self.__stopped = False
+        self.__cond = threading.Condition()
+        self.__workers = [
+            threading.Thread(target = self.__work, name = '{}-{}'.format(name, i), daemon = True)
+            for i in range(num_workers)]
+        for worker in self.__workers:
+            worker.start()
+
+
+    def put(self, client: Hashable, job: _Job) -> None:
+        with self.__cond:
+            if self.__stopped:
+                raise RuntimeError('The device scheduler has been shut down.')
+            self.__queues.setdefault(client, deque()).append(job)
+            self.__num_queued += 1
+            self.__cond.notify()
+
+
+    def __take(self) -> _Job | None:
+        with self.__cond:
+            while (self.__num_queued == 0) and (not self.__stopped):
+                self.__cond.wait()
+            if self.__num_queued == 0:
+                return None
+            client, queue = next(iter(self.__queues.items()))
+            job = queue.popleft()
+            # 処理したクライアントは末尾に回して, 他のクライアントの要求を先に処理する
+            del self.__queues[client]
+            if queue:
+                self.__queues[client] = queue
+            self.__num_queued -= 1
+            self.__num_running += 1
+            return job
+
+
+    def __work(self) -> None:
+        while True:
+            job = self.__take()
+            if job is None:
+                return
+            start = time.perf_counter()
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.func(*job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            end = time.perf_counter()
+            with self.__cond:
+                self.__num_running -= 1
+            self.__scheduler._record_latency(job.name, start - job.enqueue_time, end - start)
+
+
+    @property
+    def num_queued(self) -> int:
+        with self.__cond:
+            return self.__num_queued
+
+
+    @property
+    def num_running(self) -> int:
+        with self.__cond:
+            return self.__num_running
+
+
+    def stop(self) -> None:
+        with self.__cond:
+            self.__stopped = True
+            for queue in self.__queues.values():
+                for job in queue:
+                    job.future.cancel()
+            self.__queues.clear()
+            self.__num_queued = 0
+            self.__cond.notify_all()
+
+
+class _ScheduledCtrl(object):
+    """コントローラのメソッド呼び出しを DeviceScheduler 経由で実行するラッパー"""
+
+    def __init__(
+        self,
+        ctrl: Any,
+        scheduler: DeviceScheduler,
+        ip_addr: str,
+        client: Hashable,
+        prefix: str
+    ) -> None:
+        self.__ctrl = ctrl
+        self.__scheduler = scheduler
+        self.__ip_addr = ip_addr
+        self.__client = client
+        self.__prefix = prefix
+
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.__ctrl, name)
+        if not callable(attr):
+            return attr
+
+        if name.startswith(DeviceScheduler.BLOCKING_METHOD_PREFIX):
+            def call(*args: Any, **kwargs: Any) -> Any:
+                return self.__scheduler.run_blocking(self.__prefix + name, attr, *args, **kwargs)
+        else:
+            def call(*args: Any, **kwargs: Any) -> Any:
+                return self.__scheduler.run(
+                    self.__ip_addr, self.__client, self.__prefix + name, attr, *args, **kwargs)
+        return call
+
+
+class DeviceScheduler(object):
+    """LabRAD サーバの要求を, 制御対象のデバイスごとのワーカーで処理するスケジューラ
+
+    | デバイス (IP アドレス) ごとに専用のワーカーを持つので, あるデバイスへの時間のかかる要求が
+    | 他のデバイスへの要求を待たせることはない.
+    | 同じデバイスへの要求はクライアントごとのキューに入れられ, クライアント間でラウンドロビンで処理される.
+    | ワーカーはレジスタや RAM へのアクセスのような短い要求に使う.
+    | wait_for_sequencer_to_stop などの完了待ちは, 待っている間ワーカーを占有して他の要求
+    | (待っている処理を完了させる要求を含む) を止めてしまうので, ワーカーを使わず呼び出し元のスレッドで実行する.
+    """
+
+    #: 1 台のデバイスに割り当てるワーカースレッドの数のデフォルト値
+    DEFAULT_WORKERS_PER_DEVICE: Final = 2
+    #: bind したコントローラのメソッドのうち, この接頭辞を持つものは完了待ちとしてワーカーを使わずに実行する
+    BLOCKING_METHOD_PREFIX: Final = 'wait_for_'
+
+    def __init__(self, workers_per_device: int = DEFAULT_WORKERS_PER_DEVICE) -> None:
+        """
+        Args:
+            workers_per_device (int): 1 台のデバイスに割り当てるワーカースレッドの数
+        """
+        self.__loggers = [get_file_logger(), get_stderr_logger()]
+        if (not isinstance(workers_per_device, int)) or (workers_per_device <= 0):
+            msg = ("'workers_per_device' must be a positive integer.  '{}' was set."
+                .format(workers_per_device))
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+        self.__workers_per_device = workers_per_device
+        self.__lanes: dict[str, _DeviceLane] = {}
+        self.__stats: dict[str, _LatencyStats] = {}
+        self.__lock = threading.Lock()
+        self.__stats_lock = threading.Lock()
+
+
+    def __get_lane(self, ip_addr: str) -> _DeviceLane:
+        with self.__lock:
+            lane = self.__lanes.get(ip_addr)
+            if lane is None:
+                lane = _DeviceLane(
+                    'lane-{}'.format(ip_addr), self.__workers_per_device, self)
+                self.__lanes[ip_addr] = lane
+            return lane
+
+
+    def submit(
+        self,
+        ip_addr: str,
+        client: Hashable,
+        name: str,
+        func: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> Future:
+        """ip_addr のデバイスのワーカーで func を実行する
+
+        Args:
+            ip_addr (str): 要求の対象となるデバイスの IP アドレス
+            client (Hashable): 要求を出したクライアントの識別子
+            name (str): レイテンシを集計するときの要求の名前
+            func (Callable): 実行する関数
+            *args (Any): func に渡す引数
+            **kwargs (Any): func に渡すキーワード引数
+
+        Returns:
+            Future: func の実行結果を受け取る Future オブジェクト
+        """
+        job = _Job(name, func, args, kwargs)
+        self.__get_lane(ip_addr).put(client, job)
+        return job.future
+
+
+    def run(
+        self,
+        ip_addr: str,
+        client: Hashable,
+        name: str,
+        func: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> Any:
+        """submit で func を実行し, その終了を待って結果を返す.  引数は submit と同じ."""
+        return self.submit(ip_addr, client, name, func, *args, **kwargs).result()
+
+
+    def run_blocking(self, name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """完了待ちなど長時間ブロックする func を, ワーカーを使わずに呼び出し元のスレッドで実行する
+
+        Args:
+            name (str): レイテンシを集計するときの要求の名前
+            func (Callable): 実行する関数
+            *args (Any): func に渡す引数
+            **kwargs (Any): func に渡すキーワード引数
+
+        Returns:
+            func の戻り値
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._record_latency(name, 0.0, time.perf_counter() - start)
+
+
+    def bind(self, ctrl: Any, ip_addr: str, client: Hashable, prefix: str = '') -> Any:
+        """ctrl のメソッド呼び出しをこのスケジューラ経由で実行するラッパーを返す
+
+        | BLOCKING_METHOD_PREFIX で始まるメソッドは run_blocking で, それ以外は run で実行する.
+
+        Args:
+            ctrl (Any): ラップするコントローラ
+            ip_addr (str): ctrl が制御するデバイスの IP アドレス
+            client (Hashable): メソッドを呼ぶクライアントの識別子
+            prefix (str): レイテンシを集計するときにメソッド名の前に付ける文字列
+
+        Returns:
+            ctrl と同じメソッドを持つラッパーオブジェクト
+        """
+        return _ScheduledCtrl(ctrl, self, ip_addr, client, prefix)
+
+
+    def _record_latency(self, name: str, wait: float, service: float) -> None:
+        with self.__stats_lock:
+            stats = self.__stats.get(name)
+            if stats is None:
+                stats = _LatencyStats()
+                self.__stats[name] = stats
+            stats.add(wait, service)
+
+
+    def queue_depths(self) -> dict[str, dict[str, int]]:
+        """デバイスごとの待ち要求数と実行中の要求数
+
+        Returns:
+            {IP アドレス : {'queued' : 待ち要求数, 'running' : 実行中の要求数}}
+        """
+        with self.__lock:
+            lanes = dict(self.__lanes)
+        return {
+            ip_addr : { 'queued' : lane.num_queued, 'running' : lane.num_running }
+            for ip_addr, lane in lanes.items()
+        }
+
+
+    def latency_stats(self) -> dict[str, dict[str, float]]:
+        """要求の名前ごとのレイテンシの統計 (単位 : 秒)
+
+        | mean_wait はキューで待った時間, mean_service は実行にかかった時間の平均.
+
+        Returns:
+            {要求の名前 : {'count', 'mean_wait', 'mean_service', 'mean_latency', 'max_latency'}}
+        """
+        with self.__stats_lock:
+            return { name : stats.to_dict() for name, stats in self.__stats.items() }
+
+
+    def reset_stats(self) -> None:
+        """レイテンシの統計を消去する"""
+        with self.__stats_lock:
+            self.__stats.clear()
+
+
+    def shutdown(self) -> None:
+        """全ワーカーを停止する.  実行待ちの要求はキャンセルされる."""
+        with self.__lock:
+            lanes = list(self.__lanes.values())
+            self.__lanes.clear()
+        for lane in lanes:
+            lane.stop()
@@ -7,6 +7,7 @@ from typing_extensions import Self, Any
 from collections.abc import Mapping
 from e7awgsw.awgctrl import AwgCtrlBase
 from e7awgsw.logger import get_null_logger, log_error
+from e7awgsw.labrad.binarycodec import encode_wave_sequence
 from e7awgsw import AWG, WaveSequence, AwgErr
 from logging import Logger
 
@@ -92,8 +93,8 @@ class RemoteAwgCtrl(AwgCtrlBase):
 
     def _set_wave_sequence(self, awg_id: AWG, wave_seq: WaveSequence) -> None:
         try:
-            wseq = pickle.dumps(wave_seq)
-            result = self.__server.set_wave_sequence(self.__handler, int(awg_id), wseq)
+            wseq = encode_wave_sequence(wave_seq)
+            result = self.__server.set_wave_sequence_binary(self.__handler, int(awg_id), wseq)
             self.__decode_and_check(result)
         except Exception as e:
             log_error(e, *self._loggers)
@@ -214,6 +215,17 @@ class RemoteAwgCtrl(AwgCtrlBase):
             raise
 
 
+    @property
+    def _shot_target(self) -> tuple[str, str | None]:
+        """RemoteShot がこのコントローラを指定するために使う (コントローラの種類, サーバ上のハンドラ)"""
+        return ('awg', self.__handler)
+
+
+    def _run_shot(self, steps: bytes) -> bytes:
+        """RemoteShot に登録された処理をサーバ上でまとめて実行する"""
+        return self.__server.run_shot(steps)
+
+
     def __decode_and_check(self, data: bytes) -> Any:
         data = pickle.loads(data)
         if isinstance(data, Exception):
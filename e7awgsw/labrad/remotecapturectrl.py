@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import labrad # type: ignore
 import pickle
+import numpy as np
 from typing_extensions import Self, Any
 from types import TracebackType
 from collections.abc import Sequence
@@ -9,6 +10,7 @@ from logging import Logger
 from e7awgsw import CaptureUnit, CaptureParam, CaptureModule, AWG, CaptureErr
 from e7awgsw.capturectrl import CaptureCtrlBase
 from e7awgsw.logger import get_null_logger, log_error
+from e7awgsw.labrad.binarycodec import decode_ndarray
 
 class RemoteCaptureCtrl(CaptureCtrlBase):
     """ LabRAD サーバを通してキャプチャユニットを制御するためのクラス """
@@ -124,23 +126,31 @@ class RemoteCaptureCtrl(CaptureCtrlBase):
     def _get_capture_data(
         self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
     ) -> list[tuple[float, float]]:
+        samples = self._get_capture_data_as_ndarray(capture_unit_id, num_samples, addr_offset)
+        return list(map(tuple, samples.tolist()))
+
+
+    def _get_capture_data_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
+    ) -> np.ndarray:
         try:
             cap_unit = int(capture_unit_id)
             n_samples = pickle.dumps(num_samples)
             addr_ofst = pickle.dumps(addr_offset)
-            result = self.__server.get_capture_data(self.__handler, cap_unit, n_samples, addr_ofst)
-            return self.__decode_and_check(result)
+            result = self.__server.get_capture_data_binary(
+                self.__handler, cap_unit, n_samples, addr_ofst)
+            return decode_ndarray(self.__decode_and_check(result))
         except Exception as e:
             log_error(e, *self._loggers)
             raise
 
 
     def _get_classification_results(
-        self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
+        self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
     ) -> Sequence[int]:
         try:
             cap_unit = int(capture_unit_id)
-            n_samples = pickle.dumps(num_samples)
+            n_samples = pickle.dumps(num_results)
             addr_ofst = pickle.dumps(addr_offset)
             result = self.__server.get_classification_results(
                 self.__handler, cap_unit, n_samples, addr_ofst)
@@ -150,6 +160,130 @@ class RemoteCaptureCtrl(CaptureCtrlBase):
             raise
 
 
+    def _get_classification_results_as_ndarray(
+        self, capture_unit_id: CaptureUnit, num_results: int, addr_offset: int
+    ) -> np.ndarray:
+        try:
+            cap_unit = int(capture_unit_id)
+            n_samples = pickle.dumps(num_results)
+            addr_ofst = pickle.dumps(addr_offset)
+            result = self.__server.get_classification_results_binary(
+                self.__handler, cap_unit, n_samples, addr_ofst)
+            return decode_ndarray(self.__decode_and_check(result))
+        except Exception as e:
+            log_error(e, *self._loggers)
+            raise
+
+
+    def get_capture_mean(
+        self,
+        capture_unit_id: CaptureUnit,
+        num_samples: int,
+        addr_offset: int = 0
+    ) -> tuple[float, float]:
+        """引数で指定したキャプチャユニットが保存したサンプルデータの平均値を LabRAD サーバ上で計算して取得する.
+
+        Args:
+            capture_unit_id (CaptureUnit): この ID のキャプチャユニットが保存したサンプルデータの平均値を取得する
+            num_samples (int): 平均を取るサンプル数 (I と Q はまとめて 1 サンプル)
+            addr_offset (int): 平均を取るサンプルデータのバイトアドレスオフセット
+
+        Returns:
+            (float, float): I データの平均値と Q データの平均値のタプル
+        """
+        try:
+            self.__validate_capture_data_args(capture_unit_id, num_samples, addr_offset)
+            cap_unit = int(capture_unit_id)
+            n_samples = pickle.dumps(num_samples)
+            addr_ofst = pickle.dumps(addr_offset)
+            result = self.__server.get_capture_mean(self.__handler, cap_unit, n_samples, addr_ofst)
+            return self.__decode_and_check(result)
+        except Exception as e:
+            log_error(e, *self._loggers)
+            raise
+
+
+    def get_capture_histogram2d(
+        self,
+        capture_unit_id: CaptureUnit,
+        num_samples: int,
+        addr_offset: int = 0,
+        *,
+        bins: int | Sequence[int] = 10,
+        value_range: Sequence[Sequence[float]] | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """引数で指定したキャプチャユニットが保存したサンプルデータの IQ 平面上の 2 次元ヒストグラムを LabRAD サーバ上で計算して取得する.
+
+        Args:
+            capture_unit_id (CaptureUnit): この ID のキャプチャユニットが保存したサンプルデータのヒストグラムを取得する
+            num_samples (int): ヒストグラムの計算に使うサンプル数 (I と Q はまとめて 1 サンプル)
+            addr_offset (int): ヒストグラムの計算に使うサンプルデータのバイトアドレスオフセット
+            bins (int or Sequence of int): ビンの数. numpy.histogram2d の bins と同じ.
+            value_range (Sequence of Sequence of float):
+                | ヒストグラムの範囲 [[I の最小値, I の最大値], [Q の最小値, Q の最大値]].
+                | None の場合, サンプルデータの最小値と最大値を使う.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray):
+                | (ヒストグラム, I 軸のビンの境界, Q 軸のビンの境界).
+                | ヒストグラムの [i, q] 要素は I が i 番目, Q が q 番目のビンに入るサンプルの数.
+        """
+        try:
+            self.__validate_capture_data_args(capture_unit_id, num_samples, addr_offset)
+            cap_unit = int(capture_unit_id)
+            n_samples = pickle.dumps(num_samples)
+            addr_ofst = pickle.dumps(addr_offset)
+            result = self.__server.get_capture_histogram2d(
+                self.__handler, cap_unit, n_samples, addr_ofst,
+                pickle.dumps(bins), pickle.dumps(value_range))
+            hist, i_edges, q_edges = self.__decode_and_check(result)
+            return (decode_ndarray(hist), decode_ndarray(i_edges), decode_ndarray(q_edges))
+        except Exception as e:
+            log_error(e, *self._loggers)
+            raise
+
+
+    def get_classification_counts(
+        self,
+        capture_unit_id: CaptureUnit,
+        num_results: int,
+        addr_offset: int = 0
+    ) -> list[int]:
+        """引数で指定したキャプチャユニットが保存した四値化結果の値ごとの個数を LabRAD サーバ上で数えて取得する.
+
+        Args:
+            capture_unit_id (CaptureUnit): この ID のキャプチャユニットが保存した四値化結果を数える
+            num_results (int): 数える四値化結果の個数
+            addr_offset (int): 数える四値化結果のバイトアドレスオフセット
+
+        Returns:
+            list of int: 四値化結果が 0, 1, 2, 3 である個数のリスト
+        """
+        try:
+            if self._validate_args:
+                self._validate_capture_unit_id(capture_unit_id)
+                self._validate_num_classification_results(num_results)
+                self._validate_addr_offset(addr_offset)
+            cap_unit = int(capture_unit_id)
+            n_results = pickle.dumps(num_results)
+            addr_ofst = pickle.dumps(addr_offset)
+            result = self.__server.get_classification_counts(
+                self.__handler, cap_unit, n_results, addr_ofst)
+            return self.__decode_and_check(result)
+        except Exception as e:
+            log_error(e, *self._loggers)
+            raise
+
+
+    def __validate_capture_data_args(
+        self, capture_unit_id: CaptureUnit, num_samples: int, addr_offset: int
+    ) -> None:
+        if self._validate_args:
+            self._validate_capture_unit_id(capture_unit_id)
+            self._validate_num_capture_samples(num_samples)
+            self._validate_addr_offset(addr_offset)
+
+
     def _num_captured_samples(self, capture_unit_id: CaptureUnit) -> int:
         try:
             cap_unit = int(capture_unit_id)
@@ -326,6 +460,17 @@ class RemoteCaptureCtrl(CaptureCtrlBase):
             raise
 
 
+    @property
+    def _shot_target(self) -> tuple[str, str | None]:
+        """RemoteShot がこのコントローラを指定するために使う (コントローラの種類, サーバ上のハンドラ)"""
+        return ('capture', self.__handler)
+
+
+    def _run_shot(self, steps: bytes) -> bytes:
+        """RemoteShot に登録された処理をサーバ上でまとめて実行する"""
+        return self.__server.run_shot(steps)
+
+
     def __decode_and_check(self, data: bytes) -> Any:
         data = pickle.loads(data)
         if isinstance(data, Exception):
@@ -6,7 +6,8 @@ from types import TracebackType
 from typing_extensions import Self, Any
 from collections.abc import Sequence
 from e7awgsw import SequencerCmd, SequencerErr, SequencerCmdErr
-from e7awgsw.sequencerctrl import SequencerCtrlBase
+from e7awgsw.sequencerctrl import SequencerCtrlBase, SequencerWaitStrategy
+from e7awgsw.sequencerprogram import SequencerProgram
 from e7awgsw.logger import get_null_logger, log_error
 from logging import Logger
 
@@ -98,7 +99,7 @@ class RemoteSequencerCtrl(SequencerCtrlBase):
             raise
 
 
-    def _push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd) -> None:
+    def _push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd | SequencerProgram) -> None:
         try:
             cmds = pickle.dumps(cmd_list)
             result = self.__server.push_commands(self.__handler, cmds)
@@ -171,9 +172,13 @@ class RemoteSequencerCtrl(SequencerCtrlBase):
             raise
 
 
-    def _wait_for_sequencer_to_stop(self, timeout: float) -> None:
+    def _wait_for_sequencer_to_stop(self, timeout: float, strategy: SequencerWaitStrategy) -> None:
         try:
-            to = pickle.dumps(timeout)
+            # 既定の方法で待つ場合は, strategy を受け付けない古いサーバとも通信できるように timeout だけを送る
+            if strategy == SequencerWaitStrategy.POLLING:
+                to = pickle.dumps(timeout)
+            else:
+                to = pickle.dumps((timeout, strategy))
             result = self.__server.wait_for_sequencer_to_stop(self.__handler, to)
             self.__decode_and_check(result)
         except Exception as e:
@@ -307,6 +312,17 @@ class RemoteSequencerCtrl(SequencerCtrlBase):
             raise
 
 
+    @property
+    def _shot_target(self) -> tuple[str, str | None]:
+        """RemoteShot がこのコントローラを指定するために使う (コントローラの種類, サーバ上のハンドラ)"""
+        return ('sequencer', self.__handler)
+
+
+    def _run_shot(self, steps: bytes) -> bytes:
+        """RemoteShot に登録された処理をサーバ上でまとめて実行する"""
+        return self.__server.run_shot(steps)
+
+
     def __decode_and_check(self, data: bytes) -> Any:
         data = pickle.loads(data)
         if isinstance(data, Exception):
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import pickle
+from typing_extensions import Any
+from logging import Logger
+from e7awgsw.logger import get_file_logger, get_null_logger, log_error
+from .remoteawgctrl import RemoteAwgCtrl
+from .remotecapturectrl import RemoteCaptureCtrl
+from .remotesequencerctrl import RemoteSequencerCtrl
+
+
+class RemoteShot(object):
+    """ LabRAD サーバ上で実行する一連のコントローラ操作をまとめて保持するクラス
+
+    | add で登録したメソッド呼び出しを, run を呼んだときに 1 回の RPC でまとめて実行する.
+    | 1 ショット分の波形設定, キャプチャ設定, 起動, 完了待ち, データ取得を 1 往復で行える.
+
+    .. code-block:: python
+
+        shot = RemoteShot()
+        shot.add(awg_ctrl, 'set_wave_sequence', AWG.U15, wave_seq)
+        shot.add(cap_ctrl, 'set_capture_params', CaptureUnit.U0, param)
+        shot.add(awg_ctrl, 'start_awgs', AWG.U15)
+        shot.add(cap_ctrl, 'wait_for_capture_units_to_stop', 5, CaptureUnit.U0)
+        idx = shot.add(cap_ctrl, 'get_capture_data_as_ndarray', CaptureUnit.U0, num_samples)
+        results = shot.run()
+        samples = results[idx]
+    """
+
+    def __init__(
+        self,
+        *,
+        enable_lib_log: bool = True,
+        logger: Logger = get_null_logger()
+    ) -> None:
+        """
+        Args:
+            enable_lib_log (bool):
+                | True -> ライブラリの標準のログ機能を有効にする.
+                | False -> ライブラリの標準のログ機能を無効にする.
+            logger (logging.Logger): ユーザ独自のログ出力に用いる Logger オブジェクト
+        """
+        self.__loggers = [logger]
+        if enable_lib_log:
+            self.__loggers.append(get_file_logger())
+        self.__steps: list[tuple[str, str | None, str, tuple[Any, ...]]] = []
+        self.__runner: RemoteAwgCtrl | RemoteCaptureCtrl | RemoteSequencerCtrl | None = None
+
+
+    def add(
+        self,
+        ctrl: RemoteAwgCtrl | RemoteCaptureCtrl | RemoteSequencerCtrl,
+        method: str,
+        *args: Any
+    ) -> int:
+        """ctrl のメソッド呼び出しを登録する
+
+        | 登録できるメソッドはコントローラの公開メソッドのうち, サーバが許可したものに限る.
+        | 許可されていないメソッドを登録した場合, run を呼んだときにエラーとなる.
+
+        Args:
+            ctrl (RemoteAwgCtrl, RemoteCaptureCtrl, RemoteSequencerCtrl): メソッドを呼ぶコントローラ
+            method (str): メソッド名
+            *args (Any): メソッドに渡す引数
+
+        Returns:
+            int: run の戻り値の中でこの呼び出しの結果が格納されるインデックス
+        """
+        try:
+            if not isinstance(ctrl, (RemoteAwgCtrl, RemoteCaptureCtrl, RemoteSequencerCtrl)):
+                raise ValueError('Invalid controller {}'.format(ctrl))
+            if not isinstance(method, str):
+                raise ValueError('Invalid method name {}'.format(method))
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            raise
+
+        kind, handler = ctrl._shot_target
+        self.__steps.append((kind, handler, method, tuple(args)))
+        if self.__runner is None:
+            self.__runner = ctrl
+        return len(self.__steps) - 1
+
+
+    def clear(self) -> None:
+        """登録したメソッド呼び出しを全て削除する"""
+        self.__steps = []
+        self.__runner = None
+
+
+    @property
+    def num_steps(self) -> int:
+        """登録したメソッド呼び出しの数"""
+        return len(self.__steps)
+
+
+    def run(self) -> list[Any]:
+        """登録したメソッド呼び出しを LabRAD サーバ上で登録順に実行する
+
+        | 途中のメソッド呼び出しで例外が発生した場合, 後続の呼び出しは実行されずにその例外が送出される.
+
+        Returns:
+            list of Any: 各メソッド呼び出しの戻り値のリスト. 要素の順番は登録順と同じ.
+        """
+        if self.__runner is None:
+            return []
+        try:
+            result = pickle.loads(self.__runner._run_shot(pickle.dumps(self.__steps)))
+            if isinstance(result, Exception):
+                raise result
+            return result
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            raise
@@ -7,11 +7,12 @@ import threading
 import time
 from types import TracebackType
 from io import TextIOWrapper
+from .instrumentation import InstrumentCollector
 
 class ReentrantFileLock(object):
     """スレッド間, プロセス間排他可能なファイルロック"""
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, instrument: InstrumentCollector | None = None) -> None:
         dirname = os.path.dirname(filepath)
         os.makedirs(dirname, exist_ok = True)
         self.__lock_fp = self.__get_fp(filepath)
@@ -22,6 +23,7 @@ class ReentrantFileLock(object):
 
         self.__num_holds = 0
         self.__rlock = threading.RLock()
+        self.__instrument = instrument
 
 
     def __get_fp(self, filepath: str) -> TextIOWrapper:
@@ -35,9 +37,13 @@ class ReentrantFileLock(object):
 
 
     def acquire(self) -> None:
+        start = time.perf_counter()
         self.__rlock.acquire()
         self.__num_holds += 1
         fcntl.flock(self.__lock_fp.fileno(), fcntl.LOCK_EX)
+        # 再入時の取得は待ちが発生しないので記録しない
+        if (self.__instrument is not None) and (self.__num_holds == 1):
+            self.__instrument.record_lock_wait(time.perf_counter() - start)
 
 
     def release(self) -> None:
@@ -1,19 +1,17 @@
+from __future__ import annotations
+
 import logging
 import datetime
 import os
 import sys
+import threading
 from logging import getLogger, FileHandler, NullHandler, StreamHandler, Formatter, Logger
 
-os.makedirs('./log', exist_ok = True)
 formatter = Formatter(
     '%(asctime)s - [%(name)s] - %(levelname)s - %(filename)s - ln.%(lineno)d - %(funcName)s\n%(message)s\n')
-file_name = datetime.datetime.now().strftime('err_log_%Y%m%d%H%M%S.txt')
-fh = FileHandler('./log/' + file_name, delay = True)
-fh.setFormatter(formatter)
 invoked_script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
 file_logger = getLogger(invoked_script)
 file_logger.setLevel(logging.INFO)
-file_logger.addHandler(fh)
 
 null_logger = getLogger('nullLibLog')
 null_logger.addHandler(NullHandler())
@@ -23,8 +21,33 @@ sh.setFormatter(formatter)
 stderr_logger = getLogger('stderrLog')
 stderr_logger.addHandler(sh)
 
+_file_handler_lock = threading.Lock()
+_file_handler: FileHandler | None = None
+
+
+class _LogDirFileHandler(FileHandler):
+    """最初のログを書き込むときにログディレクトリを作成する FileHandler"""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok = True)
+        return super()._open()
+
+
+def _setup_file_handler() -> None:
+    """file_logger にログファイルのハンドラを登録する.  ディレクトリとファイルはエラーを記録するときに作られる."""
+    global _file_handler
+    with _file_handler_lock:
+        if _file_handler is not None:
+            return
+        file_name = datetime.datetime.now().strftime('err_log_%Y%m%d%H%M%S.txt')
+        _file_handler = _LogDirFileHandler('./log/' + file_name, delay = True)
+        _file_handler.setFormatter(formatter)
+        file_logger.addHandler(_file_handler)
+
 
 def get_file_logger() -> Logger:
+    if _file_handler is None:
+        _setup_file_handler()
     return file_logger
 
 
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import time
+import threading
+from typing import Final, NamedTuple, TYPE_CHECKING
+from collections.abc import Iterable, Iterator, Callable
+from logging import Logger
+from .logger import log_error
+from .sequencercmd import SequencerCmd
+from .exception import TooLittleFreeSpaceInCmdFifoError, SequencerTimeoutError
+
+if TYPE_CHECKING:
+    from .sequencerctrl import SequencerCtrlBase
+
+
+class FeedProgress(NamedTuple):
+    """SequencerCmdFeeder の進捗"""
+    #: コマンドキューに追加したコマンドの数
+    num_sent_cmds: int
+    #: コマンドキューに追加したコマンドの合計サイズ (bytes)
+    num_sent_bytes: int
+    #: シーケンサが実行したコマンドの数 (最後に読んだコマンドカウンタの値 - 送信開始時のコマンドカウンタの値)
+    num_executed_cmds: int
+    #: 最後に読んだコマンドキューの空き領域 (bytes)
+    fifo_free_space: int
+    #: コマンドキューにコマンドを追加した回数
+    num_refills: int
+    #: 送るコマンドが残っているのにコマンドキューが空になっていた回数
+    num_underruns: int
+    #: 全てのコマンドをコマンドキューに追加し終えたかどうか
+    done: bool
+
+
+class SequencerCmdFeeder(threading.Thread):
+    """任意の長さのコマンド列を, コマンドキューの空きに合わせて少しずつシーケンサに送るスレッド
+
+    | コマンドキューの使用量が低水位 (容量 x low_watermark) 以下になるたびに, 空き領域に収まるだけのコマンドを追加する.
+    | コマンド列は追加する直前に必要な分だけ取り出すので, ジェネレータを渡した場合, その生成はシーケンサの処理に合わせて進む.
+    | SequencerCaptureReader.commands を渡した場合, スロットの解放を待つ前に, 取り出し済みのコマンドをコマンドキューに追加する.
+    | コマンドキューの容量は, 送信開始時に読んだ空き領域の大きさとする.  送信開始時のコマンドキューは空にしておくこと.
+    | 送信中に例外が発生した場合, コマンドキューにどのコマンドが追加されたかは不定なので, clear_commands でコマンドキューを空にすること.
+    | このオブジェクトは SequencerCtrl.feed_commands で作る.
+    """
+
+    #: コマンドキューの使用量を確認する間隔の最小値 (sec)
+    MIN_POLL_INTERVAL: Final = 1e-4
+    #: コマンドキューの使用量を確認する間隔の最大値 (sec)
+    MAX_POLL_INTERVAL: Final = 0.01
+
+    def __init__(
+        self,
+        seq_ctrl: SequencerCtrlBase,
+        cmds: Iterable[SequencerCmd],
+        low_watermark: float,
+        may_block: Callable[[], bool] | None,
+        *loggers: Logger
+    ) -> None:
+        super().__init__(daemon = True)
+        self.__seq_ctrl = seq_ctrl
+        self.__cmds: Iterator[SequencerCmd] = iter(cmds)
+        # 次のコマンドの取り出しで待つ可能性があるかを返す関数
+        self.__may_block = may_block
+        self.__low_watermark = low_watermark
+        self.__loggers = loggers
+        # 前回コマンドキューに収まらなかったコマンド
+        self.__next_cmd: SequencerCmd | None = None
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__exception: BaseException | None = None
+        self.__num_sent_cmds = 0
+        self.__num_sent_bytes = 0
+        self.__first_cmd_counter = 0
+        self.__cmd_counter = 0
+        self.__fifo_free_space = 0
+        self.__num_refills = 0
+        self.__num_underruns = 0
+        self.__done = False
+
+
+    def run(self) -> None:
+        try:
+            self.__feed()
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            self.__exception = e
+
+
+    def __feed(self) -> None:
+        capacity = self.__seq_ctrl._cmd_fifo_free_space()
+        self.__first_cmd_counter = self.__seq_ctrl._cmd_counter()
+        self.__cmd_counter = self.__first_cmd_counter
+        refill_space = capacity - int(capacity * self.__low_watermark)
+        free_space = capacity
+        # コマンドキューが空く速さ (bytes/sec).  次に使用量を確認するまでの時間を決めるのに使う.
+        drain_rate = 0.0
+        last_time = time.perf_counter()
+        while not self.__stop_event.is_set():
+            # 前回収まらなかったコマンドが低水位分の空きより大きい場合は, そのコマンドが収まるまで待つ
+            required_space = refill_space
+            if self.__next_cmd is not None:
+                required_space = max(required_space, self.__next_cmd.size())
+            if free_space >= required_space:
+                if not self.__refill(free_space, capacity):
+                    break
+                free_space = self.__seq_ctrl._cmd_fifo_free_space()
+                last_time = time.perf_counter()
+            else:
+                # 必要な空きができるまでの時間だけ待つ
+                interval = self.MAX_POLL_INTERVAL
+                if drain_rate > 0:
+                    interval = (required_space - free_space) / drain_rate
+                interval = min(max(interval, self.MIN_POLL_INTERVAL), self.MAX_POLL_INTERVAL)
+                if self.__stop_event.wait(interval):
+                    break
+                prev_free_space = free_space
+                free_space = self.__seq_ctrl._cmd_fifo_free_space()
+                now = time.perf_counter()
+                if free_space > prev_free_space:
+                    drain_rate = (free_space - prev_free_space) / (now - last_time)
+                last_time = now
+
+            cmd_counter = self.__seq_ctrl._cmd_counter()
+            with self.__lock:
+                self.__fifo_free_space = free_space
+                self.__cmd_counter = cmd_counter
+
+
+    def __refill(self, free_space: int, capacity: int) -> bool:
+        """空き領域に収まるだけのコマンドをコマンドキューに追加する.  コマンドが尽きた場合 False を返す."""
+        cmd_list: list[SequencerCmd] = []
+        cmd_bytes = 0
+        exhausted = False
+        while True:
+            cmd = self.__next_cmd
+            self.__next_cmd = None
+            if cmd is None:
+                if cmd_list and (self.__may_block is not None) and self.__may_block():
+                    # 取り出しを待つ間に, 取り出し済みのコマンドが実行されないままにならないよう先に送る
+                    break
+                cmd = next(self.__cmds, None)
+                if cmd is None:
+                    exhausted = True
+                    break
+            if cmd_bytes + cmd.size() > free_space:
+                if cmd.size() > capacity:
+                    raise TooLittleFreeSpaceInCmdFifoError(
+                        'The command is larger than the command FIFO.  ({} > {} bytes)'.format(
+                            cmd.size(), capacity))
+                self.__next_cmd = cmd
+                break
+            cmd_list.append(cmd)
+            cmd_bytes += cmd.size()
+
+        if cmd_list:
+            self.__seq_ctrl._push_commands(cmd_list)
+        with self.__lock:
+            if cmd_list:
+                if self.__num_sent_cmds > 0 and free_space == capacity:
+                    self.__num_underruns += 1
+                self.__num_sent_cmds += len(cmd_list)
+                self.__num_sent_bytes += cmd_bytes
+                self.__num_refills += 1
+            self.__done = exhausted
+        return not exhausted
+
+
+    def progress(self) -> FeedProgress:
+        """送信の進捗を取得する
+
+        Returns:
+            FeedProgress: 送信の進捗
+        """
+        with self.__lock:
+            return FeedProgress(
+                self.__num_sent_cmds,
+                self.__num_sent_bytes,
+                self.__cmd_counter - self.__first_cmd_counter,
+                self.__fifo_free_space,
+                self.__num_refills,
+                self.__num_underruns,
+                self.__done)
+
+
+    def wait(self, timeout: float) -> None:
+        """全てのコマンドをコマンドキューに追加し終えるのを待つ
+
+        Args:
+            timeout (int or float): タイムアウト値 (単位: 秒). タイムアウトした場合, 例外を発生させる.
+
+        Raises:
+            SequencerTimeoutError: タイムアウトした場合
+            Exception: コマンドの送信中に発生した例外
+        """
+        self.join(timeout)
+        if self.is_alive():
+            msg = 'Sequencer command feeding timed out'
+            log_error(msg, *self.__loggers)
+            raise SequencerTimeoutError(msg)
+        if self.__exception is not None:
+            raise self.__exception
+
+
+    def stop(self) -> None:
+        """コマンドの送信を止める.  コマンドキューに追加済みのコマンドは取り消されない."""
+        self.__stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+    @property
+    def exception(self) -> BaseException | None:
+        """コマンドの送信中に発生した例外.  発生していない場合は None."""
+        return self.__exception
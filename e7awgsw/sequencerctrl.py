@@ -2,20 +2,44 @@ from __future__ import annotations
 
 import time
 import socket
+import threading
+from enum import Enum
 from types import TracebackType
 from typing_extensions import Self
 from abc import ABCMeta, abstractmethod
 from deprecated import deprecated
-from collections.abc import Sequence
+from typing import Any, Final, TYPE_CHECKING
+from collections.abc import Sequence, Iterable, Iterator, Callable, Mapping
 from logging import Logger
 from .logger import get_file_logger, get_null_logger, log_error
 from .hwparam import CMD_ERR_REPORT_SIZE, SEQUENCER_REG_PORT, SEQUENCER_CMD_PORT
 from .udpaccess import SequencerRegAccess, SequencerCmdSender, CmdErrReceiver, UdpRouter, get_my_ip_addr
 from .uplpacket import UplPacket
+from .instrumentation import InstrumentCollector
 from .memorymap import SequencerCtrlRegs as SeqRegs
 from .sequencercmd import SequencerCmd, SequencerCmdErr
+from .sequencercmdfeeder import SequencerCmdFeeder
+from .capturereader import SequencerCaptureReader
+from .sequencerprogram import SequencerProgram
 from .exception import TooLittleFreeSpaceInCmdFifoError, SequencerTimeoutError
-from .hwdefs import SequencerErr
+from .hwdefs import SequencerErr, CaptureUnit
+
+if TYPE_CHECKING:
+    from .capturectrl import CaptureCtrlBase
+    from .captureaddrring import CaptureAddrRing
+
+
+class SequencerWaitStrategy(Enum):
+    """SequencerCtrl.wait_for_sequencer_to_stop でシーケンサの停止を待つ方法"""
+
+    #: 一定の間隔 (SequencerCtrl.POLL_INTERVAL) でステータスレジスタを読む
+    POLLING: Final = 0
+    #: 最初の SequencerCtrl.SPIN_DURATION 秒は間隔を空けずにステータスレジスタを読み, その後は読む間隔を MAX_POLL_INTERVAL まで倍々に延ばす
+    ADAPTIVE: Final = 1
+    #: | ADAPTIVE に加えて, コマンドエラーレポートを受信したときにすぐにステータスレジスタを読む.
+    #: | シーケンサは正常に停止したことを通知しないので, ADAPTIVE より早く検出できるのは, エラーを起こしたコマンドで停止した場合だけである.
+    EVENT: Final = 2
+
 
 class SequencerCtrlBase(object, metaclass = ABCMeta):
 
@@ -48,14 +72,18 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
         self._initialize()
 
 
-    def push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd) -> None:
+    def push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd | SequencerProgram) -> None:
         """シーケンサにコマンドを追加する
 
         | コマンドキューに cmd_list のための十分な空き領域がない場合, 例外を投げる.
         | このとき cmd_list のコマンドは 1 つも追加されない.
+        | コマンドの送信中に通信エラーやタイムアウトで例外が発生した場合, cmd_list のどのコマンドが追加されたかは不定である.
+        | この場合は clear_commands でコマンドキューを空にしてから送り直すこと.
 
         Args:
-            cmd_list (list of SequencerCmd): シーケンサに追加するコマンド
+            cmd_list (list of SequencerCmd or SequencerProgram):
+                | シーケンサに追加するコマンド.
+                | SequencerProgram を渡した場合は, そのイメージをそのまま送る.
 
         Raises:
             TooLittleFreeSpaceInCmdFifoError: コマンドキューの空き領域が足りない
@@ -72,6 +100,171 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
 
         self._push_commands(cmd_list)
 
+
+    def feed_commands(
+        self,
+        cmds: Iterable[SequencerCmd],
+        *,
+        low_watermark: float = 0.5
+    ) -> SequencerCmdFeeder:
+        """任意の長さのコマンド列を, コマンドキューの空きに合わせてバックグラウンドでシーケンサに送る
+
+        | push_commands と異なり, コマンドキューに収まらない数のコマンドを渡せる.
+        | コマンドキューの使用量が低水位以下になるたびに, 空き領域に収まるだけのコマンドを cmds から取り出して追加する.
+        | cmds にジェネレータを渡した場合, コマンドの生成はシーケンサの処理に合わせて進む.
+        | このメソッドを呼ぶ時点でコマンドキューは空にしておくこと.
+        | 送信の進捗は戻り値の progress で, 送信の完了は戻り値の wait で確認できる.
+        | 引数のチェックが有効な場合, cmds がリストなどのシーケンスであれば, 全てのコマンドをこのメソッドの中でチェックする.
+        | ジェネレータなどのシーケンスでないイテラブルであれば, 各コマンドは送信するときにチェックするので,
+        | 不正なコマンドが見つかった時点で, それより前のコマンドはコマンドキューに追加されている.
+
+        .. code-block:: python
+
+            feeder = seq_ctrl.feed_commands(gen_cmds())
+            seq_ctrl.start_sequencer()
+            feeder.wait(timeout = 60)
+            seq_ctrl.wait_for_sequencer_to_stop(timeout = 10)
+
+        Args:
+            cmds (iterable of SequencerCmd): シーケンサに送るコマンド列
+            low_watermark (float):
+                | コマンドキューの低水位 (コマンドキューの容量に対する割合, 0 以上 1 未満).
+                | 使用量がこの値以下になったときにコマンドを追加する.
+
+        Returns:
+            SequencerCmdFeeder: コマンドを送るスレッド
+        """
+        # SequencerCaptureReader.commands は, スロットの解放を待つ可能性があるかを返す may_block を持つ
+        may_block = getattr(cmds, 'may_block', None)
+        if self._validate_args:
+            try:
+                self._validate_low_watermark(low_watermark)
+                if isinstance(cmds, Sequence):
+                    for cmd in cmds:
+                        self.__validate_cmd(cmd)
+            except Exception as e:
+                log_error(e, *self._loggers)
+                raise
+            if not isinstance(cmds, Sequence):
+                cmds = self.__validated_cmds(cmds)
+
+        feeder = SequencerCmdFeeder(self, cmds, low_watermark, may_block, *self._loggers)
+        feeder.start()
+        return feeder
+
+
+    def read_captures_while_running(
+        self,
+        cap_ctrl: CaptureCtrlBase,
+        cmds: Iterable[SequencerCmd] | SequencerProgram,
+        num_samples: int | Mapping[CaptureUnit, int] | None = None,
+        *,
+        classification_results: bool | Mapping[CaptureUnit, bool] = False,
+        ring: CaptureAddrRing | None = None
+    ) -> SequencerCaptureReader:
+        """シーケンサの実行中に, 完了したショットのキャプチャデータをバックグラウンドで読み出す
+
+        | cmds の CaptureEndFenceCmd 1 つを 1 ショットとし, シーケンサがそのコマンドを実行し終えたら,
+        | 対象のキャプチャユニットのデータを, 直前の CaptureAddrSetCmd で設定したオフセットから読み出す.
+        | 後続のショットのキャプチャと並行して読み出すので, シーケンサの停止を待たずに結果を処理できる.
+        | cmds にリストなどのシーケンスもしくは SequencerProgram を渡した場合は, push_commands で送るコマンド列を渡し,
+        | このメソッドはシーケンサをスタートする前に呼ぶこと.
+        | cmds にジェネレータなどのシーケンスでないイテラブルを渡した場合は, 戻り値の commands を feed_commands に渡すこと.
+        | feed_commands がコマンドを取り出すたびに, そのコマンドのショットを登録する.
+        | CaptureEndFenceCmd がエラーを報告した場合, そのショットのデータは不完全な可能性がある.
+        | ShotCapture.fence_cmd_no と pop_cmd_err_reports の結果を照合して確認すること.
+        | ショットを読み出している間に, 後続のコマンドがそのショットの領域にキャプチャし始めた場合は,
+        | 読み出しを止めて, SequencerCaptureReader.results などで CaptureDataOverwrittenError を発生させる.
+        | 上書きされるまでに読み出せるよう, ショットごとに十分な数の異なるオフセットを割り当てること.
+        | ショットの位置はコマンドカウンタから求めるので, BranchByFlagCmd を含むコマンド列は扱えない.
+
+        .. code-block:: python
+
+            seq_ctrl.push_commands(program)
+            reader = seq_ctrl.read_captures_while_running(cap_ctrl, program, num_samples = 1024)
+            seq_ctrl.start_sequencer()
+            for shot in reader.results(timeout = 5):
+                process(shot.data[CaptureUnit.U0])
+            seq_ctrl.wait_for_sequencer_to_stop(timeout = 5)
+
+        | ring を指定すると, 読み出すサンプル数と四値化結果かどうかを ring のキャプチャパラメータから決める.
+        | さらに cmds がシーケンスでないイテラブルの場合は, 各ショットを読み出し終えるたびに ring.release でそのスロットを解放する.
+        | この場合 cmds は, ショットごとに ring.acquire で確保したショットの番号のスロットにキャプチャし,
+        | 1 つの CaptureEndFenceCmd で完了を確認すること (n 番目の CaptureEndFenceCmd を ring のショット n とみなす).
+        | acquire は読み出し終えていないスロットが解放されるまで待つので, 読み出していないデータが上書きされることはない.
+
+        .. code-block:: python
+
+            def gen_cmds():
+                for _ in range(num_shots):
+                    shot = ring.acquire()
+                    yield from ring.addr_set_cmds(shot)
+                    yield AwgStartCmd(0, AWG.U0, AwgStartCmd.IMMEDIATE, wait = True)
+                    yield CaptureEndFenceCmd(0, CaptureUnit.U0, 0)
+
+            reader = seq_ctrl.read_captures_while_running(cap_ctrl, gen_cmds(), ring = ring)
+            feeder = seq_ctrl.feed_commands(reader.commands)
+            seq_ctrl.start_sequencer()
+            for shot in reader.results(timeout = 5):
+                process(shot.data[CaptureUnit.U0])
+
+        Args:
+            cap_ctrl (CaptureCtrl): キャプチャデータを読み出すのに使う CaptureCtrl
+            cmds (iterable of SequencerCmd or SequencerProgram): シーケンサが実行するコマンド列
+            num_samples (int or dict of {CaptureUnit : int}):
+                | 1 ショットで各キャプチャユニットから読み出すサンプル数 (四値化結果を読み出す場合は四値化結果の個数).
+                | int の場合は全てのキャプチャユニットで共通の値になる.
+                | None の場合は ring.num_samples を使う.
+            classification_results (bool or dict of {CaptureUnit : bool}):
+                | True -> 四値化結果を読み出す
+                | False -> キャプチャデータを読み出す
+                | dict の場合はキャプチャユニットごとに指定し, 含まれないキャプチャユニットは False とする.
+                | ring を指定した場合は, ring.is_classification の値を使う.
+            ring (CaptureAddrRing): ショットごとのキャプチャアドレスを管理するリングバッファ
+
+        Returns:
+            SequencerCaptureReader: キャプチャデータを読み出すスレッド
+        """
+        try:
+            if ring is not None:
+                classification_results = {
+                    capture_unit_id : ring.is_classification(capture_unit_id)
+                    for capture_unit_id in ring.capture_unit_id_list }
+                if num_samples is None:
+                    num_samples = ring.num_samples
+            if num_samples is None:
+                raise ValueError("Either 'num_samples' or 'ring' must be specified.")
+            if isinstance(num_samples, int):
+                num_samples = { capture_unit_id : num_samples for capture_unit_id in CaptureUnit.all() }
+            if isinstance(classification_results, bool):
+                classification_results = {
+                    capture_unit_id : classification_results for capture_unit_id in CaptureUnit.all() }
+            if self._validate_args:
+                if isinstance(cmds, (Sequence, SequencerProgram)):
+                    self._validate_seq_cmds(cmds)
+                for n in num_samples.values():
+                    if (not isinstance(n, int)) or (n < 0):
+                        raise ValueError('Invalid number of samples {}'.format(n))
+            reader = SequencerCaptureReader(
+                self, cap_ctrl, cmds, num_samples, classification_results, ring, *self._loggers)
+        except Exception as e:
+            log_error(e, *self._loggers)
+            raise
+
+        reader.start()
+        return reader
+
+
+    def __validated_cmds(self, cmds: Iterable[SequencerCmd]) -> Iterator[SequencerCmd]:
+        for cmd in cmds:
+            self.__validate_cmd(cmd)
+            yield cmd
+
+
+    def __validate_cmd(self, cmd: SequencerCmd) -> None:
+        if not isinstance(cmd, SequencerCmd):
+            raise ValueError('Invalid sequencer command.  ({})'.format(cmd))
+
     
     def start_sequencer(self) -> None:
         """シーケンサのコマンドの処理を開始する"""
@@ -125,14 +318,23 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
         self._disable_cmd_err_report()
 
 
-    def wait_for_sequencer_to_stop(self, timeout: float) -> None:
+    def wait_for_sequencer_to_stop(
+        self,
+        timeout: float,
+        strategy: SequencerWaitStrategy = SequencerWaitStrategy.POLLING
+    ) -> None:
         """シーケンサのコマンドの処理が終了するのを待つ
 
         | シーケンサのコマンドの処理が終了するのは, シーケンサ停止フラグが有効なコマンドを実行した場合と,
         | シーケンサを強制停止した場合である.
+        | シーケンサの実行を繰り返すフィードバック実験などで, 停止を検出するまでの遅れを小さくしたい場合は
+        | strategy に SequencerWaitStrategy.ADAPTIVE を指定する.
+        | SequencerWaitStrategy.EVENT は, コマンドエラーレポートの受信をきっかけに停止を確認するので,
+        | エラーを起こしたコマンドで停止した場合にだけ ADAPTIVE より早く検出できる.  正常に停止した場合は ADAPTIVE と同じである.
 
         Args:
             timeout (int or float): タイムアウト値 (単位: 秒). タイムアウトした場合, 例外を発生させる.
+            strategy (SequencerWaitStrategy): シーケンサの停止を待つ方法
         
         Raises:
             SequencerTimeoutError: タイムアウトした場合
@@ -140,11 +342,12 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
         if self._validate_args:
             try:
                 self._validate_timeout(timeout)
+                self._validate_wait_strategy(strategy)
             except Exception as e:
                 log_error(e, *self._loggers)
                 raise
 
-        self._wait_for_sequencer_to_stop(timeout)
+        self._wait_for_sequencer_to_stop(timeout, strategy)
 
 
     def num_unprocessed_commands(self) -> int:
@@ -262,8 +465,8 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
             raise ValueError('Invalid IP address {}'.format(ip_addr))
 
 
-    def _validate_seq_cmds(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd) -> None:
-        if isinstance(cmd_list, SequencerCmd):
+    def _validate_seq_cmds(self, cmd_list: Sequence[SequencerCmd] | SequencerCmd | SequencerProgram) -> None:
+        if isinstance(cmd_list, (SequencerCmd, SequencerProgram)):
             return
 
         if not isinstance(cmd_list, Sequence):
@@ -279,6 +482,16 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
             raise ValueError('Invalid timeout {}'.format(timeout))
 
 
+    def _validate_wait_strategy(self, strategy: SequencerWaitStrategy) -> None:
+        if not isinstance(strategy, SequencerWaitStrategy):
+            raise ValueError('Invalid wait strategy {}'.format(strategy))
+
+
+    def _validate_low_watermark(self, low_watermark: float) -> None:
+        if (not isinstance(low_watermark, (int, float))) or (not (0 <= low_watermark < 1)):
+            raise ValueError('Invalid low watermark {}'.format(low_watermark))
+
+
     def _validate_flag(self, flag: bool) -> None:
         if (not isinstance(flag, bool)):
             raise ValueError('Invalid flag {}'.format(flag))
@@ -288,7 +501,7 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
         pass
 
     @abstractmethod
-    def _push_commands(self, cmd_list: Sequence[SequencerCmd]) -> None:
+    def _push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerProgram) -> None:
         pass
 
     @abstractmethod
@@ -320,7 +533,7 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
         pass
     
     @abstractmethod
-    def _wait_for_sequencer_to_stop(self, timeout: float) -> None:
+    def _wait_for_sequencer_to_stop(self, timeout: float, strategy: SequencerWaitStrategy) -> None:
         pass
 
     @abstractmethod
@@ -385,13 +598,24 @@ class SequencerCtrlBase(object, metaclass = ABCMeta):
 
 
 class SequencerCtrl(SequencerCtrlBase):
+
+    #: SequencerWaitStrategy.POLLING でステータスレジスタを読む間隔 (sec)
+    POLL_INTERVAL: Final = 0.01
+    #: SequencerWaitStrategy.ADAPTIVE, EVENT で間隔を空けずにステータスレジスタを読む時間 (sec)
+    SPIN_DURATION: Final = 1e-3
+    #: SequencerWaitStrategy.ADAPTIVE, EVENT で SPIN_DURATION 経過後に最初にステータスレジスタを読む間隔 (sec)
+    MIN_POLL_INTERVAL: Final = 1e-4
+    #: SequencerWaitStrategy.ADAPTIVE, EVENT でステータスレジスタを読む間隔の最大値 (sec)
+    MAX_POLL_INTERVAL: Final = 2e-3
+
     def __init__(
         self,
         ip_addr: str,
         *,
         validate_args: bool = True,
         enable_lib_log: bool = True,
-        logger: Logger = get_null_logger()
+        logger: Logger = get_null_logger(),
+        instrument: InstrumentCollector | None = None
     ) -> None:
         """
         Args:
@@ -403,11 +627,17 @@ class SequencerCtrl(SequencerCtrlBase):
                 | True -> ライブラリの標準のログ機能を有効にする.
                 | False -> ライブラリの標準のログ機能を無効にする.
             logger (logging.Logger): ユーザ独自のログ出力に用いる Logger オブジェクト
+            instrument (InstrumentCollector):
+                | UDP アクセスとロックの取得待ちを記録するオブジェクト.
+                | None の場合は記録しない.
         """
         super().__init__(ip_addr, validate_args, enable_lib_log, logger)
-        self.__reg_access = SequencerRegAccess(ip_addr, SEQUENCER_REG_PORT, *self._loggers)
-        self.__cmd_sender = SequencerCmdSender(ip_addr, SEQUENCER_CMD_PORT, *self._loggers)
+        if instrument is not None:
+            instrument.register_ctrl(self)
+        self.__reg_access = SequencerRegAccess(ip_addr, SEQUENCER_REG_PORT, *self._loggers, instrument = instrument)
+        self.__cmd_sender = SequencerCmdSender(ip_addr, SEQUENCER_CMD_PORT, *self._loggers, instrument = instrument)
         self.__err_receiver: CmdErrReceiver | None = None
+        self.__cmd_err_callbacks: list[Callable[[list[SequencerCmdErr]], Any]] = []
         self.__my_ip_addr = get_my_ip_addr(self._ip_addr) # シーケンサから来るパケットを受けるときの IP アドレス
         reg_access_addr = (self.__reg_access.my_ip_addr, self.__reg_access.my_port)
         cmd_sender_addr = (self.__cmd_sender.my_ip_addr, self.__cmd_sender.my_port)
@@ -449,6 +679,55 @@ class SequencerCtrl(SequencerCtrlBase):
         self.__cmd_sender.close()
 
 
+    def add_cmd_err_callback(self, callback: Callable[[list[SequencerCmdErr]], Any]) -> None:
+        """コマンドエラーレポートを受信したときに呼ぶ関数を登録する
+
+        | callback は, シーケンサから受信したパケットごとに, そのパケットに含まれるコマンドエラーレポートのリストを引数として呼ばれる.
+        | callback はエラーレポートを受信するスレッドで呼ばれるので, 時間のかかる処理を行わないこと.
+        | callback に渡したレポートも pop_cmd_err_reports で取得できる.
+        | asyncio のイベントループで処理する場合は, 次のように callback からキューに渡す.
+
+        .. code-block:: python
+
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            seq_ctrl.add_cmd_err_callback(
+                lambda reports: loop.call_soon_threadsafe(queue.put_nowait, reports))
+
+        Args:
+            callback (Callable[[list of SequencerCmdErr], Any]): コマンドエラーレポートを受信したときに呼ぶ関数
+        """
+        self.__cmd_err_callbacks.append(callback)
+        if self.__err_receiver is not None:
+            self.__err_receiver.add_callback(callback)
+
+
+    def remove_cmd_err_callback(self, callback: Callable[[list[SequencerCmdErr]], Any]) -> None:
+        """add_cmd_err_callback で登録した関数を登録解除する.  登録されていない場合は何もしない.
+
+        Args:
+            callback (Callable[[list of SequencerCmdErr], Any]): 登録解除する関数
+        """
+        if callback in self.__cmd_err_callbacks:
+            self.__cmd_err_callbacks.remove(callback)
+        if self.__err_receiver is not None:
+            self.__err_receiver.remove_callback(callback)
+
+
+    def num_dropped_cmd_err_reports(self) -> int:
+        """保持できる数 (CmdErrReceiver.MAX_REPORTS) を超えて受信したために捨てたコマンドエラーレポートの数を取得する
+
+        | 保持しているレポートが上限に達すると, 古いレポートから捨てられる.
+
+        Returns:
+            int: 捨てたコマンドエラーレポートの数
+        """
+        if self.__err_receiver is None:
+            return 0
+
+        return self.__err_receiver.num_dropped_reports
+
+
     def __set_dest_port(self, port: int) -> None:
         """シーケンサからサーバに送られるパケットの宛先ポートをシーケンサに設定する"""
         self.__reg_access.write(SeqRegs.ADDR, SeqRegs.Offset.DEST_UDP_PORT, port)
@@ -469,6 +748,8 @@ class SequencerCtrl(SequencerCtrlBase):
         # 古いエラーレポートを受信しないように, エラー送信を止めてリセットしてからエラーレポート受信ポートを作成する.
         if self.__err_receiver is None:
             self.__err_receiver = CmdErrReceiver(self.__my_ip_addr, *self._loggers)
+            for callback in self.__cmd_err_callbacks:
+                self.__err_receiver.add_callback(callback)
             self.__router.add_entry(
                 UplPacket.MODE_SEQUENCER_CMD_ERR_REPORT,
                 self.__err_receiver.my_ip_addr,
@@ -485,9 +766,12 @@ class SequencerCtrl(SequencerCtrlBase):
         time.sleep(1e-4)
 
 
-    def _push_commands(self, cmd_list: Sequence[SequencerCmd]) -> None:
+    def _push_commands(self, cmd_list: Sequence[SequencerCmd] | SequencerProgram) -> None:
         free_space = self._cmd_fifo_free_space()
-        cmd_bytes = sum([cmd.size() for cmd in cmd_list])
+        if isinstance(cmd_list, SequencerProgram):
+            cmd_bytes = cmd_list.size()
+        else:
+            cmd_bytes = sum([cmd.size() for cmd in cmd_list])
         if cmd_bytes > free_space:
             msg = 'required : {} bytes,   free : {} bytes'.format(cmd_bytes, free_space)
             log_error(msg, *self._loggers)
@@ -544,57 +828,79 @@ class SequencerCtrl(SequencerCtrlBase):
         self.__wait_for_cmd_err_report_status_to_change(4, False)
 
 
-    def _wait_for_sequencer_to_stop(self, timeout: float) -> None:
-        start = time.time()
-        while True:
-            stopped = self.__reg_access.read_bits(
-                SeqRegs.ADDR, SeqRegs.Offset.STATUS, SeqRegs.Bit.STATUS_DONE, 1)
-
-            if stopped:
-                return
-
-            elapsed_time = time.time() - start
-            if elapsed_time > timeout:
-                msg = 'Sequencer stop timed out'
-                log_error(msg, *self._loggers)
-                raise SequencerTimeoutError(msg)
-            time.sleep(0.01)
+    def _wait_for_sequencer_to_stop(self, timeout: float, strategy: SequencerWaitStrategy) -> None:
+        self.__wait_for_status(
+            SeqRegs.Bit.STATUS_DONE, 1, timeout, 'Sequencer stop timed out', strategy)
 
 
     def __wait_for_sequencer_idle(self, timeout: float) -> None:
-        start = time.time()
-        while True:
-            busy = self.__reg_access.read_bits(
-                SeqRegs.ADDR, SeqRegs.Offset.STATUS, SeqRegs.Bit.STATUS_BUSY, 1)
-
-            if not busy:
-                return
-
-            elapsed_time = time.time() - start
-            if elapsed_time > timeout:
-                msg = 'Sequencer idle timed out'
-                log_error(msg, *self._loggers)
-                raise SequencerTimeoutError(msg)
-            time.sleep(0.01)
+        self.__wait_for_status(
+            SeqRegs.Bit.STATUS_BUSY, 0, timeout, 'Sequencer idle timed out', SequencerWaitStrategy.ADAPTIVE)
 
     
     def __wait_for_cmd_err_report_status_to_change(
         self, timeout: float, wait_for_active: bool
     ) -> None:
-        start = time.time()
-        while True:
-            active = self.__reg_access.read_bits(
-                SeqRegs.ADDR, SeqRegs.Offset.STATUS, SeqRegs.Bit.STATUS_ERR_REPORT_SEND_ACTIVE, 1)
-
-            if not (active ^ wait_for_active):
-                return
-
-            elapsed_time = time.time() - start
-            if elapsed_time > timeout:
-                msg = 'Sequencer cmd err report status change timed out'
-                log_error(msg, *self._loggers)
-                raise SequencerTimeoutError(msg)
-            time.sleep(0.01)
+        self.__wait_for_status(
+            SeqRegs.Bit.STATUS_ERR_REPORT_SEND_ACTIVE,
+            int(wait_for_active),
+            timeout,
+            'Sequencer cmd err report status change timed out',
+            SequencerWaitStrategy.ADAPTIVE)
+
+
+    def __wait_for_status(
+        self,
+        bit: int,
+        expected: int,
+        timeout: float,
+        timeout_msg: str,
+        strategy: SequencerWaitStrategy
+    ) -> None:
+        """ステータスレジスタの bit の値が expected になるまで待つ"""
+        wakeup_event = None
+        if (strategy == SequencerWaitStrategy.EVENT) and (self.__err_receiver is not None):
+            event = threading.Event()
+
+            def callback(_: list[SequencerCmdErr]) -> None:
+                event.set()
+
+            wakeup_event = event
+
+            self.__err_receiver.add_callback(callback)
+
+        try:
+            if strategy == SequencerWaitStrategy.POLLING:
+                interval = self.POLL_INTERVAL
+            else:
+                interval = self.MIN_POLL_INTERVAL
+            start = time.perf_counter()
+            while True:
+                val = self.__reg_access.read_bits(SeqRegs.ADDR, SeqRegs.Offset.STATUS, bit, 1)
+                if val == expected:
+                    return
+
+                elapsed_time = time.perf_counter() - start
+                if elapsed_time > timeout:
+                    log_error(timeout_msg, *self._loggers)
+                    raise SequencerTimeoutError(timeout_msg)
+
+                if strategy == SequencerWaitStrategy.POLLING:
+                    time.sleep(interval)
+                    continue
+                # 停止直後に検出できるように, 最初は間隔を空けずに読む
+                if elapsed_time < self.SPIN_DURATION:
+                    continue
+                sleep_time = min(interval, max(timeout - elapsed_time, 0))
+                if wakeup_event is not None:
+                    wakeup_event.wait(sleep_time)
+                    wakeup_event.clear()
+                else:
+                    time.sleep(sleep_time)
+                interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+        finally:
+            if wakeup_event is not None:
+                self.__err_receiver.remove_callback(callback) # type: ignore
 
 
     def _num_unprocessed_commands(self) -> int:
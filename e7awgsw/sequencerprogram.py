@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+from typing import Final, Any
+from collections.abc import Iterable
+from .sequencercmd import SequencerCmd, AwgStartCmd, CaptureEndFenceCmd, WaveGenEndFenceCmd
+from .hwdefs import AWG, CaptureUnit
+
+
+class SequencerProgram(object):
+    """シーケンサのコマンド列をコンパイルした, 1 つの連続したバイナリイメージ
+
+    | コマンドのオブジェクトを毎回作り直さずに, イメージの一部のフィールドだけを書き換えて繰り返し送ることができる.
+    | SequencerCtrl.push_commands にコマンドのリストの代わりに渡せる.
+
+    .. code-block:: python
+
+        program = SequencerProgram(cmds)
+        for delay in delays:
+            program.set_times(AwgStartCmd, start_times + delay)
+            seq_ctrl.push_commands(program)
+            ...
+    """
+
+    #: 1 コマンドのサイズ (bytes)
+    CMD_SIZE: Final = 16
+
+    #: 全てのコマンドに共通するフィールド
+    CMD_DTYPE: Final = np.dtype({
+        'names' : ['header', 'cmd_no', 'body'],
+        'formats' : ['u1', '<u2', ('u1', 13)],
+        'offsets' : [0, 1, 3],
+        'itemsize' : CMD_SIZE })
+
+    #: 時刻を指定するコマンド (AwgStartCmd, CaptureEndFenceCmd, WaveGenEndFenceCmd) のフィールド
+    TIMED_CMD_DTYPE: Final = np.dtype({
+        'names' : ['header', 'cmd_no', 'unit_bits', 'time', 'flags'],
+        'formats' : ['u1', '<u2', '<u2', '<i8', 'u1'],
+        'offsets' : [0, 1, 3, 5, 13],
+        'itemsize' : CMD_SIZE })
+
+    # 時刻を指定するコマンドの種類 -> 時刻に指定可能な最小値
+    __MIN_TIMES: Final = {
+        AwgStartCmd : AwgStartCmd.IMMEDIATE,
+        CaptureEndFenceCmd : 0,
+        WaveGenEndFenceCmd : 0,
+    }
+
+    def __init__(self, cmds: Iterable[SequencerCmd], *, first_cmd_no: int | None = 0) -> None:
+        """
+        Args:
+            cmds (Iterable of SequencerCmd): コンパイルするコマンド列
+            first_cmd_no (int):
+                | コマンド番号を first_cmd_no から順に振り直す.  SequencerCmd.MAX_CMD_NO の次は 0 に戻る.
+                | None の場合は各コマンドのコマンド番号をそのまま使う.
+        """
+        chunks = []
+        for cmd in cmds:
+            if not isinstance(cmd, SequencerCmd):
+                raise ValueError('Invalid sequencer command.  ({})'.format(cmd))
+            if cmd.size() != self.CMD_SIZE:
+                raise ValueError('Unsupported command size {} bytes.  ({})'.format(cmd.size(), cmd))
+            chunks.append(cmd.serialize())
+
+        if first_cmd_no is not None:
+            self.__validate_first_cmd_no(first_cmd_no)
+
+        self.__set_image(np.frombuffer(b''.join(chunks), dtype = np.uint8).copy())
+        if first_cmd_no is not None:
+            self.renumber(first_cmd_no)
+
+
+    @classmethod
+    def awg_start_cmds(
+        cls,
+        awg_bits: npt.ArrayLike | Iterable[AWG] | AWG,
+        start_times: npt.ArrayLike,
+        *,
+        wait: npt.ArrayLike = False,
+        stop_seq: npt.ArrayLike = False,
+        first_cmd_no: int = 0
+    ) -> SequencerProgram:
+        """AwgStartCmd の列を, コマンドのオブジェクトを作らずに配列から直接コンパイルする
+
+        | 引数の配列は要素ごとに 1 つのコマンドに対応する.  スカラを渡した場合は全てのコマンドで共通の値になる.
+
+        Args:
+            awg_bits (int or array-like of int or list of AWG):
+                | 波形の出力を開始する AWG.  整数の場合は AWG ID をビット位置とするビットマスク.
+                | AWG のリストを渡した場合は, 全てのコマンドで共通の AWG になる.
+            start_times (int or array-like of int): AWG をスタートする時刻.  負の値は即時スタートを表す.
+            wait (bool or array-like of bool): AwgStartCmd の wait
+            stop_seq (bool or array-like of bool): シーケンサ停止フラグ
+            first_cmd_no (int): 最初のコマンドのコマンド番号.  以降のコマンドには連番を振る.
+
+        Returns:
+            SequencerProgram: コンパイルしたコマンド列
+        """
+        return cls.__from_timed_arrays(
+            AwgStartCmd, cls.__to_unit_bits(awg_bits, AWG), AWG, start_times,
+            AwgStartCmd.IMMEDIATE, AwgStartCmd.MAX_START_TIME,
+            np.asarray(wait, dtype = bool).astype(np.uint8), stop_seq, first_cmd_no)
+
+
+    @classmethod
+    def capture_end_fence_cmds(
+        cls,
+        capture_unit_bits: npt.ArrayLike | Iterable[CaptureUnit] | CaptureUnit,
+        end_times: npt.ArrayLike,
+        *,
+        wait: npt.ArrayLike = True,
+        terminate: npt.ArrayLike = False,
+        stop_seq: npt.ArrayLike = False,
+        first_cmd_no: int = 0
+    ) -> SequencerProgram:
+        """CaptureEndFenceCmd の列を, コマンドのオブジェクトを作らずに配列から直接コンパイルする
+
+        | 引数の配列は要素ごとに 1 つのコマンドに対応する.  スカラを渡した場合は全てのコマンドで共通の値になる.
+
+        Args:
+            capture_unit_bits (int or array-like of int or list of CaptureUnit):
+                | キャプチャの完了を調べるキャプチャユニット.  整数の場合はキャプチャユニット ID をビット位置とするビットマスク.
+                | キャプチャユニットのリストを渡した場合は, 全てのコマンドで共通のキャプチャユニットになる.
+            end_times (int or array-like of int): キャプチャが完了しているかを調べる時刻
+            wait (bool or array-like of bool): CaptureEndFenceCmd の wait
+            terminate (bool or array-like of bool): CaptureEndFenceCmd の terminate
+            stop_seq (bool or array-like of bool): シーケンサ停止フラグ
+            first_cmd_no (int): 最初のコマンドのコマンド番号.  以降のコマンドには連番を振る.
+
+        Returns:
+            SequencerProgram: コンパイルしたコマンド列
+        """
+        return cls.__from_timed_arrays(
+            CaptureEndFenceCmd, cls.__to_unit_bits(capture_unit_bits, CaptureUnit), CaptureUnit, end_times,
+            0, CaptureEndFenceCmd.MAX_END_TIME, cls.__fence_flags(wait, terminate), stop_seq, first_cmd_no)
+
+
+    @classmethod
+    def wave_gen_end_fence_cmds(
+        cls,
+        awg_bits: npt.ArrayLike | Iterable[AWG] | AWG,
+        end_times: npt.ArrayLike,
+        *,
+        wait: npt.ArrayLike = True,
+        terminate: npt.ArrayLike = False,
+        stop_seq: npt.ArrayLike = False,
+        first_cmd_no: int = 0
+    ) -> SequencerProgram:
+        """WaveGenEndFenceCmd の列を, コマンドのオブジェクトを作らずに配列から直接コンパイルする
+
+        | 引数の配列は要素ごとに 1 つのコマンドに対応する.  スカラを渡した場合は全てのコマンドで共通の値になる.
+
+        Args:
+            awg_bits (int or array-like of int or list of AWG):
+                | 波形出力完了を調べる AWG.  整数の場合は AWG ID をビット位置とするビットマスク.
+                | AWG のリストを渡した場合は, 全てのコマンドで共通の AWG になる.
+            end_times (int or array-like of int): AWG の波形出力が完了しているかを調べる時刻
+            wait (bool or array-like of bool): WaveGenEndFenceCmd の wait
+            terminate (bool or array-like of bool): WaveGenEndFenceCmd の terminate
+            stop_seq (bool or array-like of bool): シーケンサ停止フラグ
+            first_cmd_no (int): 最初のコマンドのコマンド番号.  以降のコマンドには連番を振る.
+
+        Returns:
+            SequencerProgram: コンパイルしたコマンド列
+        """
+        return cls.__from_timed_arrays(
+            WaveGenEndFenceCmd, cls.__to_unit_bits(awg_bits, AWG), AWG, end_times,
+            0, WaveGenEndFenceCmd.MAX_END_TIME, cls.__fence_flags(wait, terminate), stop_seq, first_cmd_no)
+
+
+    @classmethod
+    def concat(cls, programs: Iterable[SequencerProgram], *, first_cmd_no: int | None = 0) -> SequencerProgram:
+        """programs のコマンド列を順に連結する
+
+        Args:
+            programs (Iterable of SequencerProgram): 連結するプログラム
+            first_cmd_no (int): コマンド番号を first_cmd_no から順に振り直す.  None の場合は振り直さない.
+
+        Returns:
+            SequencerProgram: 連結したプログラム
+        """
+        images = [program.image for program in programs]
+        return cls.__from_image(np.concatenate(images) if images else np.empty(0, np.uint8), first_cmd_no)
+
+
+    @classmethod
+    def interleave(cls, *programs: SequencerProgram, first_cmd_no: int | None = 0) -> SequencerProgram:
+        """同じ長さの programs のコマンドを 1 つずつ交互に並べる
+
+        | 例えば 1 ショット分の AwgStartCmd と CaptureEndFenceCmd を交互に並べたタイムラインを作るのに使う.
+
+        Args:
+            *programs (SequencerProgram): 並べるプログラム.  全て同じ数のコマンドを持つこと.
+            first_cmd_no (int): コマンド番号を first_cmd_no から順に振り直す.  None の場合は振り直さない.
+
+        Returns:
+            SequencerProgram: コマンドを交互に並べたプログラム
+        """
+        if len({ len(program) for program in programs }) > 1:
+            raise ValueError('The programs to interleave must have the same number of commands.')
+        if not programs:
+            return cls.__from_image(np.empty(0, np.uint8), first_cmd_no)
+        stacked = np.stack([program.image.reshape(-1, cls.CMD_SIZE) for program in programs], axis = 1)
+        return cls.__from_image(stacked.reshape(-1), first_cmd_no)
+
+
+    @classmethod
+    def __from_image(cls, image: npt.NDArray[np.uint8], first_cmd_no: int | None) -> SequencerProgram:
+        if first_cmd_no is not None:
+            cls.__validate_first_cmd_no(first_cmd_no)
+        program = cls([], first_cmd_no = None)
+        program.__set_image(np.ascontiguousarray(image, dtype = np.uint8))
+        if first_cmd_no is not None:
+            program.renumber(first_cmd_no)
+        return program
+
+
+    @classmethod
+    def __to_unit_bits(cls, unit_bits: Any, unit_type: type[AWG] | type[CaptureUnit]) -> npt.NDArray[Any]:
+        if isinstance(unit_bits, unit_type):
+            unit_bits = [unit_bits]
+        if isinstance(unit_bits, (list, tuple)) and unit_bits and all(isinstance(v, unit_type) for v in unit_bits):
+            bit_field = 0
+            for unit_id in unit_bits:
+                bit_field |= 1 << unit_id
+            return np.asarray(bit_field)
+        return np.asarray(unit_bits)
+
+
+    @classmethod
+    def __fence_flags(cls, wait: npt.ArrayLike, terminate: npt.ArrayLike) -> npt.NDArray[np.uint8]:
+        # bit 0 : terminate,  bit 1 : wait
+        return (np.asarray(terminate, dtype = bool).astype(np.uint8) |
+                (np.asarray(wait, dtype = bool).astype(np.uint8) << 1))
+
+
+    @classmethod
+    def __from_timed_arrays(
+        cls,
+        cmd_type: type[SequencerCmd],
+        unit_bits: npt.NDArray[Any],
+        unit_type: type[AWG] | type[CaptureUnit],
+        times: npt.ArrayLike,
+        min_time: int,
+        max_time: int,
+        flags: npt.NDArray[np.uint8],
+        stop_seq: npt.ArrayLike,
+        first_cmd_no: int
+    ) -> SequencerProgram:
+        times = np.asarray(times)
+        stop_seq = np.asarray(stop_seq, dtype = bool)
+        try:
+            shape = np.broadcast_shapes(unit_bits.shape, times.shape, flags.shape, stop_seq.shape)
+        except ValueError:
+            raise ValueError('The lengths of the arrays must be the same.')
+        if len(shape) > 1:
+            raise ValueError('The arrays must be one-dimensional.')
+
+        # 空の配列は要素の型を決められない (np.asarray([]) は float64 になる) ので整数とみなす
+        if unit_bits.size == 0:
+            unit_bits = unit_bits.astype(np.int64)
+        if times.size == 0:
+            times = times.astype(np.int64)
+
+        valid_bits = 0
+        for unit_id in unit_type.all():
+            valid_bits |= 1 << unit_id
+        if not np.issubdtype(unit_bits.dtype, np.integer):
+            raise ValueError('Invalid {} bits.  ({})'.format(unit_type.__name__, unit_bits.dtype))
+        # uint64 と負の数の演算は OverflowError になるので, 範囲は Python の int で比べてから int64 にする
+        if unit_bits.size > 0 and ((int(unit_bits.min()) <= 0) or (int(unit_bits.max()) > valid_bits)):
+            raise ValueError('Invalid {} bits.  Each element must be a non-empty subset of 0x{:X}.'
+                             .format(unit_type.__name__, valid_bits))
+        unit_bits = unit_bits.astype(np.int64)
+        if np.any(unit_bits & ~valid_bits):
+            raise ValueError('Invalid {} bits.  Each element must be a non-empty subset of 0x{:X}.'
+                             .format(unit_type.__name__, valid_bits))
+        if not np.issubdtype(times.dtype, np.integer):
+            raise ValueError("The times must be integers.  ({})".format(times.dtype))
+        if times.size > 0 and ((int(times.max()) > max_time) or (min_time >= 0 and int(times.min()) < min_time)):
+            raise ValueError(
+                "The times of {} must be integers between {} and {} inclusive."
+                .format(cmd_type.__name__, min_time, max_time))
+        times = times.astype(np.int64)
+        if min_time < 0:
+            times = np.maximum(times, min_time)
+
+        num_cmds = shape[0] if shape else 1
+        records = np.zeros(num_cmds, dtype = cls.TIMED_CMD_DTYPE)
+        records['header'] = stop_seq.astype(np.uint8) | (cmd_type.ID << 1) # type: ignore
+        records['unit_bits'] = unit_bits
+        records['time'] = times
+        records['flags'] = flags
+        return cls.__from_image(records.view(np.uint8), first_cmd_no)
+
+
+    def __set_image(self, image: npt.NDArray[np.uint8]) -> None:
+        self.__image = image
+        self.__records = image.view(self.CMD_DTYPE)
+        self.__timed_records = image.view(self.TIMED_CMD_DTYPE)
+
+
+    def __getstate__(self) -> dict[str, Any]:
+        # ビューを別々に pickle するとイメージと共有されなくなるので, イメージだけを保存する
+        return { 'image' : self.__image.tobytes() }
+
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__set_image(np.frombuffer(state['image'], dtype = np.uint8).copy())
+
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+
+    def copy(self) -> SequencerProgram:
+        """イメージを複製した SequencerProgram を作る"""
+        return self.__from_image(self.__image.copy(), None)
+
+
+    def renumber(self, first_cmd_no: int) -> None:
+        """コマンド番号を first_cmd_no から順に振り直す.  SequencerCmd.MAX_CMD_NO の次は 0 に戻る."""
+        self.__validate_first_cmd_no(first_cmd_no)
+        self.__records['cmd_no'] = \
+            (first_cmd_no + np.arange(len(self), dtype = np.int64)) % (SequencerCmd.MAX_CMD_NO + 1)
+
+
+    def indices(self, cmd_type: type[SequencerCmd]) -> npt.NDArray[np.intp]:
+        """cmd_type のコマンドの, このプログラムの中での位置
+
+        Args:
+            cmd_type (type): コマンドのクラス (例 AwgStartCmd)
+
+        Returns:
+            numpy.ndarray: cmd_type のコマンドの位置の配列
+        """
+        return np.flatnonzero(self.cmd_ids == cmd_type.ID)
+
+
+    def get_times(self, cmd_type: type[SequencerCmd]) -> npt.NDArray[np.int64]:
+        """cmd_type のコマンドに指定された時刻を取得する
+
+        Args:
+            cmd_type (type): AwgStartCmd, CaptureEndFenceCmd, WaveGenEndFenceCmd のいずれか
+
+        Returns:
+            numpy.ndarray: cmd_type のコマンドに指定された時刻の配列.  AWG を即時スタートする場合は -1.
+        """
+        self.__validate_timed_cmd_type(cmd_type)
+        return self.__timed_records['time'][self.indices(cmd_type)]
+
+
+    def set_times(self, cmd_type: type[SequencerCmd], times: npt.ArrayLike) -> None:
+        """cmd_type の全てのコマンドの時刻をイメージ上で書き換える
+
+        | AwgStartCmd の場合は start_time, CaptureEndFenceCmd と WaveGenEndFenceCmd の場合は end_time を書き換える.
+
+        Args:
+            cmd_type (type): AwgStartCmd, CaptureEndFenceCmd, WaveGenEndFenceCmd のいずれか
+            times (int or array-like of int):
+                | 新しい時刻.  配列の場合, 要素数は cmd_type のコマンドの数と同じであること.
+                | AwgStartCmd の場合, 負の値は即時スタートを表す.
+        """
+        self.__validate_timed_cmd_type(cmd_type)
+        indices = self.indices(cmd_type)
+        times = np.broadcast_to(np.asarray(times), indices.shape)
+        if not np.issubdtype(times.dtype, np.integer):
+            raise ValueError("'times' must be integers.  ({})".format(times.dtype))
+
+        min_time = self.__MIN_TIMES[cmd_type]
+        max_time = cmd_type.MAX_START_TIME if cmd_type is AwgStartCmd else cmd_type.MAX_END_TIME # type: ignore
+        if times.size > 0 and ((times.max() > max_time) or (min_time >= 0 and times.min() < min_time)):
+            raise ValueError(
+                "The times of {} must be integers between {} and {} inclusive."
+                .format(cmd_type.__name__, min_time, max_time))
+
+        if cmd_type is AwgStartCmd:
+            times = np.maximum(times, AwgStartCmd.IMMEDIATE)
+        self.__timed_records['time'][indices] = times
+
+
+    @classmethod
+    def __validate_first_cmd_no(cls, first_cmd_no: int) -> None:
+        if not (isinstance(first_cmd_no, int) and (0 <= first_cmd_no <= SequencerCmd.MAX_CMD_NO)):
+            raise ValueError(
+                "'first_cmd_no' must be an integer between {} and {} inclusive.  '{}' was set."
+                .format(0, SequencerCmd.MAX_CMD_NO, first_cmd_no))
+
+
+    def __validate_timed_cmd_type(self, cmd_type: type[SequencerCmd]) -> None:
+        if cmd_type not in self.__MIN_TIMES:
+            raise ValueError('{} has no time field.'.format(cmd_type))
+
+
+    def serialize(self) -> bytes:
+        return self.__image.tobytes()
+
+
+    def size(self) -> int:
+        """serialize した際のバイト数"""
+        return self.__image.nbytes
+
+
+    @property
+    def image(self) -> npt.NDArray[np.uint8]:
+        """コマンド列のバイナリイメージ.  書き換えるとこのプログラムに反映される."""
+        return self.__image
+
+
+    @property
+    def records(self) -> npt.NDArray[Any]:
+        """イメージを CMD_DTYPE の構造化配列として見たビュー.  書き換えるとこのプログラムに反映される."""
+        return self.__records
+
+
+    @property
+    def timed_records(self) -> npt.NDArray[Any]:
+        """イメージを TIMED_CMD_DTYPE の構造化配列として見たビュー
+
+        | 時刻を指定するコマンド以外の要素は意味を持たない.  書き換えるとこのプログラムに反映される.
+        """
+        return self.__timed_records
+
+
+    @property
+    def cmd_ids(self) -> npt.NDArray[np.uint8]:
+        """各コマンドの種類を表す ID の配列"""
+        return self.__records['header'] >> 1
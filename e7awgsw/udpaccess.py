@@ -1,11 +1,15 @@
 from __future__ import annotations
+import time
 import socket
 import threading
+import numpy as np
 from typing import Final, Any
-from collections.abc import Sequence, Mapping
+from collections import deque
+from collections.abc import Sequence, Mapping, Iterable, Callable
 from logging import Logger
 from .uplpacket import UplPacket
 from .logger import log_error
+from .instrumentation import InstrumentCollector
 from .sequencercmd import \
     SequencerCmd, AwgStartCmd, CaptureEndFenceCmd, WaveSequenceSetCmd, CaptureParamSetCmd, \
     CaptureAddrSetCmd, FeedbackCalcOnClassificationCmd, WaveGenEndFenceCmd, \
@@ -16,6 +20,7 @@ from .sequencercmd import \
     CaptureParamSetCmdErr, CaptureAddrSetCmdErr, FeedbackCalcOnClassificationCmdErr, \
     WaveGenEndFenceCmdErr, ResponsiveFeedbackCmdErr, WaveSequenceSelectionCmdErr, \
     BranchByFlagCmdErr, AwgStartWithExtTrigAndClsValCmdErr
+from .sequencerprogram import SequencerProgram
 from .hwparam import CMD_ERR_REPORT_SIZE
 from .hwdefs import AWG, CaptureUnit
 
@@ -94,14 +99,21 @@ class AwgRegAccess(RegAccess):
     MIN_RW_SIZE: Final = 4 # bytes
     REG_SIZE: Final = 4 # bytes
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         udp_rw = UdpRw(
             ip_addr,
             port,
             self.MIN_RW_SIZE,
             UplPacket.MODE_AWG_REG_WRITE,
             UplPacket.MODE_AWG_REG_READ,
-            *loggers)
+            *loggers,
+            instrument = instrument)
 
         super().__init__(udp_rw, self.REG_SIZE)
 
@@ -111,14 +123,21 @@ class CaptureRegAccess(RegAccess):
     MIN_RW_SIZE: Final = 4 # bytes
     REG_SIZE: Final = 4 # bytes
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         udp_rw = UdpRw(
             ip_addr,
             port,
             self.MIN_RW_SIZE,
             UplPacket.MODE_CAPTURE_REG_WRITE,
             UplPacket.MODE_CAPTURE_REG_READ,
-            *loggers)
+            *loggers,
+            instrument = instrument)
 
         super().__init__(udp_rw, self.REG_SIZE)
 
@@ -128,14 +147,21 @@ class ParamRegistryAccess(RegAccess):
     MIN_RW_SIZE: Final = 32 # bytes
     REG_SIZE: Final = 4 # bytes
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         udp_rw = UdpRw(
             ip_addr,
             port,
             self.MIN_RW_SIZE,
             UplPacket.MODE_WAVE_RAM_WRITE,
             UplPacket.MODE_WAVE_RAM_READ,
-            *loggers)
+            *loggers,
+            instrument = instrument)
 
         super().__init__(udp_rw, self.REG_SIZE)
 
@@ -145,14 +171,21 @@ class SequencerRegAccess(RegAccess):
     MIN_RW_SIZE: Final = 4 # bytes
     REG_SIZE: Final = 4 # bytes
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         udp_rw = UdpRw(
             ip_addr,
             port,
             self.MIN_RW_SIZE,
             UplPacket.MODE_SEQUENCER_REG_WRITE,
             UplPacket.MODE_SEQUENCER_REG_READ,
-            *loggers)
+            *loggers,
+            instrument = instrument)
 
         super().__init__(udp_rw, self.REG_SIZE)
 
@@ -160,39 +193,71 @@ class SequencerRegAccess(RegAccess):
 class SequencerCmdSender(object):
 
     MIN_RW_SIZE: Final = 32 # bytes
+    # ACK を待たずに送るコマンドパケットの最大数.
+    # コマンド FIFO への書き込みは再送できず, ACK からどのパケットに対するものかも区別できないので,
+    # 複数のパケットを同時に送ると, 途中のパケットの消失や順序の入れ替わりで FIFO のコマンドが欠けたり入れ替わったりする.
+    # そのため 1 パケットずつ ACK を確認してから次のパケットを送る.
+    WINDOW_SIZE: Final = 1
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         self.__udp_rw = UdpRw(
             ip_addr,
             port,
             1,
             UplPacket.MODE_SEQUENCER_CMD_WRITE,
             UplPacket.MODE_OTHERS,
-            *loggers)
-
-
-    def send(self, cmd_list: Sequence[SequencerCmd]) -> None:
-        payload: Any = bytearray()
-        whole_size = 8
+            *loggers,
+            instrument = instrument,
+            # コマンド FIFO への書き込みは冪等でないので再送しない
+            retransmit_writes = False)
+
+
+    def send(self, cmd_list: Sequence[SequencerCmd] | SequencerProgram) -> None:
+        if isinstance(cmd_list, SequencerProgram):
+            self.__send_program(cmd_list)
+            return
+
+        # パケットの先頭 8 バイトはパケットに含まれるコマンドの数
+        max_packet_size = UdpRw.MAX_RW_SIZE
+        packet_buf = bytearray(max_packet_size)
+        payloads: list[bytes] = []
+        pos = 8
         num_cmds = 0
-        cmds = list(cmd_list)
-        while cmds:
-            cmd = cmds[0]
-            if (whole_size + cmd.size()) > UdpRw.MAX_RW_SIZE:
-                payload = num_cmds.to_bytes(8, 'little') + payload
-                self.__udp_rw.write(0, payload)
-                payload = bytearray()
-                whole_size = 8
+        for cmd in cmd_list:
+            cmd_bytes = cmd.serialize()
+            end = pos + len(cmd_bytes)
+            if end > max_packet_size:
+                packet_buf[0:8] = num_cmds.to_bytes(8, 'little')
+                payloads.append(bytes(packet_buf[:pos]))
+                pos = 8
                 num_cmds = 0
-            else:
-                payload.extend(cmd.serialize())
-                whole_size += cmd.size()
-                num_cmds += 1
-                cmds.pop(0)
-        
+                end = pos + len(cmd_bytes)
+            packet_buf[pos:end] = cmd_bytes
+            pos = end
+            num_cmds += 1
+
+        packet_buf[0:8] = num_cmds.to_bytes(8, 'little')
+        payloads.append(bytes(packet_buf[:pos]))
+        self.__udp_rw.write_pipelined(0, payloads, self.WINDOW_SIZE)
+
 
-        payload = num_cmds.to_bytes(8, 'little') + payload
-        self.__udp_rw.write(0, payload)
+    def __send_program(self, program: SequencerProgram) -> None:
+        """コンパイル済みのイメージをそのままパケットに分割して送る"""
+        image = memoryview(program.image)
+        cmds_per_packet = (UdpRw.MAX_RW_SIZE - 8) // program.CMD_SIZE
+        payloads = []
+        for first in range(0, max(len(program), 1), cmds_per_packet):
+            num_cmds = min(cmds_per_packet, len(program) - first)
+            payloads.append(
+                num_cmds.to_bytes(8, 'little') +
+                image[first * program.CMD_SIZE : (first + num_cmds) * program.CMD_SIZE])
+        self.__udp_rw.write_pipelined(0, payloads, self.WINDOW_SIZE)
 
 
     def close(self) -> None:
@@ -213,14 +278,21 @@ class WaveRamAccess(object):
 
     MIN_RW_SIZE: Final = 32 # bytes
 
-    def __init__(self, ip_addr: str, port: int, *loggers: Logger) -> None:
+    def __init__(
+        self,
+        ip_addr: str,
+        port: int,
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None
+    ) -> None:
         self.__udp_rw = UdpRw(
             ip_addr,
             port,
             self.MIN_RW_SIZE,
             UplPacket.MODE_WAVE_RAM_WRITE,
             UplPacket.MODE_WAVE_RAM_READ,
-            *loggers)
+            *loggers,
+            instrument = instrument)
 
 
     def write(self, addr: int, data: bytes) -> None:
@@ -236,16 +308,39 @@ class WaveRamAccess(object):
 
 
 class CmdErrReceiver(threading.Thread):
+    """シーケンサから送られるコマンドエラーレポートを受信するスレッド
 
-    BUFSIZE: Final = 16384 # bytes
+    | 受信したレポートは最大 max_reports 個まで保持する.  保持しているレポートが max_reports 個に達した後は,
+    | 古いレポートから捨てて, 捨てた数を num_dropped_reports に数える.
+    | add_callback で登録したコールバックは, 受信したパケットごとに, そのパケットに含まれるレポートのリストを引数としてこのスレッドから呼ばれる.
+    """
 
-    def __init__(self, my_ip_addr: str, *loggers: Logger) -> None:
+    BUFSIZE: Final = 16384 # bytes
+    #: 保持するコマンドエラーレポートの最大数のデフォルト値
+    MAX_REPORTS: Final = 65536
+
+    # コマンドエラーレポートの下位 64 ビットに全てのフィールドが含まれる
+    __REPORT_DTYPE: Final = np.dtype([('bit_field', '<u8'), ('reserved', '<u8')])
+    # ユニットのビットマスク -> ユニット ID のリスト
+    __awg_id_lists: dict[int, list[AWG]] = {}
+    __capture_unit_id_lists: dict[int, list[CaptureUnit]] = {}
+
+    def __init__(self, my_ip_addr: str, *loggers: Logger, max_reports: int | None = None) -> None:
+        """
+        Args:
+            my_ip_addr (str): コマンドエラーレポートを受信する IP アドレス
+            *loggers (Logger): エラーの出力先
+            max_reports (int): 保持するコマンドエラーレポートの最大数.  None の場合は MAX_REPORTS.
+        """
         #threading.Thread.__init__(self)
         super().__init__()
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.bind((my_ip_addr, 0))
         self.__rlock = threading.RLock()
-        self.__reports: list[SequencerCmdErr] = []
+        self.__max_reports = self.MAX_REPORTS if max_reports is None else max_reports
+        self.__reports: deque[SequencerCmdErr] = deque(maxlen = self.__max_reports)
+        self.__num_dropped_reports = 0
+        self.__callbacks: tuple[Callable[[list[SequencerCmdErr]], Any], ...] = ()
         self.__loggers = loggers
         self.__my_ip_addr = my_ip_addr
 
@@ -259,98 +354,136 @@ class CmdErrReceiver(threading.Thread):
                     return
 
                 payload = recv_packet.payload()[8:]
-                num_reports = len(payload) // CMD_ERR_REPORT_SIZE
+                reports = self.decode_reports(payload)
                 with self.__rlock:
-                    for i in range(num_reports):
-                        report_bytes = payload[i * CMD_ERR_REPORT_SIZE : (i + 1) * CMD_ERR_REPORT_SIZE]
-                        self.__reports.append(self.__gen_seq_cmd_err_from_bytes(report_bytes))
+                    num_overflows = len(self.__reports) + len(reports) - self.__max_reports
+                    if num_overflows > 0:
+                        self.__num_dropped_reports += num_overflows
+                    self.__reports.extend(reports)
+                    callbacks = self.__callbacks
+                for callback in callbacks:
+                    self.__call(callback, reports)
             except Exception as e:
                 log_error(e, *self.__loggers)
                 raise
 
-    @classmethod
-    def __gen_seq_cmd_err_from_bytes(cls, data: bytes) -> SequencerCmdErr:
-        bit_field = int.from_bytes(data, byteorder='little')
-        is_terminated = bool(bit_field & 0x1)
-        cmd_id = (bit_field >> 1) & 0x7F
-        cmd_no = (bit_field >> 8) & 0xFFFF
-        read_err = cls.__get_read_err(bit_field, cmd_id)
-        write_err = cls.__get_write_err(bit_field, cmd_id)
-        is_in_time = cls.__is_in_time(bit_field, cmd_id)
-        awg_id_bits = bit_field >> 24
-        awg_id_list = list(filter(lambda awg_id: awg_id_bits & (1 << awg_id), AWG.all()))
-        cap_unit_id_bits = bit_field >> 24
-        cap_unit_id_list = list(filter(
-            lambda cap_unit_id: cap_unit_id_bits & (1 << cap_unit_id), CaptureUnit.all()))
-        out_of_range_err = bool((bit_field >> 24) & 0x1)
-        cmd_counter = cls.__to_int32(bit_field >> 32)
-        timeout_err = bool((bit_field >> 42) & 0x1)
-
-        if cmd_id == AwgStartCmd.ID:
-            return AwgStartCmdErr(cmd_no, is_terminated, awg_id_list)
-        elif cmd_id == CaptureEndFenceCmd.ID:
-            return CaptureEndFenceCmdErr(cmd_no, is_terminated, cap_unit_id_list, is_in_time)
-        elif cmd_id == WaveSequenceSetCmd.ID:
-            return WaveSequenceSetCmdErr(cmd_no, is_terminated, read_err, write_err)
-        elif cmd_id == CaptureParamSetCmd.ID:
-            return CaptureParamSetCmdErr(cmd_no, is_terminated, read_err, write_err)
-        elif cmd_id == CaptureAddrSetCmd.ID:
-            return CaptureAddrSetCmdErr(cmd_no, is_terminated, write_err)
-        elif cmd_id == FeedbackCalcOnClassificationCmd.ID:
-            return FeedbackCalcOnClassificationCmdErr(cmd_no, is_terminated, read_err)
-        elif cmd_id == WaveGenEndFenceCmd.ID:
-            return WaveGenEndFenceCmdErr(cmd_no, is_terminated, awg_id_list, is_in_time)
-        elif cmd_id == ResponsiveFeedbackCmd.ID:
-            return ResponsiveFeedbackCmdErr(
-                cmd_no, is_terminated, awg_id_list, read_err, write_err)
-        elif cmd_id == WaveSequenceSelectionCmd.ID:
-            return WaveSequenceSelectionCmdErr(cmd_no, is_terminated)
-        elif cmd_id == BranchByFlagCmd.ID:
-            return BranchByFlagCmdErr(cmd_no, is_terminated, out_of_range_err, cmd_counter)
-        elif cmd_id == AwgStartWithExtTrigAndClsValCmd.ID:
-            return AwgStartWithExtTrigAndClsValCmdErr(
-                cmd_no, is_terminated, awg_id_list, read_err, write_err, timeout_err)
-
-        assert False, ('Invalid cmd err.  cmd_id = {}'.format(cmd_id))
+
+    def __call(self, callback: Callable[[list[SequencerCmdErr]], Any], reports: list[SequencerCmdErr]) -> None:
+        # コールバックの例外で受信を止めないように, 例外はログに出すだけにする
+        try:
+            callback(list(reports))
+        except Exception as e:
+            log_error(e, *self.__loggers)
 
 
     @classmethod
-    def __get_read_err(cls, bit_field: int, cmd_id: int) -> bool:
-        if (cmd_id == ResponsiveFeedbackCmd.ID or
-            cmd_id == AwgStartWithExtTrigAndClsValCmd.ID):
-            return bool((bit_field >> 40) & 0x1)
+    def decode_reports(cls, payload: bytes | memoryview) -> list[SequencerCmdErr]:
+        """コマンドエラーレポートを並べたバイト列をまとめてデコードする
+
+        Args:
+            payload (bytes or memoryview): CMD_ERR_REPORT_SIZE バイトのコマンドエラーレポートを並べたバイト列
+
+        Returns:
+            list of SequencerCmdErr: デコードしたコマンドエラーレポートのリスト
+        """
+        num_reports = len(payload) // CMD_ERR_REPORT_SIZE
+        bit_fields = np.frombuffer(
+            payload, dtype = cls.__REPORT_DTYPE, count = num_reports)['bit_field']
+        # 各フィールドを全レポート分まとめて取り出す
+        is_terminated = (bit_fields & 0x1).astype(bool).tolist()
+        cmd_ids = ((bit_fields >> 1) & 0x7F).tolist()
+        cmd_nos = ((bit_fields >> 8) & 0xFFFF).tolist()
+        unit_bits = ((bit_fields >> 24) & 0xFFFF).tolist()
+        bit24 = ((bit_fields >> 24) & 0x1).astype(bool).tolist()
+        bit25 = ((bit_fields >> 25) & 0x1).astype(bool).tolist()
+        bit34 = ((bit_fields >> 34) & 0x1).astype(bool).tolist()
+        bit40 = ((bit_fields >> 40) & 0x1).astype(bool).tolist()
+        bit41 = ((bit_fields >> 41) & 0x1).astype(bool).tolist()
+        bit42 = ((bit_fields >> 42) & 0x1).astype(bool).tolist()
+        cmd_counters = (bit_fields >> 32).astype(np.uint32).view(np.int32).tolist()
+
+        reports: list[SequencerCmdErr] = []
+        for i in range(num_reports):
+            cmd_id = cmd_ids[i]
+            cmd_no = cmd_nos[i]
+            terminated = is_terminated[i]
+            if cmd_id == AwgStartCmd.ID:
+                reports.append(AwgStartCmdErr(cmd_no, terminated, cls.__to_awg_id_list(unit_bits[i])))
+            elif cmd_id == CaptureEndFenceCmd.ID:
+                reports.append(CaptureEndFenceCmdErr(
+                    cmd_no, terminated, cls.__to_capture_unit_id_list(unit_bits[i]), not bit34[i]))
+            elif cmd_id == WaveSequenceSetCmd.ID:
+                reports.append(WaveSequenceSetCmdErr(cmd_no, terminated, bit24[i], bit25[i]))
+            elif cmd_id == CaptureParamSetCmd.ID:
+                reports.append(CaptureParamSetCmdErr(cmd_no, terminated, bit24[i], bit25[i]))
+            elif cmd_id == CaptureAddrSetCmd.ID:
+                reports.append(CaptureAddrSetCmdErr(cmd_no, terminated, bit25[i]))
+            elif cmd_id == FeedbackCalcOnClassificationCmd.ID:
+                reports.append(FeedbackCalcOnClassificationCmdErr(cmd_no, terminated, bit24[i]))
+            elif cmd_id == WaveGenEndFenceCmd.ID:
+                reports.append(WaveGenEndFenceCmdErr(
+                    cmd_no, terminated, cls.__to_awg_id_list(unit_bits[i]), not bit40[i]))
+            elif cmd_id == ResponsiveFeedbackCmd.ID:
+                reports.append(ResponsiveFeedbackCmdErr(
+                    cmd_no, terminated, cls.__to_awg_id_list(unit_bits[i]), bit40[i], bit41[i]))
+            elif cmd_id == WaveSequenceSelectionCmd.ID:
+                reports.append(WaveSequenceSelectionCmdErr(cmd_no, terminated))
+            elif cmd_id == BranchByFlagCmd.ID:
+                reports.append(BranchByFlagCmdErr(cmd_no, terminated, bit24[i], cmd_counters[i]))
+            elif cmd_id == AwgStartWithExtTrigAndClsValCmd.ID:
+                reports.append(AwgStartWithExtTrigAndClsValCmdErr(
+                    cmd_no, terminated, cls.__to_awg_id_list(unit_bits[i]), bit40[i], bit41[i], bit42[i]))
+            else:
+                assert False, ('Invalid cmd err.  cmd_id = {}'.format(cmd_id))
+        return reports
+
 
-        return bool((bit_field >> 24) & 0x1)
+    @classmethod
+    def __to_awg_id_list(cls, bits: int) -> list[AWG]:
+        awg_id_list = cls.__awg_id_lists.get(bits)
+        if awg_id_list is None:
+            awg_id_list = [awg_id for awg_id in AWG.all() if bits & (1 << awg_id)]
+            cls.__awg_id_lists[bits] = awg_id_list
+        return awg_id_list
 
 
     @classmethod
-    def __get_write_err(cls, bit_field: int, cmd_id: int) -> bool:
-        if (cmd_id == ResponsiveFeedbackCmd.ID or
-            cmd_id == AwgStartWithExtTrigAndClsValCmd.ID):
-            return bool((bit_field >> 41) & 0x1)
+    def __to_capture_unit_id_list(cls, bits: int) -> list[CaptureUnit]:
+        capture_unit_id_list = cls.__capture_unit_id_lists.get(bits)
+        if capture_unit_id_list is None:
+            capture_unit_id_list = [
+                cap_unit_id for cap_unit_id in CaptureUnit.all() if bits & (1 << cap_unit_id)]
+            cls.__capture_unit_id_lists[bits] = capture_unit_id_list
+        return capture_unit_id_list
 
-        return bool((bit_field >> 25) & 0x1)
 
+    def pop_err_reports(self) -> list[SequencerCmdErr]:
+        with self.__rlock:
+            tmp = list(self.__reports)
+            self.__reports.clear()
+            return tmp
 
-    @classmethod
-    def __is_in_time(cls, bit_field: int, cmd_id: int) -> bool:
-        if cmd_id == CaptureEndFenceCmd.ID:
-            return not bool((bit_field >> 34) & 0x1)
 
-        return not bool((bit_field >> 40) & 0x1)
+    def add_callback(self, callback: Callable[[list[SequencerCmdErr]], Any]) -> None:
+        """コマンドエラーレポートを受信したときに呼ぶ関数を登録する"""
+        with self.__rlock:
+            self.__callbacks = self.__callbacks + (callback,)
 
 
-    @classmethod
-    def __to_int32(self, val: int) -> int:
-        val = val & 0xffffffff
-        return (val ^ 0x80000000) - 0x80000000
+    def remove_callback(self, callback: Callable[[list[SequencerCmdErr]], Any]) -> None:
+        """add_callback で登録した関数を登録解除する.  登録されていない場合は何もしない."""
+        with self.__rlock:
+            callbacks = list(self.__callbacks)
+            if callback in callbacks:
+                callbacks.remove(callback)
+            self.__callbacks = tuple(callbacks)
 
 
-    def pop_err_reports(self) -> list[SequencerCmdErr]:
+    @property
+    def num_dropped_reports(self) -> int:
+        """保持できる数を超えたために捨てたコマンドエラーレポートの数"""
         with self.__rlock:
-            tmp = self.__reports
-            self.__reports = []
-            return tmp
+            return self.__num_dropped_reports
 
 
     def stop(self) -> None:
@@ -390,27 +523,31 @@ class UdpRouter(threading.Thread):
         super().__init__()
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.bind((my_ip_addr, 0))
-        self.__table = dict(table)
-        self.__rlock = threading.RLock()
+        # 転送スレッドはロックを取らずに参照するので, 更新時は新しい dict を作って置き換える
+        self.__table: dict[int, tuple[str, int]] = dict(table)
+        self.__lock = threading.Lock()
         self.__loggers = loggers
         self.__my_ip_addr = my_ip_addr
     
 
     def run(self) -> None:
+        # 受信バッファは使い回し, 先頭のモードだけを見て, 受信したバイト列をそのまま転送する
+        buf = bytearray(self.BUFSIZE)
+        view = memoryview(buf)
         while True:
             try:
-                recv_data, _ = self.__sock.recvfrom(self.BUFSIZE)
-                recv_packet = UplPacket.deserialize(recv_data)
-                if recv_packet.mode() == UplPacket.MODE_OTHERS:
+                num_bytes = self.__sock.recv_into(buf)
+                if num_bytes == 0:
+                    continue
+                mode = buf[0]
+                if mode == UplPacket.MODE_OTHERS:
                     return
 
-                with self.__rlock:
-                    if recv_packet.mode() in self.__table:
-                        addr = self.__table[recv_packet.mode()]
-                    else:
-                        continue
-                
-                self.__sock.sendto(recv_data, addr)
+                addr = self.__table.get(mode)
+                if addr is None:
+                    continue
+
+                self.__sock.sendto(view[:num_bytes], addr)
             except Exception as e:
                 log_error(e, *self.__loggers)
                 raise
@@ -425,8 +562,10 @@ class UdpRouter(threading.Thread):
 
 
     def add_entry(self, packet_mode: int, ip_addr: str, port: int) -> None:
-        with self.__rlock:
-            self.__table[packet_mode] = (ip_addr, port)
+        with self.__lock:
+            table = dict(self.__table)
+            table[packet_mode] = (ip_addr, port)
+            self.__table = table
 
 
     def close(self) -> None:
@@ -443,12 +582,150 @@ class UdpRouter(threading.Thread):
         return self.__sock.getsockname()[1]
 
 
+# 要求パケットのモード -> 応答パケットのモード
+_REPLY_MODES: Final = {
+    UplPacket.MODE_WAVE_RAM_READ : UplPacket.MODE_WAVE_RAM_READ_REPLY,
+    UplPacket.MODE_WAVE_RAM_WRITE : UplPacket.MODE_WAVE_RAM_WRITE_ACK,
+    UplPacket.MODE_AWG_REG_READ : UplPacket.MODE_AWG_REG_READ_REPLY,
+    UplPacket.MODE_AWG_REG_WRITE : UplPacket.MODE_AWG_REG_WRITE_ACK,
+    UplPacket.MODE_CAPTURE_REG_READ : UplPacket.MODE_CAPTURE_REG_READ_REPLY,
+    UplPacket.MODE_CAPTURE_REG_WRITE : UplPacket.MODE_CAPTURE_REG_WRITE_ACK,
+    UplPacket.MODE_SEQUENCER_REG_READ : UplPacket.MODE_SEQUENCER_REG_READ_REPLY,
+    UplPacket.MODE_SEQUENCER_REG_WRITE : UplPacket.MODE_SEQUENCER_REG_WRITE_ACK,
+    UplPacket.MODE_SEQUENCER_CMD_WRITE : UplPacket.MODE_SEQUENCER_CMD_WRITE_ACK,
+}
+
+
+class RttEstimator(object):
+    """送信先ごとに RTT を推定し, 再送タイムアウト (RTO) を求めるクラス
+
+    | RFC 6298 と同じく, 平滑化した RTT (SRTT) と RTT の変動 (RTTVAR) から RTO = SRTT + 4 * RTTVAR とする.
+    """
+
+    INITIAL_RTO: Final = 0.2 # sec
+    MIN_RTO: Final = 0.02 # sec
+    MAX_RTO: Final = 2.0 # sec
+    __ALPHA: Final = 1 / 8
+    __BETA: Final = 1 / 4
+    __K: Final = 4
+
+    __estimators: dict[tuple[str, int], RttEstimator] = {}
+    __estimators_lock = threading.Lock()
+
+    @classmethod
+    def of(cls, dest_addr: tuple[str, int]) -> RttEstimator:
+        """dest_addr に対する RttEstimator を取得する.  同じ送信先に対しては同じオブジェクトを返す."""
+        with cls.__estimators_lock:
+            estimator = cls.__estimators.get(dest_addr)
+            if estimator is None:
+                estimator = cls()
+                cls.__estimators[dest_addr] = estimator
+            return estimator
+
+
+    def __init__(self) -> None:
+        self.__srtt: float | None = None
+        self.__rttvar = 0.0
+        self.__rto = self.INITIAL_RTO
+        self.__lock = threading.Lock()
+
+
+    def update(self, rtt: float) -> None:
+        """再送せずに応答を受け取った要求の RTT で推定値を更新する"""
+        with self.__lock:
+            if self.__srtt is None:
+                self.__srtt = rtt
+                self.__rttvar = rtt / 2
+            else:
+                self.__rttvar = (1 - self.__BETA) * self.__rttvar + self.__BETA * abs(self.__srtt - rtt)
+                self.__srtt = (1 - self.__ALPHA) * self.__srtt + self.__ALPHA * rtt
+            rto = self.__srtt + self.__K * self.__rttvar
+            self.__rto = min(max(rto, self.MIN_RTO), self.MAX_RTO)
+
+
+    @property
+    def srtt(self) -> float | None:
+        """平滑化した RTT (sec).  RTT を 1 度も計測していない場合は None."""
+        return self.__srtt
+
+
+    @property
+    def rto(self) -> float:
+        """再送タイムアウト (sec)"""
+        return self.__rto
+
+
+class _DuplicateReplies(object):
+    """完了した要求の応答のタグを記録し, 以前の要求に対して遅れて届いた応答を見分けるクラス
+
+    | 応答のタグは (応答パケットのモード, アドレス, サイズ) とする.
+    | 再送した要求に対する 2 つ目以降の応答のように後から届くと分かっている応答は, 最後の送信から再送タイムアウトまでの間,
+    | タグごとに数えておき, 新しい要求と同じタグであっても以前の要求に対する応答とみなす.
+    | 同じタグの新しい要求は, wait_until で得られる時刻まで送信を待つことで, 以前の要求に対する応答と取り違えないようにする.
+    | また, 完了から一定期間内に届いた完了済みの要求と同じタグの応答は, 新しい要求とタグが異なれば,
+    | 経路上で複製された以前の要求に対する応答とみなす.
+    | スレッドセーフではないので, 呼び出し元で排他すること.
+    """
+
+    # 要求が完了してから, 経路上で複製されたその応答が届くとみなす期間 (sec)
+    __LIFETIME: Final = RttEstimator.MAX_RTO
+    # 期限切れの記録を消去する間隔 (sec)
+    __PURGE_INTERVAL: Final = 1.0
+
+    def __init__(self) -> None:
+        # 応答のタグ -> [後から届く応答の数, 後から届く応答を待つ期限, 記録の期限]
+        self.__entries: dict[tuple[int, int, int], list[Any]] = {}
+        self.__next_purge = 0.0
+
+
+    def add(self, tag: tuple[int, int, int], num_late_replies: int, late_until: float, now: float) -> None:
+        """tag の要求が完了したことと, その応答が late_until までに num_late_replies 個遅れて届くかもしれないことを記録する"""
+        if now >= self.__next_purge:
+            for expired_tag in [key for key, entry in self.__entries.items() if entry[2] < now]:
+                del self.__entries[expired_tag]
+            self.__next_purge = now + self.__PURGE_INTERVAL
+        entry = self.__entries.get(tag)
+        if (entry is None) or (entry[1] < now):
+            entry = [0, late_until, 0.0]
+            self.__entries[tag] = entry
+        if num_late_replies > 0:
+            entry[0] += num_late_replies
+            entry[1] = max(entry[1], late_until)
+        entry[2] = max(late_until, now) + self.__LIFETIME
+
+
+    def wait_until(self, tag: tuple[int, int, int], now: float) -> float | None:
+        """tag の以前の要求に対する応答が後から届くかもしれない場合, その応答を待つ期限を返す.  そうでなければ None を返す."""
+        entry = self.__entries.get(tag)
+        if (entry is None) or (entry[0] == 0) or (entry[1] < now):
+            return None
+        return entry[1]
+
+
+    def is_duplicate(self, tag: tuple[int, int, int], exp_tag: tuple[int, int, int] | None, now: float) -> bool:
+        """tag の応答が以前の要求に対するものであれば True を返す
+
+        Args:
+            tag (tuple of int): 受け取った応答のタグ
+            exp_tag (tuple of int): 応答を待っている要求のタグ.  無い場合は None.
+            now (float): 現在時刻 (time.perf_counter の値)
+        """
+        entry = self.__entries.get(tag)
+        if entry is None:
+            return False
+        if (entry[0] > 0) and (now <= entry[1]):
+            entry[0] -= 1
+            return True
+        return (tag != exp_tag) and (now <= entry[2])
+
+
 class UdpRw(object):
 
     BUFSIZE: Final = 16384 # bytes
     #MAX_RW_SIZE: Final = 3616 # bytes
     MAX_RW_SIZE: Final = 1440 # bytes
-    TIMEOUT: Final = 25 # sec
+    TIMEOUT: Final = 25 # sec.  再送を含めて, 1 つの要求に対する応答を待つ時間の上限.
+    MAX_RETRIES: Final = 8 # 要求パケットの最大再送回数のデフォルト値
 
     def __init__(self,
         ip_addr: str,
@@ -456,8 +733,25 @@ class UdpRw(object):
         min_rw_size: int,
         wr_mode_id: int,
         rd_mode_id: int,
-        *loggers: Logger
+        *loggers: Logger,
+        instrument: InstrumentCollector | None = None,
+        max_retries: int | None = None,
+        retransmit_writes: bool = True
     ) -> None:
+        """
+        Args:
+            ip_addr (str): 要求パケットの送信先 IP アドレス
+            port (int): 要求パケットの送信先ポート
+            min_rw_size (int): 1 回の読み書きの最小単位 (bytes)
+            wr_mode_id (int): 書き込み要求パケットのモード ID
+            rd_mode_id (int): 読み出し要求パケットのモード ID
+            *loggers (Logger): エラーの出力先
+            instrument (InstrumentCollector): UDP アクセスを記録するオブジェクト
+            max_retries (int): 要求パケットの最大再送回数.  None の場合は MAX_RETRIES.
+            retransmit_writes (bool):
+                | True -> 書き込み要求パケットも再送する.
+                | False -> 書き込み要求パケットは再送しない.  同じアドレスへの書き込みが冪等でない場合に指定する.
+        """
         self.__dest_addr = (ip_addr, port)
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.settimeout(self.TIMEOUT)
@@ -466,6 +760,14 @@ class UdpRw(object):
         self.__wr_mode_id = wr_mode_id
         self.__rd_mode_id = rd_mode_id
         self.__loggers = loggers
+        # 複数のスレッドが同じソケットを使うとき, 要求と応答の組が入れ替わらないように排他する
+        self.__rlock = threading.RLock()
+        self.__instrument = instrument
+        self.__max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+        self.__retransmit_writes = retransmit_writes
+        self.__rtt_estimator = RttEstimator.of(self.__dest_addr)
+        # ソケットに遅れて届く, 以前の要求に対する応答
+        self.__duplicates = _DuplicateReplies()
  
 
     def write(self, addr: int, data: bytes) -> None:
@@ -479,6 +781,93 @@ class UdpRw(object):
             size_remaining -= size_to_send
 
 
+    def write_pipelined(self, addr: int, payloads: Sequence[bytes], window: int) -> None:
+        """payloads をそれぞれ 1 つの書き込み要求パケットにして, 応答を待たずに最大 window 個まで続けて送る
+
+        | 全てのパケットを addr に書き込む.  アドレスとデータの端数調整と要求パケットの再送は行わない.
+        | コマンド FIFO のように, 同じアドレスに続けてデータを書き込む場合に使う.
+        | エラー応答を受け取った場合は, 残りのパケットを送らずに例外を発生させる.
+        | window が 2 以上の場合, 途中のパケットが失われたり順序が入れ替わったりしても後続のパケットは書き込まれる.
+        | 書き込む順序に意味がある場合は window を 1 にすること.
+        | 例外が発生した場合, 書き込み先にどのパケットが書き込まれたかは不定である.
+        | コマンド FIFO の場合は, clear_commands でコマンドキューを空にしてから送り直すこと.
+
+        Args:
+            addr (int): 書き込み先のアドレス
+            payloads (list of bytes): 各書き込み要求パケットのデータ.  それぞれ MAX_RW_SIZE 以下であること.
+            window (int): 応答を待たずに送る要求パケットの最大数
+        """
+        send_packets = [UplPacket(self.__wr_mode_id, addr, len(payload), payload) for payload in payloads]
+        try:
+            rtts, error = self.__write_pipelined(send_packets, window)
+            if error is not None:
+                recv_packet, recv_data, dev_addr = error
+                raise ValueError(self.__gen_err_msg(
+                    'upl write err', dev_addr, recv_data,
+                    addr, None, recv_packet.addr(), recv_packet.num_bytes()))
+        except socket.timeout as e:
+            log_error('{},  Dest {}'.format(e, self.__dest_addr), *self.__loggers)
+            raise
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            raise
+
+        if self.__instrument is not None:
+            for packet, rtt in zip(send_packets, rtts):
+                self.__instrument.record_access(packet.mode(), addr, packet.num_bytes(), rtt, 0)
+
+
+    def __write_pipelined(
+        self,
+        send_packets: list[UplPacket],
+        window: int
+    ) -> tuple[list[float], tuple[UplPacket, bytes, tuple[str, int]] | None]:
+        """send_packets を応答を待たずに最大 window 個まで続けて送り, 各パケットの RTT と最初のエラー応答を返す"""
+        exp_mode = _REPLY_MODES[self.__wr_mode_id]
+        addr = send_packets[0].addr()
+        # 応答を待っているパケットのサイズ -> パケットの数
+        outstanding = dict.fromkeys((packet.num_bytes() for packet in send_packets), 0)
+        send_times: list[float] = []
+        rtts: list[float] = []
+        with self.__rlock:
+            self.__discard_stale_replies()
+            for num_bytes in outstanding:
+                self.__wait_for_late_replies((exp_mode, addr, num_bytes))
+            deadline = time.perf_counter() + self.TIMEOUT
+            try:
+                while len(rtts) < len(send_packets):
+                    while (len(send_times) < len(send_packets)) and (len(send_times) - len(rtts) < window):
+                        packet = send_packets[len(send_times)]
+                        outstanding[packet.num_bytes()] += 1
+                        self.__sock.sendto(packet.serialize(), self.__dest_addr)
+                        send_times.append(time.perf_counter())
+
+                    now = time.perf_counter()
+                    if now >= deadline:
+                        raise socket.timeout('timed out waiting for {} acks'.format(len(send_times) - len(rtts)))
+                    self.__sock.settimeout(deadline - now)
+                    try:
+                        recv_data, dev_addr = self.__sock.recvfrom(self.BUFSIZE)
+                    except socket.timeout:
+                        continue
+                    recv_packet = UplPacket.deserialize(recv_data)
+                    recv_tag = (recv_packet.mode(), recv_packet.addr(), recv_packet.num_bytes())
+                    if (recv_tag[0] == exp_mode) and (recv_tag[1] == addr) and (outstanding.get(recv_tag[2], 0) > 0):
+                        outstanding[recv_tag[2]] -= 1
+                        now = time.perf_counter()
+                        rtts.append(now - send_times[len(rtts)])
+                        deadline = now + self.TIMEOUT
+                    elif not self.__duplicates.is_duplicate(recv_tag, None, time.perf_counter()):
+                        return rtts, (recv_packet, recv_data, dev_addr)
+            finally:
+                # ACK を受け取っていない要求パケットに対する ACK は, 後から届くかもしれない
+                now = time.perf_counter()
+                late_until = now + self.__rtt_estimator.rto
+                for num_bytes, num_late_replies in outstanding.items():
+                    self.__duplicates.add((exp_mode, addr, num_bytes), num_late_replies, late_until, now)
+        return rtts, None
+
+
     def __send_data(self, addr: int, data: bytes) -> None:
         # アドレス端数調整
         frac_len = addr % self.__min_rw_size
@@ -497,10 +886,9 @@ class UdpRw(object):
 
         try:
             send_packet = UplPacket(self.__wr_mode_id, addr, len(data), data)
-            self.__sock.sendto(send_packet.serialize(), self.__dest_addr)
-            recv_data, dev_addr = self.__sock.recvfrom(self.BUFSIZE)
-            recv_packet = UplPacket.deserialize(recv_data)
-            if (recv_packet.num_bytes() != len(data)) or (recv_packet.addr() != addr):
+            recv_packet, recv_data, dev_addr, matched = self.__transact(
+                send_packet, addr, len(data), self.__retransmit_writes)
+            if not matched:
                 err_msg = self.__gen_err_msg(
                     'upl write err', dev_addr, recv_data,
                     addr, len(data), recv_packet.addr(), recv_packet.num_bytes())
@@ -524,7 +912,7 @@ class UdpRw(object):
         return rd_data
 
 
-    def __recv_data(self, addr: int, size: int) -> bytes:
+    def __recv_data(self, addr: int, size: int) -> bytes | memoryview:
         # 端数調整
         rd_addr = addr // self.__min_rw_size * self.__min_rw_size
         rd_offset = addr - rd_addr
@@ -533,10 +921,8 @@ class UdpRw(object):
 
         try:
             send_packet = UplPacket(self.__rd_mode_id, rd_addr, rd_size)
-            self.__sock.sendto(send_packet.serialize(), self.__dest_addr)
-            recv_data, dev_addr = self.__sock.recvfrom(self.BUFSIZE)
-            recv_packet = UplPacket.deserialize(recv_data)
-            if (recv_packet.num_bytes() != rd_size) or (recv_packet.addr() != rd_addr):
+            recv_packet, recv_data, dev_addr, matched = self.__transact(send_packet, rd_addr, rd_size, True)
+            if not matched:
                 err_msg = self.__gen_err_msg(
                     'upl read err', dev_addr, recv_data,
                     addr, rd_size, recv_packet.addr(), recv_packet.num_bytes())
@@ -551,18 +937,122 @@ class UdpRw(object):
         return recv_packet.payload()[rd_offset : rd_offset + size]
 
 
+    def __transact(
+        self,
+        send_packet: UplPacket,
+        exp_addr: int,
+        exp_num_bytes: int,
+        retransmit: bool
+    ) -> tuple[UplPacket, bytes, tuple[str, int], bool]:
+        """要求パケットを送って, アドレスとサイズが一致する応答パケットを受け取る
+
+        | 再送タイムアウトまでに応答が無い場合, retransmit が True であれば要求パケットを再送する.
+        | 再送した要求や, タイムアウトした要求に対して遅れて届いた応答パケットは読み捨てる.
+        | それ以外のモード, アドレス, サイズが一致しない応答パケットは, この要求へのエラー応答としてすぐに返す.
+
+        Returns:
+            | (応答パケット, 応答パケットのバイト列, 応答パケットの送信元アドレス, 一致する応答を受け取ったかどうか)
+        """
+        max_retries = self.__max_retries if retransmit else 0
+        send_data = send_packet.serialize()
+        exp_tag = (_REPLY_MODES[send_packet.mode()], exp_addr, exp_num_bytes)
+        with self.__rlock:
+            # 再送や経路上での複製によって遅れて届いた応答を, この要求の応答と取り違えないようにする
+            self.__discard_stale_replies()
+            self.__wait_for_late_replies(exp_tag)
+            start = time.perf_counter()
+            deadline = start + self.TIMEOUT
+            rto = self.__rtt_estimator.rto
+            num_retries = 0
+            last_sent = start
+            num_answered = 0
+            self.__sock.sendto(send_data, self.__dest_addr)
+            try:
+                while True:
+                    now = time.perf_counter()
+                    wait_until = min(last_sent + rto, deadline) if num_retries < max_retries else deadline
+                    if now >= wait_until:
+                        if now >= deadline:
+                            raise socket.timeout('timed out after {} retries'.format(num_retries))
+                        self.__sock.sendto(send_data, self.__dest_addr)
+                        num_retries += 1
+                        last_sent = now
+                        rto = min(rto * 2, RttEstimator.MAX_RTO)
+                        continue
+
+                    self.__sock.settimeout(wait_until - now)
+                    try:
+                        recv_data, dev_addr = self.__sock.recvfrom(self.BUFSIZE)
+                    except socket.timeout:
+                        continue
+                    recv_packet = UplPacket.deserialize(recv_data)
+                    recv_tag = (recv_packet.mode(), recv_packet.addr(), recv_packet.num_bytes())
+                    if self.__duplicates.is_duplicate(recv_tag, exp_tag, time.perf_counter()):
+                        continue
+                    num_answered = 1
+                    if recv_tag != exp_tag:
+                        return recv_packet, recv_data, dev_addr, False
+                    break
+            finally:
+                # 応答を受け取っていない送信に対する応答は, 後から届くかもしれない
+                self.__duplicates.add(
+                    exp_tag, num_retries + 1 - num_answered, last_sent + rto, time.perf_counter())
+
+            rtt = time.perf_counter() - start
+            # 再送した要求の RTT はどの送信に対する応答か分からないので推定に使わない
+            if num_retries == 0:
+                self.__rtt_estimator.update(rtt)
+
+        if self.__instrument is not None:
+            self.__instrument.record_access(
+                send_packet.mode(), exp_addr, exp_num_bytes, rtt, num_retries)
+        return recv_packet, recv_data, dev_addr, True
+
+
+    def __discard_stale_replies(self) -> None:
+        """受信バッファに残っている, 以前の要求に対する応答パケットを読み捨てる"""
+        # 受信時には毎回タイムアウトを設定し直すので, ここではノンブロッキングにしたままでよい
+        self.__sock.settimeout(0.0)
+        now = time.perf_counter()
+        try:
+            while True:
+                recv_data, _ = self.__sock.recvfrom(self.BUFSIZE)
+                recv_packet = UplPacket.deserialize(recv_data)
+                self.__duplicates.is_duplicate(
+                    (recv_packet.mode(), recv_packet.addr(), recv_packet.num_bytes()), None, now)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+
+    def __wait_for_late_replies(self, tag: tuple[int, int, int]) -> None:
+        """tag が同じ以前の要求に対する応答が後から届くかもしれない場合, それが届くか期限が過ぎるまで受信して読み捨てる"""
+        while True:
+            now = time.perf_counter()
+            wait_until = self.__duplicates.wait_until(tag, now)
+            if wait_until is None:
+                return
+            self.__sock.settimeout(max(wait_until - now, 1e-6))
+            try:
+                recv_data, _ = self.__sock.recvfrom(self.BUFSIZE)
+            except socket.timeout:
+                return
+            recv_packet = UplPacket.deserialize(recv_data)
+            self.__duplicates.is_duplicate(
+                (recv_packet.mode(), recv_packet.addr(), recv_packet.num_bytes()), None, time.perf_counter())
+
+
     def __gen_err_msg(
         self,
         summary: str,
         devie_ip_addr: str,
         recv_data: object,
         exp_addr: int,
-        exp_data_len: int,
+        exp_data_len: int | None,
         actual_addr: int,
         actual_data_len: int
     ) -> str:
         msg = '{}\n'.format(summary)
-        msg += '  Server IP / Port : {}\n'.format(self.__sock.getsockname())
+        msg += '  Server IP / Port : {}\n'.format((self.my_ip_addr, self.my_port))
         msg += '  Target IP / Port : {}\n'.format(self.__dest_addr)
         msg += '  Device IP / Port : {}\n'.format(devie_ip_addr)
         msg += '  recv data : {}\n'.format(recv_data)
@@ -1,7 +1,17 @@
+from __future__ import annotations
+
+import struct
 from typing_extensions import Self
 from typing import Final
 
 class UplPacket(object):
+    """UPL パケット
+
+    | パケットは 8 バイトのヘッダ (モード 1 バイト, アドレス 5 バイト, データサイズ 2 バイト, 全てビッグエンディアン) とペイロードからなる.
+    | deserialize で作ったパケットのペイロードは, 受信したバイト列をコピーせずに参照する memoryview になる.
+    """
+
+    __slots__ = ('__mode', '__addr', '__num_bytes', '__payload')
 
     MODE_WAVE_RAM_READ: Final       = 0x00
     MODE_WAVE_RAM_READ_REPLY: Final = 0x01
@@ -28,12 +38,53 @@ class UplPacket(object):
 
     MODE_OTHERS: Final = 0xFF
 
+    #: ヘッダのサイズ (bytes)
+    HEADER_SIZE: Final = 8
+    # モード, アドレスの上位 8 ビット, アドレスの下位 32 ビット, データサイズ
+    __HEADER: Final = struct.Struct('>BBIH')
+
+    # ペイロードを持つパケットのモード
+    __PAYLOAD_MODES: Final = frozenset([
+        MODE_AWG_REG_READ_REPLY,
+        MODE_CAPTURE_REG_READ_REPLY,
+        MODE_WAVE_RAM_READ_REPLY,
+        MODE_AWG_REG_WRITE,
+        MODE_CAPTURE_REG_WRITE,
+        MODE_WAVE_RAM_WRITE,
+        MODE_SEQUENCER_REG_READ_REPLY,
+        MODE_SEQUENCER_REG_WRITE,
+        MODE_SEQUENCER_CMD_WRITE,
+        MODE_SEQUENCER_CMD_ERR_REPORT])
+
+    __MODE_NAMES: Final = {
+        MODE_WAVE_RAM_READ : "WAVE RAM READ",
+        MODE_WAVE_RAM_WRITE : "WAVE RAM WRITE",
+        MODE_WAVE_RAM_WRITE_ACK : "WAVE RAM WRITE-ACK",
+        MODE_WAVE_RAM_READ_REPLY : "WAVE RAM READ-REPLY",
+        MODE_AWG_REG_READ : "AWG REG READ",
+        MODE_AWG_REG_WRITE : "AWG REG WRITE",
+        MODE_AWG_REG_WRITE_ACK : "AWG REG WRITE-ACK",
+        MODE_AWG_REG_READ_REPLY : "AWG REG READ-REPLY",
+        MODE_CAPTURE_REG_READ : "CAPTURE REG READ",
+        MODE_CAPTURE_REG_WRITE : "CAPTURE REG WRITE",
+        MODE_CAPTURE_REG_WRITE_ACK : "CAPTURE REG WRITE-ACK",
+        MODE_CAPTURE_REG_READ_REPLY : "CAPTURE REG READ-REPLY",
+        MODE_SEQUENCER_REG_READ : "SEQUENCER REG READ",
+        MODE_SEQUENCER_REG_WRITE : "SEQUENCER REG WRITE",
+        MODE_SEQUENCER_REG_WRITE_ACK : "SEQUENCER REG WRITE-ACK",
+        MODE_SEQUENCER_REG_READ_REPLY : "SEQUENCER REG READ-REPLY",
+        MODE_SEQUENCER_CMD_WRITE : "SEQUENCER CMD WRITE",
+        MODE_SEQUENCER_CMD_WRITE_ACK : "SEQUENCER CMD WRITE-ACK",
+        MODE_SEQUENCER_CMD_ERR_REPORT : "SEQUENCER CMD ERR REPORT",
+        MODE_OTHERS : "OTHERS",
+    }
+
     def __init__(
         self,
         mode: int,
         addr: int,
         num_bytes: int,
-        payload: bytes = b''
+        payload: bytes | bytearray | memoryview = b''
     ) -> None:
         self.__mode = mode
         self.__num_bytes = num_bytes
@@ -50,59 +101,35 @@ class UplPacket(object):
     def addr(self) -> int:
         return self.__addr
 
-    def payload(self) -> bytes:
+    def payload(self) -> bytes | bytearray | memoryview:
         return self.__payload
 
+    def size(self) -> int:
+        """シリアライズしたときのバイト数"""
+        return self.HEADER_SIZE + len(self.__payload)
+
     def serialize(self) -> bytes:
-        data = bytearray()
-        data += self.__mode.to_bytes(1, "big")
-        data += self.__addr.to_bytes(5, "big")
-        data += self.__num_bytes.to_bytes(2, "big")
-        data += self.__payload
-        return data
+        return self.__HEADER.pack(
+            self.__mode, self.__addr >> 32, self.__addr & 0xFFFFFFFF, self.__num_bytes) + self.__payload
+
+    def pack_into(self, buf: bytearray | memoryview, offset: int = 0) -> int:
+        """buf の offset バイト目からこのパケットをシリアライズしたバイト列を書き込む
+
+        Args:
+            buf (bytearray or memoryview): 書き込み先のバッファ
+            offset (int): 書き込み先の先頭の位置
+
+        Returns:
+            int: 書き込んだバイト数
+        """
+        self.__HEADER.pack_into(
+            buf, offset, self.__mode, self.__addr >> 32, self.__addr & 0xFFFFFFFF, self.__num_bytes)
+        end = offset + self.HEADER_SIZE + len(self.__payload)
+        buf[offset + self.HEADER_SIZE : end] = self.__payload
+        return end - offset
 
     def __mode_to_str(self, mode: int) -> str:
-        if mode == self.MODE_WAVE_RAM_READ:
-            return "WAVE RAM READ"
-        elif mode == self.MODE_WAVE_RAM_WRITE:
-            return "WAVE RAM WRITE"
-        elif mode == self.MODE_WAVE_RAM_WRITE_ACK:
-            return "WAVE RAM WRITE-ACK"
-        elif mode == self.MODE_WAVE_RAM_READ_REPLY:
-            return "WAVE RAM READ-REPLY"
-        elif mode == self.MODE_AWG_REG_READ:
-            return "AWG REG READ"
-        elif mode == self.MODE_AWG_REG_WRITE:
-            return "AWG REG WRITE"
-        elif mode == self.MODE_AWG_REG_WRITE_ACK:
-            return "AWG REG WRITE-ACK"
-        elif mode == self.MODE_AWG_REG_READ_REPLY:
-            return "AWG REG READ-REPLY"
-        elif mode == self.MODE_CAPTURE_REG_READ:
-            return "CAPTURE REG READ"
-        elif mode == self.MODE_CAPTURE_REG_WRITE:
-            return "CAPTURE REG WRITE"
-        elif mode == self.MODE_CAPTURE_REG_WRITE_ACK:
-            return "CAPTURE REG WRITE-ACK"
-        elif mode == self.MODE_CAPTURE_REG_READ_REPLY:
-            return "CAPTURE REG READ-REPLY"
-        elif mode == self.MODE_SEQUENCER_REG_READ:
-            return "SEQUENCER REG READ"
-        elif mode == self.MODE_SEQUENCER_REG_WRITE:
-            return "SEQUENCER REG WRITE"
-        elif mode == self.MODE_SEQUENCER_REG_WRITE_ACK:
-            return "SEQUENCER REG WRITE-ACK"
-        elif mode == self.MODE_SEQUENCER_REG_READ_REPLY:
-            return "SEQUENCER REG READ-REPLY"
-        elif mode == self.MODE_SEQUENCER_CMD_WRITE:
-            return "SEQUENCER CMD WRITE"
-        elif mode == self.MODE_SEQUENCER_CMD_WRITE_ACK:
-            return "SEQUENCER CMD WRITE-ACK"
-        elif mode == self.MODE_SEQUENCER_CMD_ERR_REPORT:
-            return "SEQUENCER CMD ERR REPORT"
-        elif mode == self.MODE_OTHERS:
-            return "OTHERS"
-        return ""
+        return self.__MODE_NAMES.get(mode, "")
 
     def __str__(self) -> str:
         ret = ('mode : {} ({})'.format(self.__mode_to_str(self.__mode), self.__mode) + '\n' + 
@@ -112,22 +139,11 @@ class UplPacket(object):
 
 
     @classmethod
-    def deserialize(cls, data: bytes) -> Self:
-        mode = int.from_bytes(data[0:1], 'big')
-        addr = int.from_bytes(data[1:6], 'big')
-        num_bytes = int.from_bytes(data[6:8], 'big')
-        payload = b''
-        if ((num_bytes != 0) and 
-            ((mode == cls.MODE_AWG_REG_READ_REPLY)       or
-             (mode == cls.MODE_CAPTURE_REG_READ_REPLY)   or
-             (mode == cls.MODE_WAVE_RAM_READ_REPLY)      or
-             (mode == cls.MODE_AWG_REG_WRITE)            or 
-             (mode == cls.MODE_CAPTURE_REG_WRITE)        or 
-             (mode == cls.MODE_WAVE_RAM_WRITE)           or
-             (mode == cls.MODE_SEQUENCER_REG_READ_REPLY) or
-             (mode == cls.MODE_SEQUENCER_REG_WRITE)      or
-             (mode == cls.MODE_SEQUENCER_CMD_WRITE)      or
-             (mode == cls.MODE_SEQUENCER_CMD_ERR_REPORT))):
-            payload = data[8 : 8 + num_bytes]
-
-        return cls(mode, addr, num_bytes, payload)
+    def deserialize(cls, data: bytes | bytearray | memoryview) -> Self:
+        """バイト列から UplPacket を作る.  ペイロードは data をコピーせずに参照する memoryview になる."""
+        mode, addr_hi, addr_lo, num_bytes = cls.__HEADER.unpack_from(data)
+        payload: bytes | memoryview = b''
+        if (num_bytes != 0) and (mode in cls.__PAYLOAD_MODES):
+            payload = memoryview(data)[cls.HEADER_SIZE : cls.HEADER_SIZE + num_bytes]
+
+        return cls(mode, (addr_hi << 32) | addr_lo, num_bytes, payload)
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import threading
 import struct
 from typing import Final, Callable, Any
@@ -5,8 +7,9 @@ from collections.abc import Sequence
 from enum import IntEnum
 from e7awgsw import WaveSequence, AWG
 from e7awgsw.memorymap import WaveParamRegs
-from e7awgsw.hwparam import WAVE_SAMPLE_SIZE
+from e7awgsw.hwparam import WAVE_SAMPLE_SIZE, NUM_SAMPLES_IN_WAVE_BLOCK, NUM_SAMPLES_IN_AWG_WORD
 from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+from virtualclock import VirtualClock
 
 
 class Awg:
@@ -15,12 +18,26 @@ class Awg:
     __NUM_PARAM_REGS: Final = 256
     __MAX_PARAM_REG_ADDR: Final = __NUM_PARAM_REGS * PARAM_REG_SIZE
 
-    def __init__(self, id: AWG, mem_reader: Callable[[int, int], bytearray]) -> None:
+    def __init__(
+        self,
+        id: AWG,
+        mem_reader: Callable[[int, int], bytearray],
+        clock: VirtualClock | None = None
+    ) -> None:
+        """
+        Args:
+            id (AWG): AWG の ID
+            mem_reader (Callable): 波形データを読み出す関数
+            clock (VirtualClock):
+                | 仮想時刻のクロック. None の場合, 波形の出力は即座に完了する.
+        """
         self.__state = AwgState.IDLE
         self.__state_lock = threading.RLock()
         self.__param_regs = [0] * self.__NUM_PARAM_REGS
         self.__mem_reader = mem_reader
         self.__id = id
+        self.__clock = clock
+        self.__wave_start_time = 0
         self.__loggers = [get_file_logger(), get_stderr_logger()]
         self.__set_default_params()
 
@@ -83,6 +100,16 @@ class Awg:
             wave_seq.add_chunk(chunk_data, num_balnk_words, num_repeats)
         wave = wave_seq.all_samples_lazy(True)
 
+        if self.__clock is not None:
+            # 仮想時刻モードでは, 波形の出力時間が経過した時点で complete 状態にする
+            self.__wave_start_time = self.__calc_wave_start_time(self.__clock.now)
+            self.__clock.schedule_at(
+                self.__wave_start_time + wave_seq.num_all_words, self.__complete_wave_gen)
+            with self.__state_lock:
+                if self.__state == AwgState.GEN_WAVE:
+                    return (True, wave)
+            return (False, [])
+
         with self.__state_lock:
             if self.__state == AwgState.GEN_WAVE:
                 self.__state = AwgState.COMPLETE
@@ -91,6 +118,25 @@ class Awg:
         return (False, [])
 
 
+    def __complete_wave_gen(self) -> None:
+        with self.__state_lock:
+            if self.__state == AwgState.GEN_WAVE:
+                self.__state = AwgState.COMPLETE
+
+
+    def __calc_wave_start_time(self, now: int) -> int:
+        """波形送信可能なブロックの先頭の時刻のうち, now 以降で最も早いものを求める"""
+        interval = self.get_param(WaveParamRegs.Offset.WAVE_STARTABLE_BLOCK_INTERVAL)
+        interval = max(interval, 1) * (NUM_SAMPLES_IN_WAVE_BLOCK // NUM_SAMPLES_IN_AWG_WORD)
+        return (now + interval - 1) // interval * interval
+
+
+    @property
+    def wave_start_time(self) -> int:
+        """最後に波形の出力を開始した仮想時刻 (単位 : ワード).  仮想時刻モードでのみ有効."""
+        return self.__wave_start_time
+
+
     def __read_chunk(self, addr: int, num_words: int) -> list[tuple[int, int]]:
         rd_size = num_words * WaveSequence.NUM_SAMPLES_IN_AWG_WORD * WAVE_SAMPLE_SIZE
         rd_data = self.__mem_reader(addr, rd_size)
@@ -4,6 +4,7 @@ from awg import Awg
 from typing import Final, Callable, Any
 from collections.abc import Sequence, Mapping
 from register import RwRegister, RoRegister
+from virtualclock import VirtualClock
 from e7awgsw import AWG
 from e7awgsw.memorymap import AwgMasterCtrlRegs, AwgCtrlRegs, WaveParamRegs
 from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
@@ -13,7 +14,14 @@ class AwgController(object):
 
     __NUM_REG_BITS: Final = 32
 
-    def __init__(self) -> None:
+    def __init__(self, clock: VirtualClock | None = None) -> None:
+        """
+        Args:
+            clock (VirtualClock):
+                | 仮想時刻のクロック.
+                | None でない場合, 波形出力時のイベントハンドラは AWG が波形の出力を開始する仮想時刻に呼ばれる.
+        """
+        self.__clock = clock
         self.__awgs: dict[AWG, Awg] = {}
         self.__awg_ctrl_regs: dict[int, RoRegister | RwRegister] = {}
         self.__awg_master_ctrl_regs: dict[int, RoRegister | RwRegister] = {
@@ -212,24 +220,38 @@ class AwgController(object):
         if (old_val == 0) and (new_val == 1):
             is_wave_generated, wave  = awg.generate_wave()
             if is_wave_generated:
-                for action in self.__actions_on_wave_generated:
-                    action({awg.id : wave})
+                self.__invoke_on_wave_generated({awg.id : wave}, awg.wave_start_time)
 
 
     def __ctrl_master_start(self, old_val: int, new_val: int) -> None:
         """マスターコントロールレジスタのスタートビット変更時の処理"""
         if (old_val == 0) and (new_val == 1):
             awg_id_to_wave = {}
+            start_time = 0
             for awg in self.__awgs.values():
                 ctrl_target_reg = self.__awg_master_ctrl_regs[AwgMasterCtrlRegs.Offset.CTRL_TARGET_SEL]
                 if ctrl_target_reg.get_bit(AwgMasterCtrlRegs.Bit.awg(awg.id)):
                     is_wave_generated, wave  = awg.generate_wave()
                     if is_wave_generated:
                         awg_id_to_wave[awg.id] = wave
+                        start_time = max(start_time, awg.wave_start_time)
             
+            self.__invoke_on_wave_generated(awg_id_to_wave, start_time)
+
+
+    def __invoke_on_wave_generated(
+        self, awg_id_to_wave: Mapping[AWG, Sequence[tuple[int, int]]], start_time: int
+    ) -> None:
+        """波形出力時のイベントハンドラを呼ぶ.  仮想時刻モードでは波形の出力開始時刻に呼ぶ."""
+        def invoke() -> None:
             for action in self.__actions_on_wave_generated:
                 action(awg_id_to_wave)
 
+        if self.__clock is None:
+            invoke()
+        else:
+            self.__clock.schedule_at(start_time, invoke)
+
 
     def __ctrl_prepare(
         self, awg: Awg, is_ctrl_target: int, old_val: int, new_val: int
@@ -5,7 +5,8 @@ import threading
 import struct
 from typing import Final, Callable, Any
 from collections.abc import Sequence, Container
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 from enum import IntEnum
 import numpy as np
 from e7awgsw import DspUnit, DecisionFunc, CaptureCtrl, WaveSequence, CaptureParam, dsp
@@ -13,6 +14,45 @@ from e7awgsw import CaptureUnit as CapUnit
 from e7awgsw.memorymap import CaptureParamRegs
 from e7awgsw.hwparam import MAX_INTEG_VEC_ELEMS
 from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error, log_warning
+from virtualclock import VirtualClock
+
+
+def _serialize_capture_data(data: list, is_classification_result: bool) -> bytes:
+    """キャプチャデータを HBM に書き込むバイト列に変換する"""
+    serialized = bytearray()
+    if is_classification_result:
+        rem = len(data) % 4
+        if rem != 0:
+            data = data + ([0] * (4 - rem))
+        for i in range(0, len(data), 4):
+            byte = 0xFF & ((data[i+3] << 6) | (data[i+2] << 4) | (data[i+1] << 2) | data[i])
+            serialized += struct.pack('<B', byte)
+    else:
+        for sample in data:
+            serialized += struct.pack('<f', sample[0])
+            serialized += struct.pack('<f', sample[1])
+    
+    rem = len(serialized) % 32
+    if rem != 0:
+        serialized += bytearray(32 - rem)
+
+    return serialized
+
+
+def _dsp_in_shared_memory(
+    shm_name: str,
+    num_samples: int,
+    capture_param: CaptureParam,
+    is_classification_result: bool
+) -> bytes:
+    """共有メモリ上の波形データに信号処理を適用し, HBM に書き込むバイト列を返す.  DSP 用のプロセスで実行される."""
+    shm = SharedMemory(name = shm_name)
+    try:
+        samples = np.ndarray((num_samples, 2), dtype = np.int32, buffer = shm.buf).tolist()
+    finally:
+        shm.close()
+    cap_samples = dsp([tuple(sample) for sample in samples], capture_param)
+    return _serialize_capture_data(cap_samples, is_classification_result)
 
 
 class CaptureUnitState(IntEnum):
@@ -29,20 +69,42 @@ class CaptureUnit(object):
     __MAX_PARAM_REG_ADDR: Final = __NUM_PARAM_REGS * PARAM_REG_SIZE
     # シミュレータが受付可能なキャプチャ区間の最大サンプル数.  保存可能なサンプル数ではない点に注意.
     __MAX_SAMPLES_IN_CAPTURE_SECTION: Final = 32 * 1024 * 1024 + 4 
+    # キャプチャパラメータの復元に使わないレジスタ.  書き換えてもキャッシュを無効化しない.
+    __NON_CAPTURE_PARAM_REGS: Final = (
+        CaptureParamRegs.Offset.CAPTURE_ADDR, CaptureParamRegs.Offset.NUM_CAPTURED_SAMPLES)
 
     def __init__(
         self,
         id: CapUnit,
         mem_writer: Callable[[int, bytes], None],
-        capture_start_delay: int
+        capture_start_delay: int,
+        clock: VirtualClock | None = None,
+        dsp_pool: ProcessPoolExecutor | None = None
     ) -> None:
+        """
+        Args:
+            id (CaptureUnit): キャプチャユニットの ID
+            mem_writer (Callable): キャプチャデータを書き込む関数
+            capture_start_delay (int): キャプチャスタートからキャプチャディレイをカウントし始めるまでの準備時間 (単位 : ワード)
+            clock (VirtualClock):
+                | 仮想時刻のクロック.
+                | None でない場合, キャプチャにかかる時間が仮想時刻で経過した時点で complete 状態になる.
+            dsp_pool (ProcessPoolExecutor):
+                | 信号処理を実行するプロセスプール.  複数のキャプチャユニットで共有できる.
+                | None の場合, 信号処理はキャプチャユニットのスレッドで実行する.
+        """
         self.__state = CaptureUnitState.IDLE
         self.__state_lock = threading.RLock()
         self.__param_regs = [0] * self.__NUM_PARAM_REGS
         self.__mem_writer = mem_writer
         self.__capture_start_delay = capture_start_delay # キャプチャスタートからキャプチャディレイをカウントし始めるまでの準備時間 (単位 : ワード)
         self.__id = id
+        self.__clock = clock
+        self.__dsp_pool = dsp_pool
         self.__executor = ThreadPoolExecutor(max_workers = 2)
+        # レジスタから復元したキャプチャパラメータのキャッシュ.  パラメータレジスタが書き換えられるまで再利用する.
+        self.__param_version = 0
+        self.__cached_param: tuple[int, CaptureParam] | None = None
         self.__loggers = [get_file_logger(), get_stderr_logger()]
         self.__set_default_params()
 
@@ -51,6 +113,11 @@ class CaptureUnit(object):
         return self.__id
 
 
+    def shutdown(self) -> None:
+        """実行中のキャプチャの完了を待って, キャプチャ処理用のスレッドを終了する"""
+        self.__executor.shutdown(wait = True)
+
+
     def assert_reset(self) -> None:
         """キャプチャユニットをリセット状態にする"""
         with self.__state_lock:
@@ -91,35 +158,84 @@ class CaptureUnit(object):
                 return
             self.__state = CaptureUnitState.CAPTURE_WAVE
         
+        # キャプチャスタートのトリガを受けた仮想時刻
+        trigger_time = 0 if self.__clock is None else self.__clock.now
         if is_async:
-            self.__executor.submit(self.__capture_wave, wave_data)
+            self.__executor.submit(self.__capture_wave, wave_data, trigger_time)
         else:
-            self.__capture_wave(wave_data)
+            self.__capture_wave(wave_data, trigger_time)
 
 
-    def __capture_wave(self, wave_data: Sequence[tuple[int, int]]) -> None:
+    def __capture_wave(self, wave_data: Sequence[tuple[int, int]], trigger_time: int) -> None:
         try:
-            capture_param = self.__gen_capture_param()
+            capture_param = self.__get_capture_param()
             self.__check_capture_size(capture_param)
             num_samples_to_waste = self.__calc_num_samples_to_waste(capture_param.capture_delay)
             samples = wave_data[num_samples_to_waste : capture_param.num_samples_to_process + num_samples_to_waste]
-            cap_samples = dsp(list(samples), capture_param)
-
             is_classification_result = DspUnit.CLASSIFICATION in capture_param.dsp_units_enabled
-            wr_data = self.__serialize_capture_data(cap_samples, is_classification_result)
+            if self.__dsp_pool is None:
+                cap_samples = dsp(list(samples), capture_param)
+                wr_data = _serialize_capture_data(cap_samples, is_classification_result)
+            else:
+                wr_data = self.__dsp_in_pool(samples, capture_param, is_classification_result)
             addr = self.get_param(CaptureParamRegs.Offset.CAPTURE_ADDR) * 32
             self.__mem_writer(addr, wr_data)
             self.set_param(CaptureParamRegs.Offset.NUM_CAPTURED_SAMPLES, capture_param.calc_capture_samples())
 
-            with self.__state_lock:
-                if self.__state == CaptureUnitState.CAPTURE_WAVE:
-                    self.__state = CaptureUnitState.COMPLETE
+            if self.__clock is None:
+                self.__complete_capture()
+            else:
+                self.__clock.schedule_at(
+                    trigger_time + self.__calc_capture_time(capture_param), self.__complete_capture)
         except Exception as e:
             print('ERR [capture_wave] : {}'.format(e), file = sys.stderr)
             print('The e7awg_hw emulator has stopped!\n', file = sys.stderr)
             raise
 
 
+    def __dsp_in_pool(
+        self,
+        samples: Sequence[tuple[int, int]],
+        capture_param: CaptureParam,
+        is_classification_result: bool
+    ) -> bytes:
+        """波形データを共有メモリに置いて, DSP 用のプロセスで信号処理を行う"""
+        wave = np.array(samples, dtype = np.int32).reshape(-1, 2)
+        shm = SharedMemory(create = True, size = max(wave.nbytes, 1))
+        try:
+            np.ndarray(wave.shape, dtype = np.int32, buffer = shm.buf)[:] = wave
+            future = self.__dsp_pool.submit( # type: ignore
+                _dsp_in_shared_memory, shm.name, len(wave), capture_param, is_classification_result)
+            return future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+    def __complete_capture(self) -> None:
+        with self.__state_lock:
+            if self.__state == CaptureUnitState.CAPTURE_WAVE:
+                self.__state = CaptureUnitState.COMPLETE
+
+
+    def __calc_capture_time(self, param: CaptureParam) -> int:
+        """キャプチャスタートからキャプチャが完了するまでの時間を求める (単位 : ワード)"""
+        num_words = -(-param.num_samples_to_process // WaveSequence.NUM_SAMPLES_IN_AWG_WORD)
+        return self.__capture_start_delay + param.capture_delay + num_words
+
+
+    def __get_capture_param(self) -> CaptureParam:
+        """パラメータレジスタの値を反映したキャプチャパラメータを取得する"""
+        version = self.__param_version
+        cached = self.__cached_param
+        if (cached is not None) and (cached[0] == version):
+            return cached[1]
+
+        param = self.__gen_capture_param()
+        self.__cached_param = (version, param)
+        return param
+
+
     def __gen_capture_param(self) -> CaptureParam:
         param = CaptureParam()
         # 積算区間数
@@ -256,27 +372,6 @@ class CaptureUnit(object):
                 print('WARNING: ' + msg)
 
 
-    def __serialize_capture_data(self, data: list, is_classification_result: bool) -> bytes:
-        serialized = bytearray()
-        if is_classification_result:
-            rem = len(data) % 4
-            if rem != 0:
-                data = data + ([0] * (4 - rem))
-            for i in range(0, len(data), 4):
-                byte = 0xFF & ((data[i+3] << 6) | (data[i+2] << 4) | (data[i+1] << 2) | data[i])
-                serialized += struct.pack('<B', byte)
-        else:
-            for sample in data:
-                serialized += struct.pack('<f', sample[0])
-                serialized += struct.pack('<f', sample[1])
-        
-        rem = len(serialized) % 32
-        if rem != 0:
-            serialized += bytearray(32 - rem)
-
-        return serialized
-
-
     def is_complete(self) -> bool:
         """キャプチャユニットが complete 状態かどうか調べる"""
         return self.__state == CaptureUnitState.COMPLETE
@@ -319,6 +414,8 @@ class CaptureUnit(object):
             raise
 
         reg_idx = addr // self.PARAM_REG_SIZE
+        if (self.__param_regs[reg_idx] != data) and (addr not in self.__NON_CAPTURE_PARAM_REGS):
+            self.__param_version += 1
         self.__param_regs[reg_idx] = data
 
 
@@ -91,6 +91,12 @@ class CaptureController(object):
         raise ValueError(msg)
 
 
+    def shutdown(self) -> None:
+        """全キャプチャユニットのキャプチャ処理用のスレッドを終了する"""
+        for cap_unit in self.__cap_units.values():
+            cap_unit.shutdown()
+
+
     def on_wave_generated(
         self,
         awg_id_list: Container[AWG],
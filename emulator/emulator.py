@@ -1,18 +1,25 @@
 from __future__ import annotations
 
-import os
 import argparse
+import multiprocessing
 import capture
-from typing import Final
+from types import TracebackType
+from typing import Final, Any
+from typing_extensions import Self
+from concurrent.futures import ProcessPoolExecutor
 from awg import Awg
 from hbm import Hbm
 from awgcontroller import AwgController
 from collections.abc import Sequence, Mapping
 from capturecontroller import CaptureController
 from upldispatcher import UplDispatcher
+from virtualclock import VirtualClock, words_to_sec
+from faultinjector import FaultInjector
 from e7awgsw import CaptureUnit, CaptureModule, AWG
 
 CAPTURE_START_DELAY: Final = 31 # キャプチャスタートからキャプチャディレイをカウントし始めるまでの準備時間 (単位 : ワード)
+HBM_SIZE: Final = 0x200000000 # bytes
+ACCESS_LATENCY: Final = 12500 # 仮想時刻モードにおける UDP パケット 1 つあたりのアクセスレイテンシ (単位 : ワード).  100 us 相当.
 
 # AWG とキャプチャモジュールのデータバスの接続関係
 awg_to_capture_module = {
@@ -41,27 +48,165 @@ def on_wave_generated(
     cap_ctrl.on_wave_generated(awg_id_to_wave.keys(), cap_mod_to_wave)
 
 
+class Emulator(object):
+    """1 台分の e7awg_hw をエミュレートするクラス
+
+    | 各インスタンスは独立した HBM, AWG, キャプチャユニットを持ち, ip_addr で指定したアドレスでパケットを受け付ける.
+    | 同じプロセス内に複数のインスタンスを作る場合は, それぞれに異なる IP アドレス (例 127.0.0.2, 127.0.0.3) を割り当てること.
+    """
+
+    def __init__(
+        self,
+        ip_addr: str,
+        *,
+        virtual_time: bool = False,
+        access_latency: int = ACCESS_LATENCY,
+        fault_injector: FaultInjector | None = None,
+        dsp_processes: int = 0
+    ) -> None:
+        """
+        Args:
+            ip_addr (str): エミュレータがパケットを受け付ける IP アドレス
+            virtual_time (bool): True の場合, 仮想時刻モードで動作する
+            access_latency (int): 仮想時刻モードにおける UDP パケット 1 つあたりのアクセスレイテンシ (単位 : ワード)
+            fault_injector (FaultInjector): 送受信するパケットに通信障害を発生させるオブジェクト
+            dsp_processes (int):
+                | キャプチャユニットの信号処理を実行するプロセスの数.
+                | 0 の場合, 信号処理は各キャプチャユニットのスレッドで実行する.
+        """
+        self.__ip_addr = ip_addr
+        self.__clock = VirtualClock() if virtual_time else None
+        self.__fault_injector = fault_injector
+        # 親プロセスは UDP パケット処理用のスレッドを持つので, fork ではなく spawn でプロセスを作る
+        self.__dsp_pool = ProcessPoolExecutor(
+            max_workers = dsp_processes,
+            mp_context = multiprocessing.get_context('spawn')) if dsp_processes > 0 else None
+        hbm = Hbm(HBM_SIZE)
+        self.__cap_ctrl = CaptureController()
+        for cap_unit_id in CaptureUnit.all():
+            cap_unit = capture.CaptureUnit(
+                cap_unit_id, hbm.write, CAPTURE_START_DELAY, self.__clock, self.__dsp_pool)
+            self.__cap_ctrl.add_capture_unit(cap_unit)
+
+        awg_ctrl = AwgController(self.__clock)
+        awg_ctrl.add_on_wave_generated(
+            lambda awg_id_to_wave : on_wave_generated(awg_id_to_wave, self.__cap_ctrl))
+        for awg_id in AWG.all():
+            awg = Awg(awg_id, hbm.read, self.__clock)
+            awg_ctrl.add_awg(awg)
+
+        self.__upl_dispatcher = UplDispatcher(
+            ip_addr, hbm, awg_ctrl, self.__cap_ctrl, self.__clock, access_latency, fault_injector)
+        self.__is_running = False
+
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None
+    ) -> None:
+        self.stop()
+
+
+    @property
+    def ip_addr(self) -> str:
+        """エミュレータがパケットを受け付ける IP アドレス"""
+        return self.__ip_addr
+
+
+    @property
+    def clock(self) -> VirtualClock | None:
+        """仮想時刻のクロック.  仮想時刻モードでない場合は None."""
+        return self.__clock
+
+
+    def start(self) -> None:
+        """パケットの受け付けを開始する"""
+        if not self.__is_running:
+            self.__upl_dispatcher.start()
+            self.__is_running = True
+
+
+    def stop(self) -> None:
+        """パケットの受け付けを止め, エミュレータが使用するソケットとスレッドを解放する"""
+        if self.__is_running:
+            # 閉じたソケットで遅延させたパケットを送らないよう, 先に FaultInjector を止める
+            if self.__fault_injector is not None:
+                self.__fault_injector.close()
+            self.__upl_dispatcher.stop()
+            self.__cap_ctrl.shutdown()
+            if self.__dsp_pool is not None:
+                self.__dsp_pool.shutdown(wait = True)
+            self.__is_running = False
+
+
+def add_emulator_args(parser: argparse.ArgumentParser) -> None:
+    """エミュレータの動作を設定するコマンドライン引数を parser に追加する"""
+    parser.add_argument('--virtual-time', action='store_true')
+    parser.add_argument('--access-latency', type=int, default=ACCESS_LATENCY)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--dup-rate', type=float, default=0.0)
+    parser.add_argument('--reorder-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0.0) # ms
+    parser.add_argument('--jitter', type=float, default=0.0) # ms
+    parser.add_argument('--bandwidth', type=float, default=None) # Mbps
+    parser.add_argument('--fault-seed', type=int, default=None)
+    parser.add_argument('--dsp-processes', type=int, default=0)
+
+
+def fault_params_from_args(args: argparse.Namespace) -> dict[str, Any] | None:
+    """add_emulator_args で追加したコマンドライン引数の値から FaultInjector のコンストラクタ引数を作る.
+
+    | 通信障害を発生させない場合は None を返す.
+    """
+    if (args.drop_rate > 0 or args.dup_rate > 0 or args.reorder_rate > 0 or
+        args.delay > 0 or args.jitter > 0 or args.bandwidth is not None):
+        return {
+            'drop_rate' : args.drop_rate,
+            'dup_rate' : args.dup_rate,
+            'reorder_rate' : args.reorder_rate,
+            'delay' : args.delay * 1e-3,
+            'jitter' : args.jitter * 1e-3,
+            'bandwidth' : None if args.bandwidth is None else args.bandwidth * 1e6 / 8,
+            'seed' : args.fault_seed
+        }
+    return None
+
+
+def create_emulator(ip_addr: str, args: argparse.Namespace) -> Emulator:
+    """add_emulator_args で追加したコマンドライン引数の値に従ってエミュレータを作成する"""
+    fault_params = fault_params_from_args(args)
+    fault_injector = None if fault_params is None else FaultInjector(**fault_params)
+    return Emulator(
+        ip_addr,
+        virtual_time = args.virtual_time,
+        access_latency = args.access_latency,
+        fault_injector = fault_injector,
+        dsp_processes = args.dsp_processes)
+
+
+def print_virtual_elapsed_time(emulator: Emulator) -> None:
+    clock = emulator.clock
+    if clock is not None:
+        print('virtual elapsed time ({}) : {} words ({:.3f} us)'.format(
+            emulator.ip_addr, clock.now, words_to_sec(clock.now) * 1e6))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--ipaddr', default='0.0.0.0')
+    add_emulator_args(parser)
     args = parser.parse_args()
 
-    hbm = Hbm(0x200000000)
-    cap_ctrl = CaptureController()
-    for cap_unit_id in CaptureUnit.all():
-        cap_unit = capture.CaptureUnit(cap_unit_id, hbm.write, CAPTURE_START_DELAY)
-        cap_ctrl.add_capture_unit(cap_unit)
-
-    awg_ctrl = AwgController()
-    awg_ctrl.add_on_wave_generated(
-        lambda awg_id_to_wave : on_wave_generated(awg_id_to_wave, cap_ctrl))
-    for awg_id in AWG.all():
-        awg = Awg(awg_id, hbm.read)
-        awg_ctrl.add_awg(awg)
-
-    upl_dispatcher = UplDispatcher(args.ipaddr, hbm, awg_ctrl, cap_ctrl)
-    upl_dispatcher.start()
-
+    emulator = create_emulator(args.ipaddr, args)
+    emulator.start()
     print('The emulator has been started.')
     input("Press 'Enter' to stop\n")
-    os._exit(0)
+    emulator.stop()
+    print_virtual_elapsed_time(emulator)
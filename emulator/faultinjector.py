@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import heapq
+import random
+import socket
+import threading
+import time
+from typing import Final
+from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+
+
+class FaultInjector(object):
+    """エミュレータが送受信する UDP パケットに通信障害を模擬的に発生させるクラス
+
+    | 受信したパケットの破棄と, 送信するパケットの破棄, 複製, 順序入れ替え, 遅延, 帯域制限を行う.
+    | 遅延させたパケットは専用のスレッドから送信する.
+    | 使い終わったら close でそのスレッドを止めること.
+    """
+
+    # 順序を入れ替えるパケットに追加する遅延 (単位 : 秒)
+    __REORDER_DELAY: Final = 0.005
+
+    def __init__(
+        self,
+        *,
+        drop_rate: float = 0.0,
+        dup_rate: float = 0.0,
+        reorder_rate: float = 0.0,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: float | None = None,
+        seed: int | None = None
+    ) -> None:
+        """
+        Args:
+            drop_rate (float): パケットを破棄する確率.  受信したパケットと送信するパケットのそれぞれに適用する.
+            dup_rate (float): 送信するパケットを複製する確率
+            reorder_rate (float): 送信するパケットを後続のパケットと入れ替える確率
+            delay (float): 送信するパケットに加える固定の遅延 (単位 : 秒)
+            jitter (float): 送信するパケットに加える遅延の揺らぎの最大値 (単位 : 秒)
+            bandwidth (float):
+                | 送信帯域の上限 (単位 : バイト/秒).
+                | None の場合, 帯域を制限しない.
+            seed (int): 乱数のシード.  None の場合, 実行ごとに異なる乱数列を使う.
+        """
+        self.__loggers = [get_file_logger(), get_stderr_logger()]
+        self.__validate_rate('drop_rate', drop_rate)
+        self.__validate_rate('dup_rate', dup_rate)
+        self.__validate_rate('reorder_rate', reorder_rate)
+        self.__validate_non_negative('delay', delay)
+        self.__validate_non_negative('jitter', jitter)
+        if (bandwidth is not None) and (bandwidth <= 0):
+            msg = 'bandwidth must be a positive number.  ({})'.format(bandwidth)
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+        self.__drop_rate = drop_rate
+        self.__dup_rate = dup_rate
+        self.__reorder_rate = reorder_rate
+        self.__delay = delay
+        self.__jitter = jitter
+        self.__bandwidth = bandwidth
+        self.__random = random.Random(seed)
+        self.__link_free_time = 0.0 # 送信中のパケットが帯域を使い終える時刻
+        self.__seq_no = 0
+        self.__queue: list[tuple[float, int, socket.socket, bytes, tuple[str, int]]] = []
+        self.__cond = threading.Condition()
+        self.__closed = False
+        self.__sender = threading.Thread(target = self.__send_delayed_packets, daemon = True)
+        self.__sender.start()
+
+
+    def __validate_rate(self, name: str, rate: float) -> None:
+        if not (0.0 <= rate <= 1.0):
+            msg = '{} must be in the range [0, 1].  ({})'.format(name, rate)
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+
+    def __validate_non_negative(self, name: str, val: float) -> None:
+        if val < 0:
+            msg = '{} must be greater than or equal to 0.  ({})'.format(name, val)
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+
+    def drop_on_recv(self) -> bool:
+        """受信したパケットを破棄するかどうかを決める
+
+        Returns:
+            bool: パケットを破棄する場合 True
+        """
+        with self.__cond:
+            return self.__random.random() < self.__drop_rate
+
+
+    def sendto(self, sock: socket.socket, data: bytes, addr: tuple[str, int]) -> None:
+        """障害を加えてパケットを送信する
+
+        Args:
+            sock (socket.socket): パケットを送信するソケット
+            data (bytes): 送信するデータ
+            addr (tuple[str, int]): 送信先のアドレス
+        """
+        with self.__cond:
+            if self.__closed or (self.__random.random() < self.__drop_rate):
+                return
+            num_copies = 2 if self.__random.random() < self.__dup_rate else 1
+            for _ in range(num_copies):
+                self.__enqueue(sock, data, addr)
+            self.__cond.notify()
+
+
+    def __enqueue(self, sock: socket.socket, data: bytes, addr: tuple[str, int]) -> None:
+        now = time.monotonic()
+        send_time = now + self.__delay + self.__random.uniform(0, self.__jitter)
+        if self.__random.random() < self.__reorder_rate:
+            send_time += self.__REORDER_DELAY
+        if self.__bandwidth is not None:
+            # パケットはリンクが空いてからデータサイズ / 帯域 の時間をかけて送り出される
+            self.__link_free_time = max(now, self.__link_free_time) + len(data) / self.__bandwidth
+            send_time = max(send_time, self.__link_free_time)
+        heapq.heappush(self.__queue, (send_time, self.__seq_no, sock, data, addr))
+        self.__seq_no += 1
+
+
+    def __send_delayed_packets(self) -> None:
+        while True:
+            with self.__cond:
+                while (not self.__queue) and (not self.__closed):
+                    self.__cond.wait()
+                if self.__closed:
+                    return
+                send_time = self.__queue[0][0]
+                wait_time = send_time - time.monotonic()
+                if wait_time > 0:
+                    # 待機中により早く送るパケットが追加される可能性があるので, 待機後にキューを確認し直す
+                    self.__cond.wait(wait_time)
+                    continue
+                _, _, sock, data, addr = heapq.heappop(self.__queue)
+            try:
+                sock.sendto(data, addr)
+            except Exception as e:
+                log_error(e, *self.__loggers)
+
+
+    def close(self) -> None:
+        """遅延させたパケットを送信するスレッドを止める.  送信待ちのパケットは破棄する."""
+        with self.__cond:
+            self.__closed = True
+            self.__queue.clear()
+            self.__cond.notify_all()
+        self.__sender.join()
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import multiprocessing
+import multiprocessing.synchronize
+from types import TracebackType
+from typing import Final, Any
+from typing_extensions import Self
+from collections.abc import Sequence, Mapping
+from emulator import Emulator, ACCESS_LATENCY
+from emulator import add_emulator_args, fault_params_from_args, print_virtual_elapsed_time
+from faultinjector import FaultInjector
+from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+
+
+def loopback_addrs(num_boxes: int, first_ip_addr: str = '127.0.0.2') -> list[str]:
+    """first_ip_addr から連続する num_boxes 個のループバックアドレスを返す
+
+    Args:
+        num_boxes (int): アドレスの数
+        first_ip_addr (str): 最初のアドレス
+
+    Returns:
+        list of str: ループバックアドレスのリスト
+    """
+    first = ipaddress.IPv4Address(first_ip_addr)
+    addrs = [first + i for i in range(num_boxes)]
+    if not all(addr.is_loopback for addr in addrs):
+        raise ValueError('{} is not a loopback address.'.format(addrs[-1]))
+    return [str(addr) for addr in addrs]
+
+
+def _run_emulator(
+    ip_addr: str,
+    emulator_params: Mapping[str, Any],
+    fault_params: Mapping[str, Any] | None,
+    ready_event: multiprocessing.synchronize.Event,
+    stop_event: multiprocessing.synchronize.Event
+) -> None:
+    """子プロセスでエミュレータを 1 台動かす"""
+    fault_injector = None if fault_params is None else FaultInjector(**fault_params)
+    with Emulator(ip_addr, fault_injector = fault_injector, **emulator_params) as emulator:
+        ready_event.set()
+        stop_event.wait()
+    print_virtual_elapsed_time(emulator)
+
+
+class EmulatorLauncher(object):
+    """複数台の e7awg_hw エミュレータを起動 / 停止するクラス
+
+    | 各エミュレータは独立した HBM, AWG, キャプチャユニットを持ち, それぞれ異なる IP アドレスでパケットを受け付ける.
+    | use_processes が True の場合, エミュレータごとにプロセスを分けて起動する.
+    """
+
+    # 子プロセスのエミュレータが起動するまでの待ち時間 (単位 : 秒)
+    __START_TIMEOUT: Final = 30
+
+    def __init__(
+        self,
+        ip_addr_list: Sequence[str],
+        *,
+        use_processes: bool = False,
+        virtual_time: bool = False,
+        access_latency: int = ACCESS_LATENCY,
+        fault_params: Mapping[str, Any] | None = None,
+        dsp_processes: int = 0
+    ) -> None:
+        """
+        Args:
+            ip_addr_list (Sequence of str): 各エミュレータがパケットを受け付ける IP アドレスのリスト
+            use_processes (bool):
+                | True -> エミュレータごとに別のプロセスで動かす.
+                | False -> 全エミュレータをこのプロセス内で動かす.
+            virtual_time (bool): True の場合, 各エミュレータを仮想時刻モードで動作させる
+            access_latency (int): 仮想時刻モードにおける UDP パケット 1 つあたりのアクセスレイテンシ (単位 : ワード)
+            fault_params (Mapping):
+                | 各エミュレータの FaultInjector のコンストラクタに渡すキーワード引数.
+                | None の場合, 通信障害を発生させない.
+            dsp_processes (int): 各エミュレータでキャプチャユニットの信号処理を実行するプロセスの数
+        """
+        self.__loggers = [get_file_logger(), get_stderr_logger()]
+        if len(set(ip_addr_list)) != len(ip_addr_list):
+            msg = 'Duplicate IP addresses are specified.  {}'.format(ip_addr_list)
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+        self.__ip_addr_list = list(ip_addr_list)
+        self.__use_processes = use_processes
+        self.__emulator_params = {
+            'virtual_time' : virtual_time,
+            'access_latency' : access_latency,
+            'dsp_processes' : dsp_processes
+        }
+        self.__fault_params = None if fault_params is None else dict(fault_params)
+        self.__emulators: list[Emulator] = []
+        self.__processes: list[multiprocessing.Process] = []
+        self.__stop_event = multiprocessing.Event()
+
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None
+    ) -> None:
+        self.stop()
+
+
+    @property
+    def ip_addrs(self) -> list[str]:
+        """各エミュレータがパケットを受け付ける IP アドレスのリスト"""
+        return list(self.__ip_addr_list)
+
+
+    @property
+    def emulators(self) -> list[Emulator]:
+        """このプロセス内で動作しているエミュレータのリスト.  use_processes が True の場合は空."""
+        return list(self.__emulators)
+
+
+    def start(self) -> None:
+        """全エミュレータを起動する.  このメソッドから戻った時点で全エミュレータがパケットを受け付け可能になっている."""
+        if self.__emulators or self.__processes:
+            return
+        try:
+            if self.__use_processes:
+                self.__start_processes()
+            else:
+                self.__start_emulators()
+        except Exception as e:
+            log_error(e, *self.__loggers)
+            self.stop()
+            raise
+
+
+    def __start_emulators(self) -> None:
+        for ip_addr in self.__ip_addr_list:
+            fault_injector = \
+                None if self.__fault_params is None else FaultInjector(**self.__fault_params)
+            try:
+                emulator = Emulator(ip_addr, fault_injector = fault_injector, **self.__emulator_params)
+            except Exception:
+                # 起動していないエミュレータは FaultInjector を止めないので, ここで止める
+                if fault_injector is not None:
+                    fault_injector.close()
+                raise
+            self.__emulators.append(emulator)
+            emulator.start()
+
+
+    def __start_processes(self) -> None:
+        self.__stop_event.clear()
+        ready_events = []
+        for ip_addr in self.__ip_addr_list:
+            ready_event = multiprocessing.Event()
+            proc = multiprocessing.Process(
+                target = _run_emulator,
+                args = (ip_addr, self.__emulator_params, self.__fault_params,
+                        ready_event, self.__stop_event),
+                # デーモンプロセスは子プロセスを作れないので, DSP 用のプロセスを使う場合は非デーモンにする
+                daemon = self.__emulator_params['dsp_processes'] == 0)
+            proc.start()
+            self.__processes.append(proc)
+            ready_events.append(ready_event)
+
+        for ip_addr, ready_event in zip(self.__ip_addr_list, ready_events):
+            if not ready_event.wait(self.__START_TIMEOUT):
+                raise RuntimeError('Failed to start the emulator on {}.'.format(ip_addr))
+
+
+    def stop(self) -> None:
+        """全エミュレータを停止する"""
+        for emulator in self.__emulators:
+            emulator.stop()
+            print_virtual_elapsed_time(emulator)
+        self.__emulators = []
+
+        self.__stop_event.set()
+        for proc in self.__processes:
+            proc.join()
+        self.__processes = []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-boxes', type=int, default=2)
+    parser.add_argument('--first-ipaddr', default='127.0.0.2')
+    parser.add_argument('--multiprocess', action='store_true')
+    add_emulator_args(parser)
+    args = parser.parse_args()
+
+    launcher = EmulatorLauncher(
+        loopback_addrs(args.num_boxes, args.first_ipaddr),
+        use_processes = args.multiprocess,
+        virtual_time = args.virtual_time,
+        access_latency = args.access_latency,
+        fault_params = fault_params_from_args(args),
+        dsp_processes = args.dsp_processes)
+
+    with launcher:
+        print('The emulators have been started on {}.'.format(', '.join(launcher.ip_addrs)))
+        input("Press 'Enter' to stop\n")
@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 import sys
 import socket
+import threading
 from typing import Final, Any
 from concurrent.futures import ThreadPoolExecutor
 from awg import Awg
@@ -7,6 +10,8 @@ from hbm import Hbm
 from awgcontroller import AwgController
 from capturecontroller import CaptureController
 import capture as cap
+from virtualclock import VirtualClock
+from faultinjector import FaultInjector
 from e7awgsw.uplpacket import UplPacket
 from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
 from e7awgsw.hwparam import WAVE_RAM_PORT, AWG_REG_PORT
@@ -15,21 +20,43 @@ from e7awgsw.hwparam import WAVE_RAM_PORT, AWG_REG_PORT
 class UplDispatcher:
 
     __BUF_SIZE: Final = 16384
+    __RECV_TIMEOUT: Final = 0.1 # 停止要求を確認する間隔 (単位 : 秒)
 
     def __init__(
         self,
         ip_addr: str,
         hbm: Hbm,
         awg_ctrl: AwgController,
-        cap_ctrl: CaptureController
+        cap_ctrl: CaptureController,
+        clock: VirtualClock | None = None,
+        access_latency: int = 0,
+        fault_injector: FaultInjector | None = None
     ) -> None:
+        """
+        Args:
+            ip_addr (str): エミュレータが UDP パケットを受信する IP アドレス
+            hbm (Hbm): HBM
+            awg_ctrl (AwgController): AWG コントローラ
+            cap_ctrl (CaptureController): キャプチャコントローラ
+            clock (VirtualClock):
+                | 仮想時刻のクロック.  None でない場合, パケットを 1 つ受信するたびに仮想時刻を access_latency だけ進める.
+            access_latency (int): パケット 1 つあたりのアクセスレイテンシ (単位 : ワード)
+            fault_injector (FaultInjector):
+                | 送受信するパケットに通信障害を発生させるオブジェクト.  None の場合, 障害を発生させない.
+        """
         self.__hbm = hbm
         self.__awg_ctrl = awg_ctrl
         self.__cap_ctrl = cap_ctrl
+        self.__clock = clock
+        self.__access_latency = access_latency
+        self.__fault_injector = fault_injector
         self.__hbm_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__hbm_sock.bind((ip_addr, WAVE_RAM_PORT))
         self.__awg_cap_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__awg_cap_sock.bind((ip_addr, AWG_REG_PORT))
+        self.__hbm_sock.settimeout(self.__RECV_TIMEOUT)
+        self.__awg_cap_sock.settimeout(self.__RECV_TIMEOUT)
+        self.__stop_event = threading.Event()
         self.__executor = ThreadPoolExecutor(max_workers = 2)
         self.__loggers = [get_file_logger(), get_stderr_logger()]
 
@@ -39,13 +66,35 @@ class UplDispatcher:
         self.__executor.submit(self.__process_awg_cap_packet)
 
 
+    def stop(self) -> None:
+        """パケットの処理を止めてソケットを閉じる"""
+        self.__stop_event.set()
+        self.__executor.shutdown(wait = True)
+        self.__hbm_sock.close()
+        self.__awg_cap_sock.close()
+
+
+    def __recvfrom(self, sock: socket.socket) -> tuple[bytes, tuple[str, int]] | None:
+        """パケットを受信する.  停止要求の確認のためにタイムアウトした場合は None を返す."""
+        try:
+            return sock.recvfrom(self.__BUF_SIZE)
+        except socket.timeout:
+            return None
+
+
     def __process_hbm_packet(self) -> None:
         """HBM へのアクセスを行うためのパケットを処理する"""
         # ThreadPoolExecutor 上で実行されるタスクの例外は, そのタスクの Future が保持するため, 標準エラー出力に表示されない.
         # 意図しない例外が発生したとき, シミュレータの停止をユーザに伝えるために try-except を使ってエラーメッセージを表示する.
         try:
-            while True:
-                recv_data, src_addr = self.__hbm_sock.recvfrom(self.__BUF_SIZE)
+            while not self.__stop_event.is_set():
+                received = self.__recvfrom(self.__hbm_sock)
+                if received is None:
+                    continue
+                recv_data, src_addr = received
+                if self.__drop_on_recv():
+                    continue
+                self.__advance_clock()
                 recv_packet = UplPacket.deserialize(recv_data)
                 if recv_packet.mode() == UplPacket.MODE_WAVE_RAM_READ:
                     self.__read_from_hbm(recv_packet, src_addr)
@@ -61,22 +110,46 @@ class UplDispatcher:
             raise
 
 
+    def __advance_clock(self) -> None:
+        """仮想時刻モードのとき, パケット 1 つ分のアクセスレイテンシだけ仮想時刻を進める"""
+        if self.__clock is not None:
+            self.__clock.advance(self.__access_latency)
+
+
+    def __drop_on_recv(self) -> bool:
+        """受信したパケットを障害として破棄する場合 True を返す"""
+        return (self.__fault_injector is not None) and self.__fault_injector.drop_on_recv()
+
+
+    def __sendto(self, sock: socket.socket, data: bytes, addr: tuple[str, int]) -> None:
+        if self.__fault_injector is None:
+            sock.sendto(data, addr)
+        else:
+            self.__fault_injector.sendto(sock, data, addr)
+
+
     def __read_from_hbm(self, packet: UplPacket, reply_addr: tuple[str, int]) -> None:
         rd_data = self.__hbm.read(packet.addr(), packet.num_bytes())
         reply = UplPacket(UplPacket.MODE_WAVE_RAM_READ_REPLY, packet.addr(), len(rd_data), rd_data)
-        self.__hbm_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__hbm_sock, reply.serialize(), reply_addr)
 
 
     def __write_to_hbm(self, packet: UplPacket, reply_addr: tuple[str, int]) -> None:
         self.__hbm.write(packet.addr(), packet.payload())
         reply = UplPacket(UplPacket.MODE_WAVE_RAM_WRITE_ACK, packet.addr(), len(packet.payload()))
-        self.__hbm_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__hbm_sock, reply.serialize(), reply_addr)
 
 
     def __process_awg_cap_packet(self) -> None:
         try:
-            while True:
-                recv_data, src_addr = self.__awg_cap_sock.recvfrom(self.__BUF_SIZE)
+            while not self.__stop_event.is_set():
+                received = self.__recvfrom(self.__awg_cap_sock)
+                if received is None:
+                    continue
+                recv_data, src_addr = received
+                if self.__drop_on_recv():
+                    continue
+                self.__advance_clock()
                 recv_packet = UplPacket.deserialize(recv_data)
                 if recv_packet.mode() == UplPacket.MODE_AWG_REG_READ:
                     self.__read_awg_reg(recv_packet, src_addr)
@@ -104,7 +177,7 @@ class UplDispatcher:
             rd_data += val.to_bytes(Awg.PARAM_REG_SIZE, 'little')
 
         reply = UplPacket(UplPacket.MODE_AWG_REG_READ_REPLY, packet.addr(), len(rd_data), rd_data)
-        self.__awg_cap_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__awg_cap_sock, reply.serialize(), reply_addr)
 
 
     def __write_awg_reg(self, packet: UplPacket, reply_addr: tuple[str, int]) -> None:
@@ -116,7 +189,7 @@ class UplDispatcher:
             self.__awg_ctrl.write_reg(addr, val)
 
         reply = UplPacket(UplPacket.MODE_AWG_REG_WRITE_ACK, packet.addr(), len(packet.payload()))
-        self.__awg_cap_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__awg_cap_sock, reply.serialize(), reply_addr)
 
 
     def __read_cap_reg(self, packet: UplPacket, reply_addr: tuple[str, int]) -> None:
@@ -128,7 +201,7 @@ class UplDispatcher:
             rd_data += val.to_bytes(cap.CaptureUnit.PARAM_REG_SIZE, 'little')
 
         reply = UplPacket(UplPacket.MODE_CAPTURE_REG_READ_REPLY, packet.addr(), len(rd_data), rd_data)
-        self.__awg_cap_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__awg_cap_sock, reply.serialize(), reply_addr)
 
 
     def __write_cap_reg(self, packet: UplPacket, reply_addr: tuple[str, int]) -> None:
@@ -140,4 +213,4 @@ class UplDispatcher:
             self.__cap_ctrl.write_reg(addr, val)
 
         reply = UplPacket(UplPacket.MODE_CAPTURE_REG_WRITE_ACK, packet.addr(), len(packet.payload()))
-        self.__awg_cap_sock.sendto(reply.serialize(), reply_addr)
+        self.__sendto(self.__awg_cap_sock, reply.serialize(), reply_addr)
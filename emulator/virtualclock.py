@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import heapq
+import threading
+from typing import Final, Callable
+from e7awgsw.hwparam import NUM_SAMPLES_IN_AWG_WORD
+from e7awgsw.logger import get_file_logger, get_stderr_logger, log_error
+
+# AWG およびキャプチャユニットのサンプリングレート (単位 : サンプル数/秒)
+SAMPLING_RATE: Final = 500000000
+# 1 ワードの時間 (単位 : 秒)
+WORD_PERIOD: Final = NUM_SAMPLES_IN_AWG_WORD / SAMPLING_RATE
+
+
+class VirtualClock(object):
+    """エミュレータ内の時刻を管理する離散事象クロック
+
+    | 時刻の単位は AWG ワード (8 ns) である.
+    | 時刻は advance を呼んだときだけ進み, その間に期限を迎えたイベントが時刻順に実行される.
+    """
+
+    def __init__(self) -> None:
+        self.__now = 0
+        self.__seq_no = 0 # 同時刻のイベントを登録順に実行するための番号
+        self.__events: list[tuple[int, int, Callable[[], None]]] = []
+        self.__rlock = threading.RLock()
+        self.__loggers = [get_file_logger(), get_stderr_logger()]
+
+
+    @property
+    def now(self) -> int:
+        """現在の仮想時刻 (単位 : ワード)"""
+        return self.__now
+
+
+    def schedule_at(self, time: int, action: Callable[[], None]) -> None:
+        """仮想時刻 time に実行するイベントを登録する
+
+        | time が現在時刻以前の場合, action はこのメソッドの中で即座に実行される.
+
+        Args:
+            time (int): イベントを実行する仮想時刻 (単位 : ワード)
+            action (Callable): イベントハンドラ
+        """
+        with self.__rlock:
+            if time > self.__now:
+                heapq.heappush(self.__events, (time, self.__seq_no, action))
+                self.__seq_no += 1
+                return
+        action()
+
+
+    def schedule_after(self, delay: int, action: Callable[[], None]) -> None:
+        """現在の仮想時刻から delay ワード後に実行するイベントを登録する"""
+        with self.__rlock:
+            self.schedule_at(self.__now + delay, action)
+
+
+    def advance(self, num_words: int) -> None:
+        """仮想時刻を num_words ワード進め, その間に期限を迎えたイベントを実行する"""
+        if num_words < 0:
+            msg = 'The virtual clock cannot go backwards.  ({} words)'.format(num_words)
+            log_error(msg, *self.__loggers)
+            raise ValueError(msg)
+
+        with self.__rlock:
+            end = self.__now + num_words
+            while self.__events and self.__events[0][0] <= end:
+                time, _, action = heapq.heappop(self.__events)
+                self.__now = time
+                action()
+            self.__now = end
+
+
+    def advance_to_next_event(self) -> bool:
+        """次のイベントの時刻まで仮想時刻を進める
+
+        Returns:
+            bool: イベントを実行した場合 True. 未実行のイベントが無かった場合 False.
+        """
+        with self.__rlock:
+            if not self.__events:
+                return False
+            self.advance(self.__events[0][0] - self.__now)
+            return True
+
+
+    def num_pending_events(self) -> int:
+        """未実行のイベントの数"""
+        with self.__rlock:
+            return len(self.__events)
+
+
+def words_to_sec(num_words: int) -> float:
+    """ワード数を秒に変換する"""
+    return num_words * WORD_PERIOD
@@ -0,0 +1,19 @@
+import os
+import sys
+import contextlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMULATOR_DIR = os.path.join(REPO_ROOT, 'emulator')
+for path in (REPO_ROOT, EMULATOR_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@contextlib.contextmanager
+def run_emulator(ip_addr, **fault_params):
+    """ip_addr で同梱のエミュレータを起動する.  fault_params を指定した場合, その通信障害を発生させる."""
+    from emulator import Emulator
+    from faultinjector import FaultInjector
+    fault_injector = FaultInjector(**fault_params) if fault_params else None
+    with Emulator(ip_addr, fault_injector = fault_injector) as emulator:
+        yield emulator
@@ -0,0 +1,163 @@
+"""
+シーケンサの実行中にキャプチャデータを読み出す SequencerCaptureReader のテスト
+"""
+import time
+import threading
+import numpy as np
+import pytest
+from e7awgsw import AWG, CaptureUnit, CaptureParam, CaptureAddrRing
+from e7awgsw import AwgStartCmd, CaptureAddrSetCmd, CaptureEndFenceCmd
+from e7awgsw.logger import get_null_logger
+from e7awgsw.sequencerctrl import SequencerCtrlBase
+
+CAPTURE_UNITS = [CaptureUnit.U0, CaptureUnit.U1]
+
+
+class FakeSequencerCtrl(SequencerCtrlBase):
+    """コマンドキューのコマンドを一定間隔で 1 つずつ実行するシーケンサ
+
+    | AwgStartCmd を実行するたびに, 各キャプチャユニットの現在のオフセットに, それまでに実行した AwgStartCmd の数を書き込む.
+    """
+
+    CMD_FIFO_SIZE = 4096 # bytes
+
+    def __init__(self, memory, cmd_interval):
+        super().__init__('127.0.0.1', True, False, get_null_logger())
+        # {(キャプチャユニット ID, オフセット) : 書き込んだ値}
+        self.memory = memory
+        self.__cmd_interval = cmd_interval
+        self.__queue = []
+        self.__cmd_counter = 0
+        self.__num_shots = 0
+        self.__offsets = {}
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target = self.__run, daemon = True)
+        self.__thread.start()
+
+
+    def __run(self):
+        while not self.__stop_event.wait(self.__cmd_interval):
+            with self.__lock:
+                if not self.__queue:
+                    continue
+                cmd = self.__queue.pop(0)
+                if isinstance(cmd, CaptureAddrSetCmd):
+                    for capture_unit_id in cmd.capture_unit_id_list:
+                        self.__offsets[capture_unit_id] = cmd.byte_offset
+                elif isinstance(cmd, AwgStartCmd):
+                    for capture_unit_id, offset in self.__offsets.items():
+                        self.memory[(capture_unit_id, offset)] = self.__num_shots
+                    self.__num_shots += 1
+                self.__cmd_counter += 1
+
+
+    def close(self):
+        self.__stop_event.set()
+        self.__thread.join()
+
+
+    def _push_commands(self, cmd_list):
+        with self.__lock:
+            self.__queue.extend(cmd_list)
+
+
+    def _cmd_fifo_free_space(self):
+        with self.__lock:
+            return self.CMD_FIFO_SIZE - sum(cmd.size() for cmd in self.__queue)
+
+
+    def _cmd_counter(self):
+        with self.__lock:
+            return self.__cmd_counter
+
+
+    def _num_stored_commands(self):
+        with self.__lock:
+            return len(self.__queue)
+
+
+    # このテストで使わないメソッド
+    def _initialize(self): pass
+    def _start_sequencer(self): pass
+    def _terminate_sequencer(self): pass
+    def _clear_commands(self): pass
+    def _clear_unsent_cmd_err_reports(self): pass
+    def _clear_sequencer_stop_flag(self): pass
+    def _enable_cmd_err_report(self): pass
+    def _disable_cmd_err_report(self): pass
+    def _wait_for_sequencer_to_stop(self, timeout, strategy): pass
+    def _num_unprocessed_commands(self): return 0
+    def _num_successful_commands(self): return 0
+    def _num_err_commands(self): return 0
+    def _num_unsent_cmd_err_reports(self): return 0
+    def _check_err(self): return []
+    def _pop_cmd_err_reports(self): return []
+    def _reset_cmd_counter(self): pass
+    def _get_branch_flag(self): return False
+    def _set_branch_flag(self, val): pass
+    def _get_external_branch_flag(self): return False
+    def _version(self): return ''
+
+
+class FakeCaptureCtrl(object):
+    """FakeSequencerCtrl が書き込んだ値を, 時間をかけて読み出すキャプチャコントローラ"""
+
+    def __init__(self, memory, read_delay):
+        self.__memory = memory
+        self.__read_delay = read_delay
+
+
+    def _get_capture_data_as_ndarray(self, capture_unit_id, num_samples, addr_offset):
+        val = self.__memory.get((capture_unit_id, addr_offset), -1)
+        time.sleep(self.__read_delay)
+        return np.full(num_samples, val)
+
+
+@pytest.fixture
+def memory():
+    return {}
+
+
+@pytest.fixture
+def seq_ctrl(memory):
+    seq_ctrl = FakeSequencerCtrl(memory, cmd_interval = 0.0005)
+    yield seq_ctrl
+    seq_ctrl.close()
+
+
+def test_read_captures_while_feeding_commands_through_ring(seq_ctrl, memory):
+    """読み出しがシーケンサより遅くても, 2 スロットのリングで全ショットを上書きされずに順に読み出せる"""
+    param = CaptureParam()
+    param.num_integ_sections = 1
+    param.add_sum_section(10, 1)
+    ring = CaptureAddrRing({ capture_unit_id : param for capture_unit_id in CAPTURE_UNITS }, num_slots = 2)
+    num_shots = 30
+
+    def gen_cmds():
+        for _ in range(num_shots):
+            shot = ring.acquire(timeout = 5)
+            yield from ring.addr_set_cmds(shot)
+            yield AwgStartCmd(0, [AWG.U0], AwgStartCmd.IMMEDIATE, wait = True)
+            yield CaptureEndFenceCmd(0, CAPTURE_UNITS, 0)
+
+    cap_ctrl = FakeCaptureCtrl(memory, read_delay = 0.005)
+    reader = seq_ctrl.read_captures_while_running(cap_ctrl, gen_cmds(), ring = ring)
+    feeder = seq_ctrl.feed_commands(reader.commands)
+    try:
+        results = list(reader.results(timeout = 5))
+        feeder.wait(timeout = 5)
+    finally:
+        feeder.stop()
+        reader.stop()
+
+    assert [result.shot for result in results] == list(range(num_shots))
+    for result in results:
+        for capture_unit_id in CAPTURE_UNITS:
+            data = result.data[capture_unit_id]
+            assert len(data) == ring.num_samples[capture_unit_id]
+            assert np.all(data == result.shot)
+    assert ring.num_free_slots == ring.num_slots
+    progress = feeder.progress()
+    assert progress.done
+    assert progress.num_sent_cmds == num_shots * (len(ring.addr_set_cmds(0)) + 2)
@@ -0,0 +1,115 @@
+"""
+SequencerProgram のイメージがコマンドのオブジェクトを serialize したバイト列と一致することのテスト
+"""
+import numpy as np
+import pytest
+from e7awgsw import AWG, CaptureUnit, SequencerProgram
+from e7awgsw import AwgStartCmd, CaptureEndFenceCmd, WaveGenEndFenceCmd, CaptureAddrSetCmd
+from e7awgsw.sequencercmd import SequencerCmd
+
+NUM_CMDS = 200
+
+
+def units_of(bits, unit_type):
+    return [unit_id for unit_id in unit_type.all() if (bits >> unit_id) & 1]
+
+
+def serialize_all(cmds):
+    return b''.join(cmd.serialize() for cmd in cmds)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(43)
+
+
+def random_bits(rng, unit_type):
+    valid_bits = sum(1 << unit_id for unit_id in unit_type.all())
+    return rng.integers(1, valid_bits, NUM_CMDS, endpoint = True)
+
+
+def test_compiled_cmds_match_cmd_objects(rng):
+    """コマンドのオブジェクトからコンパイルしたイメージは, 各コマンドの serialize の結果を連結したものと一致する"""
+    cmds = []
+    for i in range(NUM_CMDS):
+        cmd_no = int(rng.integers(0, SequencerCmd.MAX_CMD_NO, endpoint = True))
+        kind = i % 4
+        if kind == 0:
+            cmds.append(AwgStartCmd(
+                cmd_no, [AWG.U0, AWG.U5], int(rng.integers(-1, 1 << 40)), wait = bool(i & 4)))
+        elif kind == 1:
+            cmds.append(CaptureAddrSetCmd(cmd_no, [CaptureUnit.U1], int(rng.integers(0, 1 << 16)) * 512))
+        elif kind == 2:
+            cmds.append(CaptureEndFenceCmd(
+                cmd_no, CaptureUnit.U3, int(rng.integers(0, 1 << 40)), terminate = bool(i & 4)))
+        else:
+            cmds.append(WaveGenEndFenceCmd(
+                cmd_no, AWG.U15, int(rng.integers(0, 1 << 40)), wait = False, stop_seq = bool(i & 4)))
+
+    program = SequencerProgram(cmds, first_cmd_no = None)
+    assert program.serialize() == serialize_all(cmds)
+    assert bytes(program.image) == serialize_all(cmds)
+    assert program.size() == sum(cmd.size() for cmd in cmds)
+
+
+def test_awg_start_cmds_match_cmd_objects(rng):
+    awg_bits = random_bits(rng, AWG)
+    start_times = rng.integers(-5, 1 << 40, NUM_CMDS)
+    wait = rng.integers(0, 1, NUM_CMDS, endpoint = True).astype(bool)
+    stop_seq = rng.integers(0, 1, NUM_CMDS, endpoint = True).astype(bool)
+    program = SequencerProgram.awg_start_cmds(
+        awg_bits, start_times, wait = wait, stop_seq = stop_seq, first_cmd_no = 7)
+
+    cmds = [
+        AwgStartCmd(7 + i, units_of(int(awg_bits[i]), AWG), int(start_times[i]),
+                    bool(wait[i]), bool(stop_seq[i]))
+        for i in range(NUM_CMDS)]
+    assert program.serialize() == serialize_all(cmds)
+
+
+def test_capture_end_fence_cmds_match_cmd_objects(rng):
+    unit_bits = random_bits(rng, CaptureUnit).astype(np.uint64)
+    end_times = rng.integers(0, 1 << 40, NUM_CMDS).astype(np.uint64)
+    terminate = rng.integers(0, 1, NUM_CMDS, endpoint = True).astype(bool)
+    program = SequencerProgram.capture_end_fence_cmds(unit_bits, end_times, terminate = terminate)
+
+    cmds = [
+        CaptureEndFenceCmd(i, units_of(int(unit_bits[i]), CaptureUnit), int(end_times[i]),
+                           terminate = bool(terminate[i]))
+        for i in range(NUM_CMDS)]
+    assert program.serialize() == serialize_all(cmds)
+
+
+def test_wave_gen_end_fence_cmds_match_cmd_objects(rng):
+    end_times = rng.integers(0, 1 << 40, NUM_CMDS)
+    program = SequencerProgram.wave_gen_end_fence_cmds(
+        [AWG.U1, AWG.U2], end_times, wait = False, stop_seq = True)
+
+    cmds = [
+        WaveGenEndFenceCmd(i, [AWG.U1, AWG.U2], int(end_times[i]), wait = False, stop_seq = True)
+        for i in range(NUM_CMDS)]
+    assert program.serialize() == serialize_all(cmds)
+
+
+def test_edited_program_matches_cmd_objects(rng):
+    """時刻の書き換えと, 連結, 交互の並べ替えの結果も, 同じコマンドをオブジェクトで作ったものと一致する"""
+    start_times = rng.integers(0, 1 << 40, NUM_CMDS)
+    end_times = start_times + 1000
+    starts = SequencerProgram.awg_start_cmds(AWG.U0, np.zeros(NUM_CMDS, dtype = np.int64))
+    starts.set_times(AwgStartCmd, start_times)
+    fences = SequencerProgram.capture_end_fence_cmds(CaptureUnit.U0, end_times)
+    timeline = SequencerProgram.interleave(starts, fences, first_cmd_no = 3)
+    program = SequencerProgram.concat([timeline, SequencerProgram([], first_cmd_no = None)], first_cmd_no = 3)
+
+    cmds = []
+    for i in range(NUM_CMDS):
+        cmds.append(AwgStartCmd(3 + 2 * i, AWG.U0, int(start_times[i])))
+        cmds.append(CaptureEndFenceCmd(4 + 2 * i, CaptureUnit.U0, int(end_times[i])))
+    assert timeline.serialize() == serialize_all(cmds)
+    assert program.serialize() == serialize_all(cmds)
+    assert np.array_equal(program.get_times(AwgStartCmd), start_times)
+
+
+def test_empty_program():
+    assert SequencerProgram([]).serialize() == b''
+    assert SequencerProgram.awg_start_cmds([], []).serialize() == b''
@@ -0,0 +1,138 @@
+"""
+UdpRw の再送と応答の照合のテスト
+"""
+import socket
+import threading
+import pytest
+from conftest import run_emulator
+from e7awgsw.hwparam import WAVE_RAM_PORT
+from e7awgsw.instrumentation import InstrumentCollector
+from e7awgsw.uplpacket import UplPacket
+from e7awgsw.udpaccess import UdpRw
+
+# 読み書きに使う HBM のアドレス
+RW_ADDR = 0x1000_0000
+RW_SIZES = [32, 1440, 4000, 16 * 1024]
+
+
+def new_wave_ram_rw(ip_addr, instrument = None):
+    return UdpRw(
+        ip_addr, WAVE_RAM_PORT, 32, UplPacket.MODE_WAVE_RAM_WRITE, UplPacket.MODE_WAVE_RAM_READ,
+        instrument = instrument)
+
+
+@pytest.mark.parametrize('ip_addr, fault_params', [
+    ('127.0.0.11', { 'drop_rate' : 0.2, 'seed' : 1 }),
+    ('127.0.0.12', { 'dup_rate' : 0.3, 'seed' : 2 }),
+    ('127.0.0.13', { 'reorder_rate' : 0.3, 'seed' : 3 }),
+    ('127.0.0.14', { 'drop_rate' : 0.1, 'dup_rate' : 0.1, 'reorder_rate' : 0.1, 'seed' : 4 }),
+])
+def test_read_write_with_faults(ip_addr, fault_params):
+    """パケットの破棄, 複製, 順序入れ替えが起きても, 書いたデータをそのまま読み出せる"""
+    collector = InstrumentCollector()
+    with run_emulator(ip_addr, **fault_params):
+        udp_rw = new_wave_ram_rw(ip_addr, collector)
+        try:
+            for i, size in enumerate(RW_SIZES):
+                # 前回の書き込みの応答と取り違えると検出できるように, 毎回異なるデータを書く
+                data = bytes((j + i * 7) & 0xFF for j in range(size))
+                udp_rw.write(RW_ADDR, data)
+                assert udp_rw.read(RW_ADDR, size) == data
+                # 同じアドレスとサイズの読み出しを続けて行っても, 以前の読み出しの応答を返さない
+                data = bytes((j + i * 7 + 1) & 0xFF for j in range(size))
+                udp_rw.write(RW_ADDR, data)
+                assert udp_rw.read(RW_ADDR, size) == data
+        finally:
+            udp_rw.close()
+
+    records = collector.access_records
+    assert records
+    num_retries = sum(record.retries for record in records)
+    if fault_params.get('drop_rate', 0) > 0:
+        assert num_retries > 0
+    assert all(record.retries <= UdpRw.MAX_RETRIES for record in records)
+
+
+def test_read_write_without_faults_needs_no_retries():
+    """通信障害が無ければ再送しない"""
+    ip_addr = '127.0.0.15'
+    collector = InstrumentCollector()
+    with run_emulator(ip_addr):
+        udp_rw = new_wave_ram_rw(ip_addr, collector)
+        try:
+            data = bytes(j & 0xFF for j in range(4000))
+            udp_rw.write(RW_ADDR, data)
+            assert udp_rw.read(RW_ADDR, len(data)) == data
+        finally:
+            udp_rw.close()
+
+    assert all(record.retries == 0 for record in collector.access_records)
+
+
+class FakeDevice(threading.Thread):
+    """読み出し要求にはアドレスがずれた応答を, 書き込み要求にはサイズがずれた ACK を返す装置"""
+
+    def __init__(self):
+        super().__init__(daemon = True)
+        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sock.bind(('127.0.0.1', 0))
+        self.__sock.settimeout(0.1)
+        self.__stop_event = threading.Event()
+        self.num_requests = 0
+
+
+    @property
+    def port(self):
+        return self.__sock.getsockname()[1]
+
+
+    def run(self):
+        while not self.__stop_event.is_set():
+            try:
+                data, addr = self.__sock.recvfrom(16384)
+            except socket.timeout:
+                continue
+            self.num_requests += 1
+            packet = UplPacket.deserialize(data)
+            if packet.mode() == UplPacket.MODE_AWG_REG_WRITE:
+                reply = UplPacket(
+                    UplPacket.MODE_AWG_REG_WRITE_ACK, packet.addr(), packet.num_bytes() + 4)
+            else:
+                reply = UplPacket(
+                    UplPacket.MODE_AWG_REG_READ_REPLY, packet.addr() + 0x100,
+                    packet.num_bytes(), bytes(packet.num_bytes()))
+            self.__sock.sendto(reply.serialize(), addr)
+
+
+    def stop(self):
+        self.__stop_event.set()
+        self.join()
+        self.__sock.close()
+
+
+@pytest.fixture
+def fake_device():
+    device = FakeDevice()
+    device.start()
+    yield device
+    device.stop()
+
+
+@pytest.mark.parametrize('access', ['read', 'write'])
+def test_mismatched_reply_raises(fake_device, access):
+    """以前の要求に対するものではない, 一致しない応答を受け取った場合は, 再送せずにすぐ例外を発生させる"""
+    collector = InstrumentCollector()
+    udp_rw = UdpRw(
+        '127.0.0.1', fake_device.port, 4, UplPacket.MODE_AWG_REG_WRITE, UplPacket.MODE_AWG_REG_READ,
+        instrument = collector)
+    try:
+        with pytest.raises(ValueError):
+            if access == 'read':
+                udp_rw.read(0x40, 4)
+            else:
+                udp_rw.write(0x40, bytes(4))
+    finally:
+        udp_rw.close()
+
+    assert fake_device.num_requests == 1
+    assert all(record.retries == 0 for record in collector.access_records)